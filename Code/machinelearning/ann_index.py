@@ -0,0 +1,220 @@
+import logging
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+import numpy as np
+
+from menu_index import MenuIndex
+
+if TYPE_CHECKING:
+    from sklearn.decomposition import TruncatedSVD
+
+logger = logging.getLogger(__name__)
+
+ANN_MIN_ITEMS = 50_000  # smaller menus are scanned exactly
+EMBEDDING_DIM = 256
+LISTS_PER_SQRT_ITEM = 4  # inverted lists = 4 * sqrt(items)
+N_PROBE = 64  # inverted lists scanned per query
+RETRIEVE_CANDIDATES = 1000  # items kept from the embedding search for exact re-scoring
+PRIOR_CANDIDATES = 100  # items with the best text-independent score, always re-scored
+RECALL_SAMPLE = 200  # queries used to estimate recall after a build
+
+
+class AnnIndex:
+    """Inverted-file index over dense embeddings of a MenuIndex.
+
+    TF-IDF rows are reduced with TruncatedSVD and L2-normalized, then
+    clustered with k-means into inverted lists stored contiguously. A
+    query scans the N_PROBE lists whose centroids are closest. Results are
+    item keys, so an index built for one menu version keeps serving later
+    versions until it is rebuilt.
+    """
+
+    def __init__(self, version: str, item_keys: List[str], tfidf, svd: 'TruncatedSVD',
+                 centroids: np.ndarray, offsets: np.ndarray, embeddings: np.ndarray, list_keys: List[str],
+                 list_rows: np.ndarray):
+        self.version = version
+        self.item_keys = item_keys
+        self.tfidf = tfidf
+        self.svd = svd
+        # Contiguous copy of the SVD components so projecting a query does not copy them
+        self.projection = np.ascontiguousarray(svd.components_.T, dtype=np.float32)
+        self.centroids = centroids
+        # Items of list l are embeddings[offsets[l]:offsets[l + 1]]
+        self.offsets = offsets
+        self.embeddings = embeddings
+        self.list_keys = list_keys
+        # Rows in the MenuIndex the ANN index was built from, in list order
+        self.list_rows = list_rows
+        self.covered = set(item_keys)
+
+    @classmethod
+    def build(cls, index: MenuIndex, dim: int = EMBEDDING_DIM, seed: int = 42) -> 'AnnIndex':
+        from sklearn.cluster import MiniBatchKMeans
+        from sklearn.decomposition import TruncatedSVD
+
+        n_items, n_terms = index.matrix.shape
+        svd = TruncatedSVD(n_components=max(1, min(dim, n_terms - 1, n_items - 1)), random_state=seed)
+        embeddings = _normalize(svd.fit_transform(index.matrix).astype(np.float32))
+
+        n_lists = max(1, min(n_items, int(LISTS_PER_SQRT_ITEM * np.sqrt(n_items))))
+        kmeans = MiniBatchKMeans(n_clusters=n_lists, batch_size=4096, n_init=1, random_state=seed)
+        assignment = kmeans.fit_predict(embeddings)
+
+        order = np.argsort(assignment, kind='stable')
+        offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=n_lists), out=offsets[1:])
+        return cls(
+            index.version,
+            list(index.item_keys),
+            index.tfidf,
+            svd,
+            _normalize(kmeans.cluster_centers_.astype(np.float32)),
+            offsets,
+            np.ascontiguousarray(embeddings[order]),
+            [index.item_keys[row] for row in order],
+            order
+        )
+
+    def embed(self, user_vector) -> np.ndarray:
+        """Normalized embedding of a TF-IDF row produced by self.tfidf"""
+        return _normalize(np.asarray(user_vector @ self.projection, dtype=np.float32))[0]
+
+    def search_positions(
+        self,
+        user_feature: str,
+        k: int = RETRIEVE_CANDIDATES,
+        n_probe: int = N_PROBE,
+        user_vector=None
+    ) -> np.ndarray:
+        """Positions in list order of the approximately k most similar items
+
+        user_vector can pass the TF-IDF row of user_feature when it was
+        already transformed with self.tfidf.
+        """
+        if user_vector is None:
+            user_vector = self.tfidf.transform([user_feature])
+        query = self.embed(user_vector.astype(np.float32))
+        n_probe = min(n_probe, len(self.centroids))
+        lists = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+
+        # Lists are contiguous, so each one is scored on a view without gathering
+        positions = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in lists])
+        scores = np.concatenate([self.embeddings[self.offsets[l]:self.offsets[l + 1]] @ query for l in lists])
+        if len(positions) > k:
+            positions = positions[np.argpartition(-scores, k - 1)[:k]]
+        return positions
+
+    def search(self, user_feature: str, k: int = RETRIEVE_CANDIDATES, n_probe: int = N_PROBE, user_vector=None) -> List[str]:
+        """Keys of the approximately k most similar items"""
+        return [self.list_keys[position] for position in self.search_positions(user_feature, k, n_probe, user_vector)]
+
+    def recall(self, index: MenuIndex, queries: List[str], k: int = 10, n_probe: int = N_PROBE) -> float:
+        """Share of the exact top-k text matches found among the retrieved candidates"""
+        found = 0
+        total = 0
+        for query in queries:
+            exact = index.similarities(query)
+            relevant = np.flatnonzero(exact > 0)
+            if not len(relevant):
+                continue
+            top = relevant[np.argsort(-exact[relevant], kind='stable')[:k]]
+            retrieved = set(self.search(query, n_probe=n_probe))
+            found += sum(index.item_keys[row] in retrieved for row in top)
+            total += len(top)
+        return found / total if total else 1.0
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class AnnIndexManager:
+    """Builds AnnIndex instances in the background for large menus.
+
+    get() never blocks on a build: it returns the newest finished index,
+    possibly for an older menu version, or None until the first one is
+    ready, in which case callers scan the menu exactly.
+    """
+
+    def __init__(self, min_items: int = ANN_MIN_ITEMS, n_probe: int = N_PROBE):
+        self.min_items = min_items
+        self.n_probe = n_probe
+        self._current: Optional[AnnIndex] = None
+        self._lock = threading.Lock()
+        self._building: Optional[str] = None
+        self._last_recall: Optional[float] = None
+        self._uncovered: Dict = {}
+
+    @property
+    def current(self) -> Optional[AnnIndex]:
+        return self._current
+
+    def stats(self) -> Dict:
+        ann = self._current
+        return {
+            'version': ann.version if ann is not None else None,
+            'items': len(ann.item_keys) if ann is not None else 0,
+            'lists': len(ann.centroids) if ann is not None else 0,
+            'building': self._building,
+            'recall_at_10': self._last_recall
+        }
+
+    def get(self, index: MenuIndex) -> Optional[AnnIndex]:
+        if len(index.item_keys) < self.min_items:
+            return None
+        ann = self._current
+        if ann is None or ann.version != index.version:
+            self._schedule_build(index)
+        return ann
+
+    def candidate_rows(self, ann: AnnIndex, index: MenuIndex, user_feature: str, user_vector=None) -> np.ndarray:
+        """Rows of index to re-score: retrieved items plus items the ANN index does not cover
+
+        user_vector is the TF-IDF row of user_feature under index.tfidf,
+        reused when the ANN index was built on the same vocabulary.
+        """
+        if ann.tfidf is not index.tfidf:
+            user_vector = None
+        positions = ann.search_positions(user_feature, n_probe=self.n_probe, user_vector=user_vector)
+        if ann.version == index.version:
+            return np.sort(ann.list_rows[positions])
+
+        rows = [index.row_of[key] for key in (ann.list_keys[position] for position in positions) if key in index.row_of]
+        return np.union1d(np.array(rows, dtype=np.int64), self._uncovered_rows(ann, index))
+
+    def _uncovered_rows(self, ann: AnnIndex, index: MenuIndex) -> np.ndarray:
+        key = (ann.version, index.version)
+        rows = self._uncovered.get(key)
+        if rows is None:
+            rows = np.array(
+                [row for row, item_key in enumerate(index.item_keys) if item_key not in ann.covered],
+                dtype=np.int64
+            )
+            self._uncovered = {key: rows}
+        return rows
+
+    def _schedule_build(self, index: MenuIndex):
+        with self._lock:
+            if self._building is not None:
+                return
+            self._building = index.version
+
+        def build():
+            try:
+                ann = AnnIndex.build(index)
+                sample = index.item_features[::max(1, len(index.item_features) // RECALL_SAMPLE)][:RECALL_SAMPLE]
+                self._last_recall = ann.recall(index, sample, n_probe=self.n_probe)
+                self._current = ann
+                logger.info(
+                    f"Built ANN index {index.version} over {len(index.item_keys)} items, "
+                    f"{len(ann.centroids)} lists, recall@10 {self._last_recall:.3f}"
+                )
+            except Exception as e:
+                logger.error(f"Error building ANN index: {str(e)}")
+            finally:
+                with self._lock:
+                    self._building = None
+
+        threading.Thread(target=build, name='ann-index-build', daemon=True).start()
@@ -1,25 +1,30 @@
 import os
-from flask import Flask, request, jsonify, abort
+import threading
+from flask import Blueprint, Flask, Response, g, request, jsonify, json, stream_with_context
 from flask_cors import CORS
-from firebase_admin import credentials, firestore, initialize_app
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import StandardScaler
 import numpy as np
-import pandas as pd
-from datetime import datetime, timedelta
-import joblib
-from functools import wraps
+from datetime import datetime
+from functools import reduce, wraps
 import logging
+import time
 import jwt
-from typing import Dict, List, Optional, Tuple
-import redis
-import pickle
-
-# Initialize Flask app with CORS
-app = Flask(__name__)
-CORS(app)
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from itertools import islice
+from feedback_pipeline import QueueFull
+from instrumentation import CONTENT_TYPE
+from scoring import MenuColumns, blend_history, select_top_k
+from services import Services
+from trending import HEAVY_HITTERS
+
+if TYPE_CHECKING:
+    from ann_index import AnnIndex, AnnIndexManager
+    from collaborative import CollaborativeModel
+    from item_stats import LiveItemStats
+    from menu_catalog import MenuSnapshot
+    from menu_index import MenuIndex, MenuIndexManager
+    from menu_shards import ShardedMenuIndex
+    from recommendation_cache import RecommendationCache
+    from scoring import MenuColumnsCache
 
 # Configure logging
 logging.basicConfig(
@@ -28,212 +33,431 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize Firebase
-cred = credentials.Certificate("firebase_credentials.json")
-initialize_app(cred)
-db = firestore.client()
-
-# Initialize Redis for caching
-redis_client = redis.Redis(
-    host=os.getenv('REDIS_HOST', 'localhost'),
-    port=int(os.getenv('REDIS_PORT', 6379)),
-    db=0,
-    decode_responses=True
-)
-
 # Constants
-CACHE_EXPIRATION = 3600  # 1 hour
 MAX_RECOMMENDATIONS = 10
 MIN_SIMILARITY_SCORE = 0.1
+BATCH_CHUNK_SIZE = 256
+MAX_BATCH_USERS = 10000
+PREFERENCES_COLLECTION = 'user_preferences'
+HISTORY_ORDERS = 50  # orders read per user history
+TRENDING_LIMIT = 10  # default items per /trending response
+
+# Firebase, Redis, the menu and the models are set up on first use, or
+# by warm_up() when the app is created with warm=True
+services = Services()
+
+api = Blueprint('api', __name__)
 
 class RecommendationEngine:
-    def __init__(self):
-        self.tfidf = TfidfVectorizer(
-            stop_words='english',
-            max_features=5000,
-            ngram_range=(1, 2)
-        )
-        self.rf_classifier = RandomForestClassifier(
-            n_estimators=100,
-            max_depth=10,
-            random_state=42
-        )
-        self.scaler = StandardScaler()
+    def __init__(
+        self,
+        menu_index: Optional['MenuIndexManager'] = None,
+        menu_columns: Optional['MenuColumnsCache'] = None,
+        live_stats: Optional['LiveItemStats'] = None,
+        collaborative: Optional['CollaborativeModel'] = None,
+        ann_index: Optional['AnnIndexManager'] = None,
+        menu_shards: Optional['ShardedMenuIndex'] = None
+    ):
+        self.menu_index = menu_index
+        self.menu_columns = menu_columns
+        self.ann_index = ann_index
+        self.menu_shards = menu_shards
+        # Streaming item statistics aligned with the menu being scored
+        self.live_stats = live_stats
+        # Item factors trained from order history, None disables the history signal
+        self.collaborative = collaborative
 
     def preprocess_text_features(self, menu_items: List[Dict], user_preferences: Dict) -> Tuple[List[Dict], str]:
         """Process text features for menu items and user preferences"""
         try:
-            for item in menu_items:
-                dietary_tags = []
-                if item.get('is_vegetarian'):
-                    dietary_tags.append('vegetarian')
-                if item.get('is_vegan'):
-                    dietary_tags.append('vegan')
-                if item.get('is_gluten_free'):
-                    dietary_tags.append('gluten_free')
-
-                item['features'] = (
-                    f"{item['name']} {item.get('description', '')} "
-                    f"{item.get('category', '')} {' '.join(dietary_tags)} "
-                    f"{'spicy' if item.get('is_spicy') else 'mild'}"
-                ).lower()
-
-            dietary_prefs = user_preferences.get('dietary_restrictions', [])
-            cuisine_prefs = user_preferences.get('favorite_cuisines', [])
-            spice_pref = user_preferences.get('spice_preference', 'medium')
-
-            user_feature = (
-                f"{' '.join(cuisine_prefs)} {' '.join(dietary_prefs)} "
-                f"{spice_pref}"
-            ).lower()
-
-            return menu_items, user_feature
+            return self.preprocess_menu_items(menu_items), self.build_user_feature(user_preferences)
         except Exception as e:
             logger.error(f"Error in preprocess_text_features: {str(e)}")
             raise
 
-    def calculate_additional_features(self, menu_items: List[Dict], user_preferences: Dict) -> np.ndarray:
-        """Calculate additional numerical features for recommendations"""
-        try:
-            features = []
-            price_preference = user_preferences.get('price_range', 'medium')
-            price_weights = {'low': 0, 'medium': 1, 'high': 2}
-
-            for item in menu_items:
-                price_match = abs(
-                    price_weights[price_preference] -
-                    price_weights.get(item.get('price_category', 'medium'))
-                )
+    def preprocess_menu_items(self, menu_items: List[Dict]) -> List[Dict]:
+        """Add the text feature of every menu item"""
+        from menu_index import item_text_feature
 
-                rating_score = item.get('average_rating', 3.0)
-                order_frequency = item.get('order_frequency', 0)
+        for item in menu_items:
+            # Catalog items are immutable per version, so a feature stays valid once built
+            if 'features' not in item:
+                item['features'] = item_text_feature(item)
 
-                features.append([
-                    price_match,
-                    rating_score,
-                    order_frequency,
-                    item.get('preparation_time', 30),
-                    int(item.get('is_special', False))
-                ])
+        return menu_items
 
-            return self.scaler.fit_transform(np.array(features))
-        except Exception as e:
-            logger.error(f"Error in calculate_additional_features: {str(e)}")
-            raise
+    def build_user_feature(self, user_preferences: Dict) -> str:
+        """Text feature describing the user's preferences"""
+        dietary_prefs = user_preferences.get('dietary_restrictions', [])
+        cuisine_prefs = user_preferences.get('favorite_cuisines', [])
+        spice_pref = user_preferences.get('spice_preference', 'medium')
 
-    def get_recommendations(
+        return (
+            f"{' '.join(cuisine_prefs)} {' '.join(dietary_prefs)} "
+            f"{spice_pref}"
+        ).lower()
+
+    def calculate_additional_features(
         self,
         menu_items: List[Dict],
-        user_feature: str,
         user_preferences: Dict,
-        user_history: Optional[List[str]] = None
-    ) -> List[Dict]:
-        """Generate personalized recommendations using multiple algorithms"""
+        menu_version: Optional[str] = None
+    ) -> np.ndarray:
+        """Numeric features of every menu item for this user (see scoring.NUMERIC_FEATURES).
+
+        The features are standardized once per menu version; only the
+        price match column depends on the user and is looked up by their
+        price range.
+        """
         try:
-            # Text-based similarity
-            item_features = [item['features'] for item in menu_items]
-            item_features.append(user_feature)
-
-            tfidf_matrix = self.tfidf.fit_transform(item_features)
-            text_similarities = cosine_similarity(tfidf_matrix[-1:], tfidf_matrix[:-1])[0]
+            columns = self.scoring_columns(menu_items, menu_version) if menu_version else MenuColumns(menu_items)
+            return columns.numeric_features(user_preferences.get('price_range', 'medium'))
+        except Exception as e:
+            logger.error(f"Error in calculate_additional_features: {str(e)}")
+            raise
 
-            # Additional features
-            additional_features = self.calculate_additional_features(menu_items, user_preferences)
+    def menu_state(self, menu_items: List[Dict], menu_version: Optional[str] = None) -> Tuple['MenuIndex', MenuColumns]:
+        """Fitted text index and scoring columns for a preprocessed menu"""
+        from menu_index import MenuIndex, item_key, menu_fingerprint
 
-            # Combine similarities
-            final_scores = []
-            for idx, (text_sim, item) in enumerate(zip(text_similarities, menu_items)):
-                # Base score from text similarity
-                score = text_sim * 0.6
+        version = menu_version or menu_fingerprint(
+            [item_key(item) for item in menu_items],
+            [item['features'] for item in menu_items]
+        )
+        if self.menu_index is not None:
+            index = self.menu_index.get(menu_items, version)
+        else:
+            index = MenuIndex.fit(
+                [item_key(item) for item in menu_items],
+                [item['features'] for item in menu_items],
+                version
+            )
 
-                # Additional feature contributions
-                add_features = additional_features[idx]
-                score += (add_features[1] / 5.0) * 0.2  # Rating contribution
-                score += min(add_features[2] / 100, 1.0) * 0.1  # Order frequency contribution
+        return index, self.scoring_columns(menu_items, version)
 
-                # Time-based adjustments
-                current_hour = datetime.now().hour
-                if item.get('peak_hours', []) and current_hour in item['peak_hours']:
-                    score *= 1.2
+    def scoring_columns(self, menu_items: List[Dict], version: str) -> MenuColumns:
+        """Scoring columns of the whole menu for one version"""
+        if self.menu_columns is not None:
+            return self.menu_columns.get(menu_items, version, self.live_stats)
+        return MenuColumns(menu_items, version, self.live_stats)
 
-                # Special item boost
-                if item.get('is_special', False):
-                    score *= 1.1
+    def rank(self, menu_items: List[Dict], scores: np.ndarray, rows: Optional[np.ndarray] = None) -> List[Dict]:
+        """Best scoring menu items with their similarity score
 
-                # Seasonal adjustment
-                if item.get('is_seasonal', False):
-                    score *= 1.15
+        With rows, scores belong to those menu rows only.
+        """
+        recommendations = []
+        for idx in select_top_k(scores, MAX_RECOMMENDATIONS, MIN_SIMILARITY_SCORE):
+            item = menu_items[idx if rows is None else rows[idx]].copy()
+            item['similarity_score'] = round(scores[idx], 3)
+            recommendations.append(item)
+        return recommendations
 
-                final_scores.append((idx, score))
+    def get_recommendations(
+        self,
+        menu_items: List[Dict],
+        user_feature: str,
+        user_preferences: Dict,
+        user_history: Optional[List[str]] = None,
+        menu_version: Optional[str] = None
+    ) -> List[Dict]:
+        """Generate personalized recommendations using multiple algorithms"""
+        try:
+            if self.menu_index is not None:
+                index, columns = self.menu_state(menu_items, menu_version)
+                ann = self.ann_index.get(index) if self.ann_index is not None else None
+                if ann is not None:
+                    return self.retrieve_and_rank(
+                        menu_items, index, columns, ann, user_feature, user_history, menu_version
+                    )
+
+                # Text-based similarity
+                text_similarities = index.similarities(user_feature)
+                item_ids = index.item_keys
+            else:
+                item_features = [item['features'] for item in menu_items]
+                item_features.append(user_feature)
+
+                from menu_index import build_vectorizer
+                from sklearn.metrics.pairwise import cosine_similarity
+
+                tfidf_matrix = build_vectorizer().fit_transform(item_features)
+                text_similarities = cosine_similarity(tfidf_matrix[-1:], tfidf_matrix[:-1])[0]
+                columns = MenuColumns(menu_items)
+                item_ids = [item.get('id') for item in menu_items]
+
+            # Order history signal, cold-start users keep the text similarity
+            if self.collaborative is not None and user_history:
+                history_scores = self.collaborative.scores(user_history, item_ids, menu_version)
+                text_similarities = blend_history(text_similarities, history_scores)
+
+            # Rating, frequency and time-based adjustments over the whole menu
+            scores = columns.score(text_similarities, datetime.now().hour)
+
+            return self.rank(menu_items, scores)
+        except Exception as e:
+            logger.error(f"Error in get_recommendations: {str(e)}")
+            raise
 
-            # Sort by final score
-            final_scores.sort(key=lambda x: x[1], reverse=True)
+    def get_scoped_recommendations(
+        self,
+        menu_items: List[Dict],
+        item_ids: List[str],
+        user_feature: str,
+        restaurant_ids: List[str],
+        menu_version: str,
+        user_history: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """Recommendations from the menus of some restaurants only.
 
-            # Filter recommendations
+        Only the shards of those restaurants are scored, in parallel, so
+        the work per request follows the restaurants asked for rather than
+        the size of the catalog.
+        """
+        try:
+            columns = self.scoring_columns(menu_items, menu_version)
+
+            blend = None
+            user = self.collaborative.user_vector(user_history) if self.collaborative is not None and user_history else None
+            if user is not None:
+                # Order history signal, cold-start users keep the text similarity
+                def blend(text_similarities, rows):
+                    return blend_history(
+                        text_similarities,
+                        self.collaborative.menu_scores(user, item_ids, menu_version, rows)
+                    )
+
+            ranked = self.menu_shards.top_k(
+                menu_items, menu_version, columns, user_feature, restaurant_ids,
+                MAX_RECOMMENDATIONS, MIN_SIMILARITY_SCORE, datetime.now().hour, blend
+            )
             recommendations = []
-            for idx, score in final_scores:
-                if score < MIN_SIMILARITY_SCORE:
-                    continue
-
-                item = menu_items[idx].copy()
+            for score, row in ranked:
+                item = menu_items[row].copy()
                 item['similarity_score'] = round(score, 3)
                 recommendations.append(item)
+            return recommendations
+        except Exception as e:
+            logger.error(f"Error in get_scoped_recommendations: {str(e)}")
+            raise
 
-                if len(recommendations) >= MAX_RECOMMENDATIONS:
+    def retrieve_and_rank(
+        self,
+        menu_items: List[Dict],
+        index: 'MenuIndex',
+        columns: MenuColumns,
+        ann: 'AnnIndex',
+        user_feature: str,
+        user_history: Optional[List[str]] = None,
+        menu_version: Optional[str] = None
+    ) -> List[Dict]:
+        """Two-stage ranking for large menus.
+
+        Candidates are the ANN matches of the user feature, the items that
+        rank well without a text match and, for users with an order
+        history, the best collaborative matches. Only candidates are
+        scored, with the same rules as the full scan.
+        """
+        from ann_index import PRIOR_CANDIDATES, RETRIEVE_CANDIDATES
+
+        user_vector = index.tfidf.transform([user_feature])
+        candidates = [
+            self.ann_index.candidate_rows(ann, index, user_feature, user_vector),
+            columns.prior_rows(PRIOR_CANDIDATES)
+        ]
+        history_scores = None
+        if self.collaborative is not None and user_history:
+            history_scores = self.collaborative.scores(user_history, index.item_keys, menu_version)
+            if history_scores is not None:
+                candidates.append(select_top_k(np.nan_to_num(history_scores, nan=-1.0), RETRIEVE_CANDIDATES, 0.0))
+        rows = reduce(np.union1d, candidates)
+
+        text_similarities = (index.matrix[rows] @ user_vector.T).toarray().ravel()
+        if history_scores is not None:
+            text_similarities = blend_history(text_similarities, history_scores[rows])
+
+        scores = columns.score(text_similarities, datetime.now().hour, rows)
+        return self.rank(menu_items, scores, rows)
+
+    def recommend_many(
+        self,
+        menu_items: List[Dict],
+        users: Iterable[Tuple[str, Dict]],
+        chunk_size: int = BATCH_CHUNK_SIZE,
+        menu_version: Optional[str] = None
+    ) -> Iterator[Tuple[str, List[Dict]]]:
+        """Recommendations for many (user_id, preferences) pairs.
+
+        Users are consumed lazily in chunks of chunk_size; each chunk is
+        scored with one TF-IDF transform and one sparse user-by-item
+        product, so memory stays proportional to chunk_size * len(menu_items).
+        """
+        try:
+            index, columns = self.menu_state(menu_items, menu_version)
+            current_hour = datetime.now().hour
+            users = iter(users)
+
+            while True:
+                chunk = list(islice(users, chunk_size))
+                if not chunk:
                     break
 
-            return recommendations
+                user_vectors = index.tfidf.transform(
+                    [self.build_user_feature(preferences) for _, preferences in chunk]
+                )
+                text_similarities = (user_vectors @ index.matrix.T).toarray()
+                scores = columns.score(text_similarities, current_hour)
+
+                for row, (user_id, _) in enumerate(chunk):
+                    yield user_id, self.rank(menu_items, scores[row])
         except Exception as e:
-            logger.error(f"Error in get_recommendations: {str(e)}")
+            logger.error(f"Error in recommend_many: {str(e)}")
             raise
 
+def authenticate(authorization: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """User id of an Authorization header, or the error to answer with 401"""
+    if not authorization:
+        return None, 'Token is missing'
+
+    try:
+        token = authorization.split(' ')[1]
+        data = jwt.decode(token, os.getenv('JWT_SECRET'), algorithms=['HS256'])
+        return data['user_id'], None
+    except jwt.ExpiredSignatureError:
+        return None, 'Token has expired'
+    except jwt.InvalidTokenError:
+        return None, 'Invalid token'
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = request.headers.get('Authorization')
-        if not token:
-            return jsonify({'error': 'Token is missing'}), 401
-
-        try:
-            token = token.split(' ')[1]
-            data = jwt.decode(token, os.getenv('JWT_SECRET'), algorithms=['HS256'])
-            current_user = data['user_id']
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token has expired'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
+        current_user, error = authenticate(request.headers.get('Authorization'))
+        if error:
+            return jsonify({'error': error}), 401
 
         return f(current_user, *args, **kwargs)
     return decorated
 
-def cache_result(key_prefix, expiration=CACHE_EXPIRATION):
+def request_route() -> str:
+    """Route pattern of the current request, so metrics labels stay bounded"""
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+@api.before_app_request
+def start_request_timer():
+    if services.metrics.enabled or services.request_profiler.sample_rate:
+        g.request_started = time.perf_counter()
+        g.profile = services.request_profiler.start()
+
+@api.after_app_request
+def record_request_latency(response):
+    started = g.get('request_started')
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        services.metrics.observe_request(request_route(), request.method, response.status_code, elapsed)
+        if g.profile is not None:
+            services.request_profiler.finish(g.profile, f"{request.method} {request.path}", elapsed)
+    return response
+
+def cache_result(get_cache: Callable[[], 'RecommendationCache']):
+    """Cache a recommendation builder per user, preferences, menu version and restaurant scope
+
+    get_cache returns the cache at call time, so it is created on first use.
+    """
     def decorator(f):
         @wraps(f)
-        def decorated(*args, **kwargs):
-            cache_key = f"{key_prefix}:{request.json.get('user_id')}"
-
-            # Try to get from cache
-            cached_result = redis_client.get(cache_key)
-            if cached_result:
-                return jsonify(pickle.loads(cached_result))
-
-            # Get fresh result
-            result = f(*args, **kwargs)
-
-            # Cache the result
-            redis_client.setex(
+        def decorated(
+            user_id: str,
+            user_preferences: Dict,
+            menu_snapshot: 'MenuSnapshot',
+            restaurant_ids: Optional[List[str]] = None,
+            user_history: Optional[List[str]] = None
+        ) -> Dict:
+            cache = get_cache()
+            scope = menu_snapshot.digest
+            if restaurant_ids:
+                scope = f"{scope}:{','.join(sorted(restaurant_ids))}"
+            cache_key = cache.key(user_id, user_preferences, scope)
+            return cache.get_or_compute(
                 cache_key,
-                expiration,
-                pickle.dumps(result.get_json())
+                lambda: f(user_id, user_preferences, menu_snapshot, restaurant_ids, user_history)
             )
-
-            return result
         return decorated
     return decorator
 
-@app.route('/recommend', methods=['POST'])
+@cache_result(lambda: services.recommendation_cache)
+def build_recommendations(
+    user_id: str,
+    user_preferences: Dict,
+    menu_snapshot: 'MenuSnapshot',
+    restaurant_ids: Optional[List[str]] = None,
+    user_history: Optional[List[str]] = None
+) -> Dict:
+    """Compute the /recommend response body for one user
+
+    user_history is fetched here unless the caller already has it.
+    """
+    with services.metrics.span('get_menu_items'):
+        menu_items = menu_snapshot.items()
+
+    # Get user history
+    if user_history is None:
+        user_history = get_user_history(user_id)
+
+    # Initialize recommendation engine
+    models = services.model_registry.current
+    engine = RecommendationEngine(
+        services.menu_index,
+        services.menu_columns,
+        services.live_item_stats(menu_snapshot),
+        models.collaborative if models is not None else None,
+        services.ann_index,
+        services.menu_shards
+    )
+
+    if restaurant_ids:
+        # Only the requested restaurants' shards are scored
+        with services.metrics.span('get_scoped_recommendations'):
+            recommendations = engine.get_scoped_recommendations(
+                menu_items,
+                menu_snapshot.ids,
+                engine.build_user_feature(user_preferences),
+                restaurant_ids,
+                menu_snapshot.digest,
+                user_history
+            )
+    else:
+        # Process data and get recommendations
+        with services.metrics.span('preprocess_text_features'):
+            processed_items, user_feature = engine.preprocess_text_features(menu_items, user_preferences)
+        with services.metrics.span('get_recommendations'):
+            recommendations = engine.get_recommendations(
+                processed_items,
+                user_feature,
+                user_preferences,
+                user_history,
+                menu_version=menu_snapshot.digest
+            )
+
+    return {
+        "recommendations": recommendations,
+        "timestamp": datetime.now().isoformat()
+    }
+
+def recommend_request_error(data: Dict) -> Optional[str]:
+    """Validation error of a /recommend body, None when it is valid"""
+    if not data.get('user_id'):
+        return "User ID is required"
+
+    # Optional restaurant scope, scored on the per-restaurant shards
+    restaurant_ids = data.get('restaurant_ids')
+    if restaurant_ids is not None and (
+        not isinstance(restaurant_ids, list) or not all(isinstance(r, str) for r in restaurant_ids)
+    ):
+        return "restaurant_ids must be a list of strings"
+    return None
+
+@api.route('/recommend', methods=['POST'])
 @token_required
-@cache_result('recommendations')
 def recommend_dishes(current_user):
     try:
         # Input validation
@@ -241,130 +465,324 @@ def recommend_dishes(current_user):
             return jsonify({"error": "Request must be JSON"}), 400
 
         data = request.get_json()
-        user_id = data.get('user_id')
-
-        if not user_id:
-            return jsonify({"error": "User ID is required"}), 400
+        error = recommend_request_error(data)
+        if error:
+            return jsonify({"error": error}), 400
+        user_id = data['user_id']
 
         # Get user data
         user_preferences = get_user_preferences(user_id)
-        menu_items = get_menu_items()
+        menu_snapshot = services.menu_catalog.snapshot
 
-        if not menu_items:
+        if not len(menu_snapshot):
             return jsonify({"error": "No menu items found"}), 404
 
-        # Get user history
-        user_history = get_user_history(user_id)
-
-        # Initialize recommendation engine
-        engine = RecommendationEngine()
-
-        # Process data and get recommendations
-        processed_items, user_feature = engine.preprocess_text_features(menu_items, user_preferences)
-        recommendations = engine.get_recommendations(
-            processed_items,
-            user_feature,
-            user_preferences,
-            user_history
-        )
+        result = build_recommendations(user_id, user_preferences, menu_snapshot, data.get('restaurant_ids'))
 
         # Record recommendation event
-        record_recommendation_event(user_id, recommendations)
+        record_recommendation_event(user_id, result["recommendations"])
 
-        return jsonify({
-            "recommendations": recommendations,
-            "timestamp": datetime.now().isoformat()
-        })
+        return jsonify(result)
 
     except Exception as e:
         logger.error(f"Error in recommend_dishes: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
-@app.route('/feedback', methods=['POST'])
+def models_status() -> Dict:
+    """Served model version, ANN index and training scheduler state"""
+    served = services.model_registry.current
+    return {
+        "served_version": served.version if served is not None else None,
+        "served_manifest": served.manifest if served is not None else None,
+        "ann_index": services.ann_index.stats(),
+        **services.training_scheduler.status()
+    }
+
+@api.route('/feedback/stats', methods=['GET'])
 @token_required
-def record_feedback(current_user):
+def feedback_stats(current_user):
+    return jsonify(services.feedback_pipeline.metrics())
+
+@api.route('/events/stats', methods=['GET'])
+@token_required
+def event_stats(current_user):
+    return jsonify({
+        "log": services.event_log.stats(),
+        "export": services.event_exporter.stats()
+    })
+
+@api.route('/cache/stats', methods=['GET'])
+@token_required
+def cache_stats(current_user):
+    return jsonify(services.recommendation_cache.stats())
+
+@api.route('/models', methods=['GET'])
+@token_required
+def model_status(current_user):
+    return jsonify(models_status())
+
+def trending_request_error(args: Dict) -> Optional[str]:
+    if args.get('restaurant_id') and args.get('region'):
+        return "Pass restaurant_id or region, not both"
+    limit = args.get('limit', str(TRENDING_LIMIT))
+    if not limit.isdigit() or not 1 <= int(limit) <= HEAVY_HITTERS:
+        return f"limit must be between 1 and {HEAVY_HITTERS}"
+    return None
+
+def trending_items(args: Dict, menu_snapshot: 'MenuSnapshot') -> Dict:
+    """Trending menu items of the scope selected by the query arguments"""
+    limit = int(args.get('limit', TRENDING_LIMIT))
+    items = []
+    for item_id, score in services.trending.top(args.get('restaurant_id'), args.get('region')):
+        row = menu_snapshot.row_of.get(item_id)
+        # Items removed from the menu stay in the sketch until they age out
+        if row is None:
+            continue
+        item = menu_snapshot.item(row)
+        item['trending_score'] = round(score, 3)
+        items.append(item)
+        if len(items) == limit:
+            break
+    return {
+        "trending": items,
+        "window_seconds": services.trending.sketch.window_seconds
+    }
+
+@api.route('/trending', methods=['GET'])
+@token_required
+def trending(current_user):
     try:
-        feedback_data = request.get_json()
-        required_fields = ('user_id', 'item_id', 'rating', 'interaction_type')
+        error = trending_request_error(request.args)
+        if error:
+            return jsonify({"error": error}), 400
+        return jsonify(trending_items(request.args, services.menu_catalog.snapshot))
+    except Exception as e:
+        logger.error(f"Error in trending: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
 
-        if not all(k in feedback_data for k in required_fields):
-            return jsonify({"error": "Missing required fields"}), 400
+@api.route('/trending/stats', methods=['GET'])
+@token_required
+def trending_stats(current_user):
+    return jsonify(services.trending.stats())
+
+def batch_request_error(data: Dict) -> Optional[str]:
+    """Validation error of a /recommend/batch body, None when it is valid"""
+    user_ids = data.get('user_ids')
+
+    if not user_ids or not isinstance(user_ids, list):
+        return "user_ids must be a non-empty list"
+    if len(user_ids) > MAX_BATCH_USERS:
+        return f"At most {MAX_BATCH_USERS} users per batch"
+    return None
+
+def batch_lines(user_ids: List[str], chunk_size: int, menu_snapshot: 'MenuSnapshot') -> Iterator[str]:
+    """NDJSON lines of batch recommendations, one per user"""
+    menu_items = menu_snapshot.items()
+    models = services.model_registry.current
+    engine = RecommendationEngine(
+        services.menu_index,
+        services.menu_columns,
+        services.live_item_stats(menu_snapshot),
+        models.collaborative if models is not None else None,
+        services.ann_index
+    )
+    engine.preprocess_menu_items(menu_items)
 
-        # Validate rating
-        if not 1 <= feedback_data['rating'] <= 5:
-            return jsonify({"error": "Rating must be between 1 and 5"}), 400
+    def users():
+        # Preferences are fetched per chunk so only one chunk is held in memory
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[start:start + chunk_size]
+            yield from zip(chunk, get_user_preferences_many(chunk))
 
-        # Add timestamp and additional metadata
-        feedback_data.update({
-            'timestamp': datetime.now().isoformat(),
-            'platform': request.headers.get('User-Agent'),
-            'interaction_context': feedback_data.get('context', 'direct')
-        })
+    def generate():
+        try:
+            results = engine.recommend_many(
+                menu_items,
+                users(),
+                chunk_size=chunk_size,
+                menu_version=menu_snapshot.digest
+            )
+            for user_id, recommendations in results:
+                yield json.dumps({"user_id": user_id, "recommendations": recommendations}) + "\n"
+        except Exception as e:
+            logger.error(f"Error in recommend_batch: {str(e)}")
+            yield json.dumps({"error": "Internal server error"}) + "\n"
+
+    return generate()
 
-        # Store feedback
-        feedback_ref = db.collection('feedback').document()
-        feedback_ref.set(feedback_data)
+@api.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Latency histograms of all workers in the Prometheus text format"""
+    return Response(services.metrics.render(), content_type=CONTENT_TYPE)
+
+@api.route('/recommend/batch', methods=['POST'])
+@token_required
+def recommend_batch(current_user):
+    """Stream recommendations for many users as NDJSON, one line per user"""
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+
+    data = request.get_json()
+    error = batch_request_error(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    chunk_size = min(int(data.get('chunk_size', BATCH_CHUNK_SIZE)), BATCH_CHUNK_SIZE)
+    menu_snapshot = services.menu_catalog.snapshot
+
+    if not len(menu_snapshot):
+        return jsonify({"error": "No menu items found"}), 404
+
+    lines = batch_lines(data['user_ids'], chunk_size, menu_snapshot)
+    return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+
+def feedback_request_error(feedback_data: Dict) -> Optional[str]:
+    """Validation error of a /feedback body, None when it is valid"""
+    required_fields = ('user_id', 'item_id', 'rating', 'interaction_type')
+
+    if not all(k in feedback_data for k in required_fields):
+        return "Missing required fields"
+
+    if not isinstance(feedback_data['item_id'], str) or not feedback_data['item_id']:
+        return "Item id must be a non-empty string"
+
+    # Validate rating
+    rating = feedback_data['rating']
+    if isinstance(rating, bool) or not isinstance(rating, (int, float)):
+        return "Rating must be a number"
+    if not 1 <= rating <= 5:
+        return "Rating must be between 1 and 5"
+    return None
+
+def annotate_feedback(feedback_data: Dict, platform: Optional[str]) -> Dict:
+    """Add timestamp and additional metadata"""
+    feedback_data.update({
+        'timestamp': datetime.now().isoformat(),
+        'platform': platform,
+        'interaction_context': feedback_data.get('context', 'direct')
+    })
+    return feedback_data
+
+@api.route('/feedback', methods=['POST'])
+@token_required
+def record_feedback(current_user):
+    try:
+        feedback_data = request.get_json()
+        error = feedback_request_error(feedback_data)
+        if error:
+            return jsonify({"error": error}), 400
 
-        # Update item statistics
-        update_item_statistics(feedback_data)
+        annotate_feedback(feedback_data, request.headers.get('User-Agent'))
 
-        # Trigger recommendation model update if needed
-        check_and_update_model()
+        # Queue feedback, statistics are updated by the background flusher
+        try:
+            feedback_id = services.feedback_pipeline.enqueue(feedback_data)
+        except QueueFull:
+            return jsonify({"error": "Feedback queue is full, retry later"}), 503, {'Retry-After': '5'}
 
         return jsonify({
-            "message": "Feedback recorded successfully",
-            "feedback_id": feedback_ref.id
-        }), 201
+            "message": "Feedback accepted",
+            "feedback_id": feedback_id
+        }), 202
 
     except Exception as e:
         logger.error(f"Error in record_feedback: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
+def get_user_preferences(user_id: str) -> Dict:
+    """Get a user's stored preferences"""
+    return get_user_preferences_many([user_id])[0]
+
+def get_user_preferences_many(user_ids: List[str]) -> List[Dict]:
+    """Get preferences of several users in one round-trip, in user_ids order"""
+    try:
+        refs = [services.db.collection(PREFERENCES_COLLECTION).document(user_id) for user_id in user_ids]
+        with services.metrics.span('get_user_preferences'):
+            found = {doc.id: doc.to_dict() for doc in services.db.get_all(refs) if doc.exists}
+        return [found.get(user_id, {}) for user_id in user_ids]
+    except Exception as e:
+        logger.error(f"Error getting user preferences: {str(e)}")
+        return [{} for _ in user_ids]
+
+def get_menu_items() -> List[Dict]:
+    """Get the current menu from the in-process catalog"""
+    with services.metrics.span('get_menu_items'):
+        return services.menu_catalog.items()
+
+def ordered_item_ids(orders: Iterable[Dict]) -> List[str]:
+    """Item ids of a user's orders, one entry per order line"""
+    return [item['item_id'] for order in orders for item in order.get('items', [])]
+
 def get_user_history(user_id: str) -> List[str]:
     """Get user's order history"""
     try:
-        history_ref = db.collection('orders').where('user_id', '==', user_id).limit(50)
-        history = [doc.to_dict() for doc in history_ref.stream()]
-        return [item['item_id'] for order in history for item in order.get('items', [])]
+        history_ref = services.db.collection('orders').where('user_id', '==', user_id).limit(HISTORY_ORDERS)
+        with services.metrics.span('get_user_history'):
+            return ordered_item_ids([doc.to_dict() for doc in history_ref.stream()])
     except Exception as e:
         logger.error(f"Error getting user history: {str(e)}")
         return []
 
-def update_item_statistics(feedback_data: Dict):
-    """Update item statistics based on feedback"""
+def record_recommendation_event(user_id: str, recommendations: List[Dict]):
+    """Append which items were recommended to a user to the local event log"""
     try:
-        item_ref = db.collection('menu_items').document(feedback_data['item_id'])
-        item = item_ref.get()
-
-        if item.exists:
-            stats = item.to_dict().get('statistics', {})
-            rating_count = stats.get('rating_count', 0) + 1
-            avg_rating = (
-                (stats.get('average_rating', 0) * (rating_count - 1) +
-                feedback_data['rating']) / rating_count
-            )
-
-            item_ref.update({
-                'statistics.rating_count': rating_count,
-                'statistics.average_rating': avg_rating,
-                'statistics.last_updated': datetime.now().isoformat()
-            })
+        models = services.model_registry.current
+        services.event_log.append(
+            user_id,
+            [item.get('id') for item in recommendations],
+            [item.get('similarity_score') for item in recommendations],
+            models.version if models is not None else None
+        )
     except Exception as e:
-        logger.error(f"Error updating item statistics: {str(e)}")
+        logger.error(f"Error recording recommendation event: {str(e)}")
 
-def check_and_update_model():
-    """Check if model needs updating and trigger update if necessary"""
-    try:
-        last_update = redis_client.get('last_model_update')
-        if not last_update or (
-            datetime.now() - datetime.fromisoformat(last_update)
-        ) > timedelta(days=1):
-            # Trigger async model update
-            update_recommendation_model.delay()
-    except Exception as e:
-        logger.error(f"Error checking model update: {str(e)}")
+def start_warm_up() -> threading.Thread:
+    """Build the services in the background, logging instead of raising"""
+    def warm_up():
+        try:
+            services.warm_up()
+        except Exception as e:
+            logger.error(f"Error in warm_up: {str(e)}")
+
+    thread = threading.Thread(target=warm_up, name='warm-up', daemon=True)
+    thread.start()
+    return thread
+
+def create_app(warm: Optional[bool] = None) -> Flask:
+    """Create the Flask app serving the recommendation API.
+
+    Creating it connects to nothing. With warm (default: the WARM_START
+    environment variable, on unless set to false) a background thread
+    connects the clients, memory-maps the published models and fits the
+    menu index while the worker already accepts requests.
+    """
+    if warm is None:
+        warm = os.getenv('WARM_START', 'true').lower() == 'true'
+
+    flask_app = Flask(__name__)
+    CORS(flask_app)
+    flask_app.register_blueprint(api)
+    if warm:
+        start_warm_up()
+    return flask_app
+
+_app_lock = threading.Lock()
+
+def __getattr__(name: str):
+    """Module-level app served by `gunicorn app:app`, created on first access.
+
+    Importing this module for its blueprint, helpers and services, as
+    asgi_app does, creates no Flask app and starts no warm-up.
+    """
+    if name != 'app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _app_lock:
+        if 'app' not in globals():
+            globals()['app'] = create_app()
+    return globals()['app']
 
 if __name__ == '__main__':
+    app = create_app()
     app.run(
         host=os.getenv('FLASK_HOST', '0.0.0.0'),
         port=int(os.getenv('FLASK_PORT', 5000)),
@@ -0,0 +1,290 @@
+"""ASGI serving mode of the recommendation API.
+
+Serves the routes of app.py with the same request validation, responses
+and token_required semantics, on Quart:
+  - /recommend reads the user's preferences and order history concurrently
+    with the async Firestore client; the menu comes from the in-process
+    MenuCatalog, as in the WSGI app
+  - CPU-bound scoring runs in a bounded thread pool, off the event loop
+  - the recommendation event is appended to the local event log on the
+    event loop, a write into the page cache that does not wait for disk
+  - sampled profiles cover the scoring job, where the CPU time goes, as
+    the Firestore reads only wait on the event loop
+
+Menu, indexes, caches, models and the feedback pipeline are the ones
+app.py's services build, so both modes behave the same. The components
+the handlers touch on the event loop are built before serving starts,
+so no first request blocks the loop on a client or listener setup.
+
+Usage: hypercorn -w 4 -b 0.0.0.0:8000 asgi_app:app
+"""
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from typing import Dict, List, Optional
+
+from firebase_admin import firestore_async
+from google.cloud.firestore import AsyncClient
+from quart import Quart, Response, g, jsonify, request
+from quart_cors import cors
+
+# Routes, helpers and services of the WSGI app; importing it creates no Flask app
+import app as wsgi
+from feedback_pipeline import QueueFull
+from instrumentation import CONTENT_TYPE
+
+logger = logging.getLogger(__name__)
+
+SCORING_WORKERS = int(os.getenv('SCORING_WORKERS', 4))  # concurrent scoring threads per process
+
+app = cors(Quart(__name__))
+
+scoring_executor = ThreadPoolExecutor(max_workers=SCORING_WORKERS, thread_name_prefix='scoring')
+
+# Created once the event loop runs, gRPC channels are bound to it
+async_db: Optional[AsyncClient] = None
+
+
+@app.before_serving
+async def open_clients():
+    global async_db
+    services = wsgi.services
+    await asyncio.to_thread(lambda: (
+        services.firebase_app, services.menu_catalog, services.metrics, services.request_profiler,
+        services.recommendation_cache, services.feedback_pipeline, services.trending, services.event_log
+    ))
+    async_db = firestore_async.client()
+
+
+@app.after_serving
+async def close_clients():
+    scoring_executor.shutdown(wait=False)
+    # Sync and seal this worker's event log segment for the exporter
+    await asyncio.to_thread(wsgi.services.event_log.stop)
+    async_db.close()
+
+
+async def run_scoring(f, *args):
+    """Run CPU-bound work on the scoring pool"""
+    return await asyncio.get_running_loop().run_in_executor(scoring_executor, partial(f, *args))
+
+
+def profiled(name: str, f, *args):
+    """Run f under the request profiler when this call is sampled"""
+    with wsgi.services.request_profiler.profile(name):
+        return f(*args)
+
+
+@app.before_request
+async def start_request_timer():
+    if wsgi.services.metrics.enabled:
+        g.request_started = time.perf_counter()
+
+
+@app.after_request
+async def record_request_latency(response):
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        wsgi.services.metrics.observe_request(route, request.method, response.status_code, time.perf_counter() - started)
+    return response
+
+
+def token_required(f):
+    @wraps(f)
+    async def decorated(*args, **kwargs):
+        current_user, error = wsgi.authenticate(request.headers.get('Authorization'))
+        if error:
+            return jsonify({'error': error}), 401
+
+        return await f(current_user, *args, **kwargs)
+    return decorated
+
+
+async def get_user_preferences(user_id: str) -> Dict:
+    """Get a user's stored preferences"""
+    try:
+        with wsgi.services.metrics.span('get_user_preferences'):
+            doc = await async_db.collection(wsgi.PREFERENCES_COLLECTION).document(user_id).get()
+        return doc.to_dict() if doc.exists else {}
+    except Exception as e:
+        logger.error(f"Error getting user preferences: {str(e)}")
+        return {}
+
+
+async def get_user_history(user_id: str) -> List[str]:
+    """Get user's order history"""
+    try:
+        history_ref = async_db.collection('orders').where('user_id', '==', user_id).limit(wsgi.HISTORY_ORDERS)
+        with wsgi.services.metrics.span('get_user_history'):
+            return wsgi.ordered_item_ids([doc.to_dict() async for doc in history_ref.stream()])
+    except Exception as e:
+        logger.error(f"Error getting user history: {str(e)}")
+        return []
+
+
+@app.route('/recommend', methods=['POST'])
+@token_required
+async def recommend_dishes(current_user):
+    try:
+        # Input validation
+        if not request.is_json:
+            return jsonify({"error": "Request must be JSON"}), 400
+
+        data = await request.get_json()
+        error = wsgi.recommend_request_error(data)
+        if error:
+            return jsonify({"error": error}), 400
+        user_id = data['user_id']
+
+        # Get user data, both Firestore reads in flight together
+        user_preferences, user_history = await asyncio.gather(
+            get_user_preferences(user_id),
+            get_user_history(user_id)
+        )
+        menu_snapshot = wsgi.services.menu_catalog.snapshot
+
+        if not len(menu_snapshot):
+            return jsonify({"error": "No menu items found"}), 404
+
+        result = await run_scoring(
+            profiled,
+            f"{request.method} {request.path}",
+            wsgi.build_recommendations,
+            user_id,
+            user_preferences,
+            menu_snapshot,
+            data.get('restaurant_ids'),
+            user_history
+        )
+
+        # Record recommendation event
+        wsgi.record_recommendation_event(user_id, result["recommendations"])
+
+        return jsonify(result)
+
+    except Exception as e:
+        logger.error(f"Error in recommend_dishes: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@app.route('/feedback/stats', methods=['GET'])
+@token_required
+async def feedback_stats(current_user):
+    return jsonify(wsgi.services.feedback_pipeline.metrics())
+
+
+@app.route('/events/stats', methods=['GET'])
+@token_required
+async def event_stats(current_user):
+    return jsonify({
+        "log": wsgi.services.event_log.stats(),
+        "export": wsgi.services.event_exporter.stats()
+    })
+
+
+@app.route('/cache/stats', methods=['GET'])
+@token_required
+async def cache_stats(current_user):
+    return jsonify(wsgi.services.recommendation_cache.stats())
+
+
+@app.route('/models', methods=['GET'])
+@token_required
+async def model_status(current_user):
+    return jsonify(wsgi.models_status())
+
+
+@app.route('/trending', methods=['GET'])
+@token_required
+async def trending(current_user):
+    try:
+        error = wsgi.trending_request_error(request.args)
+        if error:
+            return jsonify({"error": error}), 400
+        return jsonify(wsgi.trending_items(request.args, wsgi.services.menu_catalog.snapshot))
+    except Exception as e:
+        logger.error(f"Error in trending: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@app.route('/trending/stats', methods=['GET'])
+@token_required
+async def trending_stats(current_user):
+    return jsonify(wsgi.services.trending.stats())
+
+
+@app.route('/metrics', methods=['GET'])
+async def prometheus_metrics():
+    """Latency histograms of all workers in the Prometheus text format"""
+    return Response(await asyncio.to_thread(wsgi.services.metrics.render), content_type=CONTENT_TYPE)
+
+
+@app.route('/recommend/batch', methods=['POST'])
+@token_required
+async def recommend_batch(current_user):
+    """Stream recommendations for many users as NDJSON, one line per user"""
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+
+    data = await request.get_json()
+    error = wsgi.batch_request_error(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    chunk_size = min(int(data.get('chunk_size', wsgi.BATCH_CHUNK_SIZE)), wsgi.BATCH_CHUNK_SIZE)
+    menu_snapshot = wsgi.services.menu_catalog.snapshot
+
+    if not len(menu_snapshot):
+        return jsonify({"error": "No menu items found"}), 404
+
+    lines = await run_scoring(wsgi.batch_lines, data['user_ids'], chunk_size, menu_snapshot)
+
+    async def generate():
+        # Each line is produced on the scoring pool, a chunk is scored at a time
+        while True:
+            line = await run_scoring(next, lines, None)
+            if line is None:
+                return
+            yield line
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+@app.route('/feedback', methods=['POST'])
+@token_required
+async def record_feedback(current_user):
+    try:
+        feedback_data = await request.get_json()
+        error = wsgi.feedback_request_error(feedback_data)
+        if error:
+            return jsonify({"error": error}), 400
+
+        wsgi.annotate_feedback(feedback_data, request.headers.get('User-Agent'))
+
+        # Queue feedback, statistics are updated by the background flusher
+        try:
+            # The enqueue is a SQLite insert, kept off the event loop
+            feedback_id = await asyncio.to_thread(wsgi.services.feedback_pipeline.enqueue, feedback_data)
+        except QueueFull:
+            return jsonify({"error": "Feedback queue is full, retry later"}), 503, {'Retry-After': '5'}
+
+        return jsonify({
+            "message": "Feedback accepted",
+            "feedback_id": feedback_id
+        }), 202
+
+    except Exception as e:
+        logger.error(f"Error in record_feedback: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
+if __name__ == '__main__':
+    app.run(
+        host=os.getenv('FLASK_HOST', '0.0.0.0'),
+        port=int(os.getenv('FLASK_PORT', 5000)),
+        debug=os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
+    )
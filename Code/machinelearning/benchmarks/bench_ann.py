@@ -0,0 +1,139 @@
+"""Benchmark of the retrieve-then-rank path against the exact menu scan.
+
+Builds a synthetic multi-restaurant menu, an AnnIndex over its TF-IDF
+index, and compares for a set of user queries:
+  - exact: similarity against every item, MenuColumns.score, select_top_k
+  - ann: candidates from AnnIndex plus prior rows, scored with the same rules
+Reports per-query latency and recall@K of the final recommendations and of
+the text retrieval stage.
+
+Usage: python benchmarks/bench_ann.py [--items 300000] [--queries 200] [--n-probe 16 64 128]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from functools import reduce
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann_index import PRIOR_CANDIDATES, AnnIndex, AnnIndexManager  # noqa: E402
+from menu_index import MenuIndex, item_text_feature  # noqa: E402
+from scoring import MenuColumns, select_top_k  # noqa: E402
+
+MAX_RECOMMENDATIONS = 10
+MIN_SIMILARITY_SCORE = 0.1
+N_TOPICS = 300
+WORDS_PER_TOPIC = 40
+
+
+def synthetic_menu(n_items: int, rng: np.random.Generator):
+    """Items whose names mix words of one cuisine topic with shared words"""
+    topic_words = [[f't{topic}w{word}' for word in range(WORDS_PER_TOPIC)] for topic in range(N_TOPICS)]
+    shared_words = [f'common{word}' for word in range(200)]
+    topics = rng.integers(0, N_TOPICS, n_items)
+    menu_items = []
+    for i, topic in enumerate(topics):
+        words = list(rng.choice(topic_words[topic], 3)) + list(rng.choice(shared_words, 2))
+        peak_start = int(rng.integers(0, 22))
+        menu_items.append({
+            'id': f'item{i}',
+            'name': ' '.join(words),
+            'description': ' '.join(rng.choice(topic_words[topic], 4)),
+            'category': f'cuisine{topic}',
+            'is_vegetarian': bool(rng.random() < 0.3),
+            'is_spicy': bool(rng.random() < 0.2),
+            'average_rating': float(np.round(rng.uniform(1, 5), 1)),
+            'order_frequency': int(rng.integers(0, 300)),
+            'is_special': bool(rng.random() < 0.05),
+            'peak_hours': [peak_start, peak_start + 1] if rng.random() < 0.5 else []
+        })
+    queries = [
+        f"cuisine{topic} " + ' '.join(rng.choice(topic_words[topic], 2)) + (' vegetarian' if rng.random() < 0.3 else '')
+        for topic in rng.integers(0, N_TOPICS, 1000)
+    ]
+    return menu_items, queries
+
+
+def exact_ranking(index, columns, query, hour):
+    scores = columns.score(index.similarities(query), hour)
+    return select_top_k(scores, MAX_RECOMMENDATIONS, MIN_SIMILARITY_SCORE)
+
+
+def ann_ranking(manager, ann, index, columns, query, hour):
+    user_vector = index.tfidf.transform([query])
+    rows = reduce(np.union1d, [
+        manager.candidate_rows(ann, index, query, user_vector),
+        columns.prior_rows(PRIOR_CANDIDATES)
+    ])
+    text_similarities = (index.matrix[rows] @ user_vector.T).toarray().ravel()
+    scores = columns.score(text_similarities, hour, rows)
+    return rows[select_top_k(scores, MAX_RECOMMENDATIONS, MIN_SIMILARITY_SCORE)]
+
+
+def bench(n_items: int, n_queries: int, n_probes, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    menu_items, queries = synthetic_menu(n_items, rng)
+    queries = queries[:n_queries]
+    hour = 19
+
+    started = time.perf_counter()
+    keys = [item['id'] for item in menu_items]
+    index = MenuIndex.fit(keys, [item_text_feature(item) for item in menu_items], 'bench')
+    columns = MenuColumns(menu_items, 'bench')
+    fit_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    ann = AnnIndex.build(index)
+    build_seconds = time.perf_counter() - started
+    manager = AnnIndexManager(min_items=0)
+
+    exact = []
+    started = time.perf_counter()
+    for query in queries:
+        exact.append(exact_ranking(index, columns, query, hour))
+    exact_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+    results = {
+        'items': n_items,
+        'queries': len(queries),
+        'tfidf_fit_seconds': round(fit_seconds, 2),
+        'ann_build_seconds': round(build_seconds, 2),
+        'lists': len(ann.centroids),
+        'exact_ms_per_query': round(exact_ms, 3),
+        'ann': []
+    }
+    for n_probe in n_probes:
+        manager.n_probe = n_probe
+        found = 0
+        total = 0
+        started = time.perf_counter()
+        approximate = [ann_ranking(manager, ann, index, columns, query, hour) for query in queries]
+        ann_ms = (time.perf_counter() - started) * 1000 / len(queries)
+        for expected, got in zip(exact, approximate):
+            found += len(set(expected) & set(got))
+            total += len(expected)
+        results['ann'].append({
+            'n_probe': n_probe,
+            'ms_per_query': round(ann_ms, 3),
+            'speedup': round(exact_ms / ann_ms, 1),
+            f'recall_at_{MAX_RECOMMENDATIONS}': round(found / total if total else 1.0, 4),
+            f'text_recall_at_{MAX_RECOMMENDATIONS}': round(ann.recall(index, queries[:100], MAX_RECOMMENDATIONS, n_probe), 4)
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=300_000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--n-probe', type=int, nargs='+', default=[16, 64, 128])
+    args = parser.parse_args()
+    print(json.dumps(bench(args.items, args.queries, args.n_probe), indent=2))
+
+
+if __name__ == '__main__':
+    main()
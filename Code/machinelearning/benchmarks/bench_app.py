@@ -0,0 +1,274 @@
+"""End-to-end benchmark of the service on in-memory Firestore and Redis.
+
+Generates a synthetic menu, users and orders, installs the fakes from
+benchmarks/fakes.py, imports app.py and drives its routes through the
+Flask test client:
+  - recommend_first: the first /recommend, which fits the menu index
+  - recommend_cold: /recommend for users without a cached result
+  - recommend_warm: /recommend again for the same users, served from cache
+  - recommend_batch: /recommend/batch with --batch-size users per request
+  - feedback: /feedback
+  - pricing_train: DynamicPricingML.train_model on --pricing-samples rows
+  - pricing_predict: DynamicPricingML.predict_many on --pricing-batch rows
+Prints one JSON report with throughput, p50/p95/p99 latency and peak RSS
+per scenario. With --baseline, every scenario is compared to an earlier
+report and flagged when p95 latency grew by more than --tolerance.
+
+Requires fakeredis (pip install fakeredis).
+
+Usage: python benchmarks/bench_app.py [--items 5000] [--users 2000] [--orders 20000]
+       [--requests 500] [--concurrency 4] [--output run.json] [--baseline previous.json]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fakes  # noqa: E402
+import synthetic  # noqa: E402
+
+SCENARIOS = (
+    'recommend_first', 'recommend_cold', 'recommend_warm', 'recommend_batch',
+    'feedback', 'pricing_train', 'pricing_predict'
+)
+JWT_SECRET = 'benchmark-secret-benchmark-secret'
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def summarize(latencies: List[float], wall_seconds: float, statuses: Counter, units: int) -> Dict:
+    latencies_ms = np.array(latencies) * 1000
+    errors = sum(count for status, count in statuses.items() if not 200 <= status < 300)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'status_counts': {str(status): count for status, count in sorted(statuses.items())},
+        'wall_seconds': round(wall_seconds, 3),
+        'throughput_per_s': round(units / wall_seconds, 1) if wall_seconds else None,
+        'p50_ms': round(float(np.percentile(latencies_ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(latencies_ms, 95)), 3),
+        'p99_ms': round(float(np.percentile(latencies_ms, 99)), 3),
+        'mean_ms': round(float(latencies_ms.mean()), 3),
+        'max_ms': round(float(latencies_ms.max()), 3),
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+
+def run_load(calls: List[Callable[[], int]], concurrency: int, units_per_call: int = 1) -> Dict:
+    """Run calls on concurrency threads, each returning an HTTP-like status"""
+    latencies = [0.0] * len(calls)
+    statuses = [0] * len(calls)
+
+    def run(i):
+        started = time.perf_counter()
+        statuses[i] = calls[i]()
+        latencies[i] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    if concurrency <= 1:
+        for i in range(len(calls)):
+            run(i)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(run, range(len(calls))))
+    return summarize(latencies, time.perf_counter() - started, Counter(statuses), len(calls) * units_per_call)
+
+
+def populate(db, args, rng: np.random.Generator) -> Tuple[Dict, Dict]:
+    items = synthetic.menu_items(args.items, args.restaurants, rng)
+    users = synthetic.user_preferences(args.users, rng)
+    for item_id, item in items.items():
+        db.collection('menu_items').document(item_id).set(item)
+    for user_id, preferences in users.items():
+        db.collection('user_preferences').document(user_id).set(preferences)
+    for i, order in enumerate(synthetic.orders(args.orders, users, items, rng)):
+        db.collection('orders').document(f"order{i}").set(order)
+    return items, users
+
+
+def bench(args) -> Dict:
+    rng = np.random.default_rng(args.seed)
+    workdir = tempfile.mkdtemp(prefix='bench-app-')
+    os.environ.update({
+        'JWT_SECRET': JWT_SECRET,
+        'FEEDBACK_QUEUE_PATH': os.path.join(workdir, 'feedback_queue.db'),
+        'MODEL_ARTIFACT_DIR': os.path.join(workdir, 'model_artifacts'),
+        'PROFILE_DIR': os.path.join(workdir, 'profiles'),
+        'TRENDING_SNAPSHOT_PATH': os.path.join(workdir, 'trending_snapshot.npz'),
+        'EVENT_LOG_DIR': os.path.join(workdir, 'event_log'),
+        'EVENT_EXPORT_DIR': os.path.join(workdir, 'event_export')
+    })
+
+    report = {
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'numpy': np.__version__
+        },
+        'setup': {},
+        'scenarios': {}
+    }
+
+    started = time.perf_counter()
+    db = fakes.install()
+    items, users = populate(db, args, rng)
+    report['setup']['populate_seconds'] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    import app as service
+    import jwt
+    report['setup']['import_app_seconds'] = round(time.perf_counter() - started, 3)
+    report['setup']['rss_after_import_mb'] = peak_rss_mb()
+
+    headers = {'Authorization': 'Bearer ' + jwt.encode({'user_id': 'benchmark'}, JWT_SECRET, algorithm='HS256')}
+    local = threading.local()
+
+    def client():
+        if not hasattr(local, 'client'):
+            local.client = service.app.test_client()
+        return local.client
+
+    def post(path: str, body: Dict) -> Callable[[], int]:
+        def call():
+            response = client().post(path, json=body, headers=headers)
+            response.get_data()
+            return response.status_code
+        return call
+
+    user_ids = list(users)
+    item_ids = list(items)
+    selected = set(args.scenarios)
+
+    if 'recommend_first' in selected or 'recommend_cold' in selected or 'recommend_warm' in selected:
+        report['scenarios']['recommend_first'] = run_load([post('/recommend', {'user_id': user_ids[0]})], 1)
+
+    # Distinct users miss the cache, the same users again hit it
+    cold_users = user_ids[1:1 + args.requests]
+    if 'recommend_cold' in selected or 'recommend_warm' in selected:
+        calls = [post('/recommend', {'user_id': user_id}) for user_id in cold_users]
+        report['scenarios']['recommend_cold'] = run_load(calls, args.concurrency)
+    if 'recommend_warm' in selected:
+        calls = [post('/recommend', {'user_id': user_id}) for user_id in cold_users]
+        report['scenarios']['recommend_warm'] = run_load(calls, args.concurrency)
+
+    if 'recommend_batch' in selected:
+        n_batches = max(1, args.requests // args.batch_size)
+        calls = [
+            post('/recommend/batch', {'user_ids': [user_ids[int(j)] for j in rng.integers(0, len(user_ids), args.batch_size)]})
+            for _ in range(n_batches)
+        ]
+        report['scenarios']['recommend_batch'] = run_load(calls, args.concurrency, units_per_call=args.batch_size)
+        report['scenarios']['recommend_batch']['throughput_unit'] = 'users'
+
+    if 'feedback' in selected:
+        calls = [
+            post('/feedback', {
+                'user_id': user_ids[int(rng.integers(0, len(user_ids)))],
+                'item_id': item_ids[int(rng.integers(0, len(item_ids)))],
+                'rating': int(rng.integers(1, 6)),
+                'interaction_type': 'order'
+            })
+            for _ in range(args.requests)
+        ]
+        report['scenarios']['feedback'] = run_load(calls, args.concurrency)
+
+    if 'pricing_train' in selected or 'pricing_predict' in selected:
+        from dynamicPricing import DynamicPricingML
+        pricing_model = DynamicPricingML()
+        training_data = pricing_model.prepare_sample_data(args.pricing_samples, seed=args.seed)
+
+        def train():
+            pricing_model.train_model(training_data)
+            return 200
+
+        report['scenarios']['pricing_train'] = run_load([train] * args.pricing_repeat, 1)
+        report['scenarios']['pricing_train']['samples'] = args.pricing_samples
+
+        if 'pricing_predict' in selected:
+            batch = pricing_model.prepare_sample_data(args.pricing_batch, seed=args.seed + 1)
+            records = batch[pricing_model.feature_columns].to_dict('records')
+
+            def predict():
+                pricing_model.predict_many(records)
+                return 200
+
+            report['scenarios']['pricing_predict'] = run_load([predict] * args.requests, args.concurrency, args.pricing_batch)
+            report['scenarios']['pricing_predict']['throughput_unit'] = 'items'
+
+    report['peak_rss_mb'] = peak_rss_mb()
+    return report
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> Dict:
+    """Relative change of p95 latency and throughput against a baseline report"""
+    changes = {}
+    for name, current in report['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        p95_change = current['p95_ms'] / previous['p95_ms'] - 1 if previous['p95_ms'] else None
+        throughput_change = (
+            current['throughput_per_s'] / previous['throughput_per_s'] - 1
+            if previous.get('throughput_per_s') else None
+        )
+        changes[name] = {
+            'p95_change': round(p95_change, 3) if p95_change is not None else None,
+            'throughput_change': round(throughput_change, 3) if throughput_change is not None else None,
+            'regression': p95_change is not None and p95_change > tolerance
+        }
+    return changes
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--restaurants', type=int, default=100)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--pricing-samples', type=int, default=10000)
+    parser.add_argument('--pricing-repeat', type=int, default=3)
+    parser.add_argument('--pricing-batch', type=int, default=100)
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='also write the report to this file')
+    parser.add_argument('--baseline', help='earlier report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='p95 growth flagged as a regression')
+    args = parser.parse_args(argv)
+
+    report = bench(args)
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['comparison'] = compare(report, json.load(f), args.tolerance)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Benchmark of DynamicPricingML prediction paths.
+
+Compares repricing a menu item by item with predict_price_multiplier
+against one predict_many call, the predict_encoded fast path and the
+exported LeanPricingModel, and checks they agree.
+
+Usage: python benchmarks/bench_pricing.py [--sizes 1 10 100 500]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dynamicPricing import DynamicPricingML  # noqa: E402
+from lean_pricing import LeanPricingModel  # noqa: E402
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100, 500])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    pricing_model = DynamicPricingML().train_model()
+    forest_dir = tempfile.mkdtemp(prefix='lean-forest-')
+    lean_model = LeanPricingModel.load(pricing_model.export_forest(forest_dir))
+    results = []
+    for n_items in args.sizes:
+        data = pricing_model.prepare_sample_data(n_items, seed=n_items)
+        records = data[pricing_model.feature_columns].to_dict('records')
+        columns = {column: data[column].to_numpy() for column in pricing_model.feature_columns}
+        encoded = pricing_model.encode_features(columns)
+
+        per_item_time, expected = best_of(
+            lambda: np.array([pricing_model.predict_price_multiplier(record) for record in records]),
+            args.repeat
+        )
+        batch_time, batch = best_of(lambda: pricing_model.predict_many(records), args.repeat)
+        encode_time, _ = best_of(lambda: pricing_model.encode_features(columns), args.repeat)
+        fast_time, fast = best_of(lambda: pricing_model.predict_encoded(encoded), args.repeat)
+        lean_encoded = lean_model.encode(columns)
+        lean_time, lean = best_of(lambda: lean_model.predict_encoded(lean_encoded), args.repeat)
+
+        if not all(np.allclose(result, expected) for result in (batch, fast, lean)):
+            raise AssertionError(f"Prediction mismatch at {n_items} items")
+
+        results.append({
+            'items': n_items,
+            'per_item_ms': round(per_item_time * 1000, 3),
+            'predict_many_ms': round(batch_time * 1000, 3),
+            'encode_ms': round(encode_time * 1000, 3),
+            'predict_encoded_ms': round(fast_time * 1000, 3),
+            'lean_ms': round(lean_time * 1000, 3),
+            'speedup_predict_many': round(per_item_time / batch_time, 1),
+            'speedup_encoded': round(per_item_time / (encode_time + fast_time), 1),
+            'speedup_lean': round(per_item_time / lean_time, 1)
+        })
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Microbenchmark of the recommendation scoring stage.
+
+Compares the per-item scoring loop RecommendationEngine used before the
+columnar path with MenuColumns.score + select_top_k, and checks both
+produce the same ranking.
+
+Usage: python benchmarks/bench_scoring.py [--sizes 1000 10000 100000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scoring import MenuColumns, select_top_k  # noqa: E402
+
+MAX_RECOMMENDATIONS = 10
+MIN_SIMILARITY_SCORE = 0.1
+
+
+def synthetic_menu(n_items: int, rng: np.random.Generator):
+    menu_items = []
+    for i in range(n_items):
+        peak_start = int(rng.integers(0, 22))
+        menu_items.append({
+            'id': f'item{i}',
+            'average_rating': float(np.round(rng.uniform(1, 5), 1)),
+            'order_frequency': int(rng.integers(0, 300)),
+            'preparation_time': int(rng.integers(5, 60)),
+            'price_category': rng.choice(['low', 'medium', 'high']),
+            'is_special': bool(rng.random() < 0.1),
+            'is_seasonal': bool(rng.random() < 0.05),
+            'peak_hours': [peak_start, peak_start + 1, peak_start + 2] if rng.random() < 0.5 else []
+        })
+    # Quantized similarities produce ties, which exercise the tie-breaking
+    text_similarities = np.round(rng.random(n_items), 2)
+    return menu_items, text_similarities
+
+
+def loop_scoring(menu_items, text_similarities, current_hour):
+    """Reference implementation: the former per-item loop"""
+    features = []
+    price_weights = {'low': 0, 'medium': 1, 'high': 2}
+    for item in menu_items:
+        features.append([
+            abs(price_weights['medium'] - price_weights.get(item.get('price_category', 'medium'))),
+            item.get('average_rating', 3.0),
+            item.get('order_frequency', 0),
+            item.get('preparation_time', 30),
+            int(item.get('is_special', False))
+        ])
+    additional_features = StandardScaler().fit_transform(np.array(features))
+
+    final_scores = []
+    for idx, (text_sim, item) in enumerate(zip(text_similarities, menu_items)):
+        score = text_sim * 0.6
+        add_features = additional_features[idx]
+        score += (add_features[1] / 5.0) * 0.2
+        score += min(add_features[2] / 100, 1.0) * 0.1
+        if item.get('peak_hours', []) and current_hour in item['peak_hours']:
+            score *= 1.2
+        if item.get('is_special', False):
+            score *= 1.1
+        if item.get('is_seasonal', False):
+            score *= 1.15
+        final_scores.append((idx, score))
+
+    final_scores.sort(key=lambda x: x[1], reverse=True)
+    ranking = []
+    for idx, score in final_scores:
+        if score < MIN_SIMILARITY_SCORE:
+            continue
+        ranking.append((idx, round(score, 3)))
+        if len(ranking) >= MAX_RECOMMENDATIONS:
+            break
+    return ranking
+
+
+def vectorized_scoring(menu_items, text_similarities, current_hour, columns=None):
+    if columns is None:
+        columns = MenuColumns(menu_items)
+    scores = columns.score(text_similarities, current_hour)
+    return [
+        (int(idx), round(scores[idx], 3))
+        for idx in select_top_k(scores, MAX_RECOMMENDATIONS, MIN_SIMILARITY_SCORE)
+    ]
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    current_hour = 12
+    results = []
+    for n_items in args.sizes:
+        menu_items, text_similarities = synthetic_menu(n_items, rng)
+        columns = MenuColumns(menu_items)
+
+        loop_time, expected = best_of(lambda: loop_scoring(menu_items, text_similarities, current_hour), args.repeat)
+        build_time, _ = best_of(lambda: MenuColumns(menu_items), args.repeat)
+        score_time, actual = best_of(
+            lambda: vectorized_scoring(menu_items, text_similarities, current_hour, columns),
+            args.repeat
+        )
+        if actual != expected:
+            raise AssertionError(f"Ranking mismatch at {n_items} items: {actual} != {expected}")
+
+        results.append({
+            'items': n_items,
+            'loop_ms': round(loop_time * 1000, 3),
+            'columns_build_ms': round(build_time * 1000, 3),
+            'vectorized_ms': round(score_time * 1000, 3),
+            'speedup': round(loop_time / score_time, 1)
+        })
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
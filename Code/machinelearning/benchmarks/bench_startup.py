@@ -0,0 +1,183 @@
+"""Startup budget of the service: import time, warm-up and the first request.
+
+Every run starts a fresh interpreter that installs the fakes from
+benchmarks/fakes.py, fills them with a synthetic menu, users and orders,
+and then measures:
+  - import_app_ms: `import app`, which creates no clients (nor the Flask app,
+    made on first access of app.app)
+  - warm_up: seconds per stage of Services.warm_up, when the mode warms up
+  - first_request_ms: the first /recommend
+  - ready_ms: all of the above, the time until the first answer
+Modes:
+  - lazy: no warm-up, the first request builds everything it touches
+  - warm: warm_up fits the menu index from the menu
+  - artifacts: models are published to the artifact store beforehand, so
+    warm_up memory-maps the prebuilt menu index instead of fitting it
+The fakes import the Firestore client library before the timed import,
+so import_app_ms does not include it.
+
+Prints one JSON report with the median of --repeat runs per mode and
+exits with status 1 when the import or, in modes that warm up, the first
+request exceeds its budget.
+
+Requires fakeredis (pip install fakeredis).
+
+Usage: python benchmarks/bench_startup.py [--items 5000] [--modes lazy warm artifacts]
+       [--import-budget-ms 500] [--first-request-budget-ms 250] [--output startup.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fakes  # noqa: E402
+import synthetic  # noqa: E402
+
+MODES = ('lazy', 'warm', 'artifacts')
+JWT_SECRET = 'benchmark-secret-benchmark-secret'
+
+
+def populate(db, args):
+    rng = np.random.default_rng(args.seed)
+    items = synthetic.menu_items(args.items, args.restaurants, rng)
+    users = synthetic.user_preferences(args.users, rng)
+    for item_id, item in items.items():
+        db.collection('menu_items').document(item_id).set(item)
+    for user_id, preferences in users.items():
+        db.collection('user_preferences').document(user_id).set(preferences)
+    for i, order in enumerate(synthetic.orders(args.orders, users, items, rng)):
+        db.collection('orders').document(f"order{i}").set(order)
+    return users
+
+
+def publish_artifacts(db, directory: str):
+    """Train and publish models for the synthetic menu, as the trainer process would"""
+    from menu_catalog import MenuCatalog
+    from model_training import ArtifactStore, train_artifacts
+
+    snapshot = MenuCatalog(db).start().snapshot
+    store = ArtifactStore(directory)
+    version = store.new_version()
+    manifest = train_artifacts(store.staging_path(version), snapshot.items(), snapshot.digest)
+    store.publish(version, manifest)
+
+
+def run_child(args) -> Dict:
+    """One measurement in this (fresh) interpreter"""
+    db = fakes.install()
+    users = populate(db, args)
+    if args.child == 'publish':
+        publish_artifacts(db, os.environ['MODEL_ARTIFACT_DIR'])
+        return {}
+
+    result = {'mode': args.child}
+    started = time.perf_counter()
+    import app as service
+    result['import_app_ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+    if args.child != 'lazy':
+        started = time.perf_counter()
+        result['warm_up'] = service.services.warm_up()
+        result['warm_up_ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+    import jwt
+    headers = {'Authorization': 'Bearer ' + jwt.encode({'user_id': 'benchmark'}, JWT_SECRET, algorithm='HS256')}
+    client = service.app.test_client()
+    started = time.perf_counter()
+    response = client.post('/recommend', json={'user_id': next(iter(users))}, headers=headers)
+    response.get_data()
+    result['first_request_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    result['status'] = response.status_code
+    result['ready_ms'] = round(result['import_app_ms'] + result.get('warm_up_ms', 0) + result['first_request_ms'], 1)
+    return result
+
+
+def measure(mode: str, args) -> Dict:
+    workdir = tempfile.mkdtemp(prefix='bench-startup-')
+    env = dict(
+        os.environ,
+        JWT_SECRET=JWT_SECRET,
+        WARM_START='false',
+        METRICS_ENABLED='false',
+        FEEDBACK_QUEUE_PATH=os.path.join(workdir, 'feedback_queue.db'),
+        MODEL_ARTIFACT_DIR=os.path.join(workdir, 'model_artifacts'),
+        TRENDING_SNAPSHOT_PATH=os.path.join(workdir, 'trending_snapshot.npz'),
+        EVENT_LOG_DIR=os.path.join(workdir, 'event_log'),
+        EVENT_EXPORT_DIR=os.path.join(workdir, 'event_export')
+    )
+
+    def child(step: str) -> Dict:
+        command = [
+            sys.executable, os.path.abspath(__file__), '--child', step,
+            '--items', str(args.items), '--restaurants', str(args.restaurants),
+            '--users', str(args.users), '--orders', str(args.orders), '--seed', str(args.seed)
+        ]
+        completed = subprocess.run(command, env=env, capture_output=True, text=True, check=True)
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+    if mode == 'artifacts':
+        # Published by another process, as the trainer would
+        child('publish')
+    return child(mode)
+
+
+def median_run(runs: List[Dict]) -> Dict:
+    summary = dict(runs[len(runs) // 2], runs=len(runs))
+    for key in ('import_app_ms', 'warm_up_ms', 'first_request_ms', 'ready_ms'):
+        if key in runs[0]:
+            summary[key] = round(float(np.median([run[key] for run in runs])), 1)
+    return summary
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--restaurants', type=int, default=100)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--orders', type=int, default=2000)
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--import-budget-ms', type=float, default=500)
+    parser.add_argument('--first-request-budget-ms', type=float, default=250,
+                        help='budget of the first request after warm-up')
+    parser.add_argument('--output', help='also write the report to this file')
+    parser.add_argument('--child', choices=MODES + ('publish',), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_child(args)))
+        return
+
+    report = {
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'child')},
+        'modes': {mode: median_run([measure(mode, args) for _ in range(args.repeat)]) for mode in args.modes}
+    }
+    over_budget = []
+    for mode, result in report['modes'].items():
+        if result['import_app_ms'] > args.import_budget_ms:
+            over_budget.append(f"{mode}: import_app_ms {result['import_app_ms']} > {args.import_budget_ms}")
+        if mode != 'lazy' and result['first_request_ms'] > args.first_request_budget_ms:
+            over_budget.append(f"{mode}: first_request_ms {result['first_request_ms']} > {args.first_request_budget_ms}")
+    report['over_budget'] = over_budget
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    if over_budget:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Benchmark of DynamicPricingML training modes on generated history.
+
+Writes --samples rows of sample history as Parquet shards, then runs
+every mode in a fresh interpreter, so its peak memory starts from a
+clean process:
+  - full: reads every shard into one DataFrame with default dtypes and
+    calls train_model, as training on a whole history did before
+  - out_of_core: train_out_of_core over the shards, --chunk-size rows at a time
+  - incremental: update_model with one more shard on the out-of-core model
+Prints the training report of every mode (rows, trees, wall time, RSS
+before the run and its peak) and its mean absolute error on held-out rows.
+
+Usage: python benchmarks/bench_training.py [--samples 2000000] [--chunk-size 500000]
+       [--trees-per-chunk 10] [--n-jobs -1] [--modes full out_of_core incremental]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dynamicPricing import DynamicPricingML  # noqa: E402
+
+MODES = ('full', 'out_of_core', 'incremental')
+UPDATE_DIR = 'update'
+
+
+def holdout_error(pricing_model: DynamicPricingML, holdout: pd.DataFrame) -> float:
+    predictions = pricing_model.predict_many(holdout[pricing_model.feature_columns])
+    return round(float(np.abs(predictions - holdout['price_multiplier'].to_numpy()).mean()), 5)
+
+
+def history_shards(directory: str):
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.parquet')
+    )
+
+
+def run_child(args) -> Dict:
+    """Train one mode on the shards in args.directory, in this (fresh) interpreter"""
+    pricing_model = DynamicPricingML()
+    shards = history_shards(args.directory)
+    holdout = pricing_model.prepare_sample_data(10000, seed=args.seed + 2)
+
+    if args.child == 'full':
+        history = pd.concat(
+            [pd.read_parquet(path).astype({column: object for column in pricing_model.categorical_features}) for path in shards],
+            ignore_index=True
+        ).astype({column: np.float64 for column in pricing_model.numeric_features})
+        pricing_model.train_model(history, n_jobs=args.n_jobs)
+        del history
+    else:
+        pricing_model.train_out_of_core(shards, args.chunk_size, args.trees_per_chunk, n_jobs=args.n_jobs)
+        if args.child == 'incremental':
+            update = history_shards(os.path.join(args.directory, UPDATE_DIR))
+            pricing_model.update_model(
+                pricing_model.read_history(update, args.chunk_size), args.trees_per_chunk, n_jobs=args.n_jobs
+            )
+    return dict(pricing_model.training_report, holdout_mae=holdout_error(pricing_model, holdout))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, default=2_000_000)
+    parser.add_argument('--chunk-size', type=int, default=500_000)
+    parser.add_argument('--trees-per-chunk', type=int, default=10)
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--directory', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args)))
+        return
+
+    pricing_model = DynamicPricingML()
+    directory = tempfile.mkdtemp(prefix='pricing-history-')
+    pricing_model.write_sample_shards(directory, args.samples, args.chunk_size, args.seed)
+    pricing_model.write_sample_shards(os.path.join(directory, UPDATE_DIR), args.chunk_size, args.chunk_size, args.seed + 1)
+
+    results = {}
+    for mode in args.modes:
+        command = [
+            sys.executable, os.path.abspath(__file__), '--child', mode, '--directory', directory,
+            '--chunk-size', str(args.chunk_size), '--trees-per-chunk', str(args.trees_per_chunk),
+            '--n-jobs', str(args.n_jobs), '--seed', str(args.seed)
+        ]
+        completed = subprocess.run(command, capture_output=True, text=True, check=True)
+        results[mode] = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    config = {key: value for key, value in vars(args).items() if key not in ('child', 'directory')}
+    print(json.dumps({'config': config, 'cpus': os.cpu_count(), 'modes': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+"""In-memory stand-ins for the Firestore client and Redis.
+
+install() patches firebase_admin and redis before app.py is imported, so
+the service starts without credentials, network or a Redis server:
+  - firebase_admin.credentials.Certificate and initialize_app do nothing
+  - firestore.client() returns a FakeFirestore holding documents in dicts
+  - redis.Redis builds fakeredis clients sharing one in-process server
+
+FakeFirestore covers the calls the service makes: documents, batches,
+get_all, where/limit/select/stream queries, Increment transforms,
+transactions (applied when the transactional function returns) and
+listeners on collections and queries, which deliver the initial snapshot
+and then every document set afterwards.
+"""
+import copy
+import functools
+import itertools
+import threading
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+from google.cloud.firestore_v1.transforms import Increment
+
+_ADDED = SimpleNamespace(name='ADDED')
+_MODIFIED = SimpleNamespace(name='MODIFIED')
+
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference: 'FakeDocumentReference', data: Optional[Dict]):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self) -> Optional[Dict]:
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field: str):
+        return (self._data or {}).get(field)
+
+
+class FakeDocumentReference:
+    def __init__(self, collection: 'FakeCollection', document_id: str):
+        self.collection = collection
+        self.id = document_id
+
+    def get(self, transaction=None) -> FakeDocumentSnapshot:
+        with self.collection.lock:
+            data = self.collection.documents.get(self.id)
+            return FakeDocumentSnapshot(self, copy.deepcopy(data) if data is not None else None)
+
+    def set(self, data: Dict, merge: bool = False):
+        with self.collection.lock:
+            existed = self.id in self.collection.documents
+            if merge and existed:
+                self.collection.documents[self.id].update(copy.deepcopy(data))
+            else:
+                self.collection.documents[self.id] = copy.deepcopy(data)
+            document = copy.deepcopy(self.collection.documents[self.id])
+        self.collection.notify(self, document, _MODIFIED if existed else _ADDED)
+
+    def update(self, data: Dict):
+        with self.collection.lock:
+            document = self.collection.documents.setdefault(self.id, {})
+            for path, value in data.items():
+                *parents, field = path.split('.')
+                target = document
+                for parent in parents:
+                    target = target.setdefault(parent, {})
+                if isinstance(value, Increment):
+                    target[field] = target.get(field, 0) + value.value
+                else:
+                    target[field] = copy.deepcopy(value)
+
+    def delete(self):
+        with self.collection.lock:
+            self.collection.documents.pop(self.id, None)
+
+
+class FakeQuery:
+    def __init__(self, collection: 'FakeCollection', filters=(), limit: Optional[int] = None):
+        self.collection = collection
+        self.filters = filters
+        self._limit = limit
+
+    def where(self, field: str, op: str, value) -> 'FakeQuery':
+        return FakeQuery(self.collection, self.filters + ((field, op, value),), self._limit)
+
+    def limit(self, count: int) -> 'FakeQuery':
+        return FakeQuery(self.collection, self.filters, count)
+
+    def select(self, fields: List[str]) -> 'FakeQuery':
+        return self
+
+    def stream(self):
+        with self.collection.lock:
+            items = list(self.collection.documents.items())
+        returned = 0
+        for document_id, data in items:
+            if not self.matches(data):
+                continue
+            if self._limit is not None and returned >= self._limit:
+                return
+            returned += 1
+            yield FakeDocumentSnapshot(FakeDocumentReference(self.collection, document_id), copy.deepcopy(data))
+
+    def get(self) -> List[FakeDocumentSnapshot]:
+        return list(self.stream())
+
+    def matches(self, data: Dict) -> bool:
+        return all(_matches(data.get(field), op, value) for field, op, value in self.filters)
+
+    def on_snapshot(self, callback):
+        """Deliver the current documents, then every later set of a matching document"""
+        changes = [SimpleNamespace(type=_ADDED, document=document) for document in self.stream()]
+        callback(None, changes, None)
+        watch = (self, callback)
+        self.collection.watches.append(watch)
+        return SimpleNamespace(unsubscribe=lambda: self.collection.watches.remove(watch))
+
+
+def _matches(actual, op: str, value) -> bool:
+    if op == '==':
+        return actual == value
+    if op == 'in':
+        return actual in value
+    if op == 'array_contains':
+        return isinstance(actual, list) and value in actual
+    # As in Firestore, range filters only match values of the filter's type
+    if actual is None or isinstance(actual, str) != isinstance(value, str):
+        return False
+    return {'>': actual > value, '>=': actual >= value, '<': actual < value, '<=': actual <= value}[op]
+
+
+class FakeCollection(FakeQuery):
+    _auto_ids = itertools.count()
+
+    def __init__(self, name: str):
+        self.name = name
+        self.documents: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+        self.watches = []
+        super().__init__(self)
+
+    def document(self, document_id: Optional[str] = None) -> FakeDocumentReference:
+        return FakeDocumentReference(self, document_id or f"auto{next(self._auto_ids)}")
+
+    def add(self, data: Dict):
+        reference = self.document()
+        reference.set(data)
+        return None, reference
+
+    def notify(self, reference: FakeDocumentReference, data: Dict, change_type):
+        for query, callback in list(self.watches):
+            if query.matches(data):
+                document = FakeDocumentSnapshot(reference, data)
+                callback(None, [SimpleNamespace(type=change_type, document=document)], None)
+
+
+class FakeWriteBatch:
+    def __init__(self):
+        self._writes = []
+
+    def set(self, reference: FakeDocumentReference, data: Dict, merge: bool = False):
+        self._writes.append(lambda: reference.set(data, merge))
+
+    def update(self, reference: FakeDocumentReference, data: Dict):
+        self._writes.append(lambda: reference.update(data))
+
+    def delete(self, reference: FakeDocumentReference):
+        self._writes.append(reference.delete)
+
+    def commit(self):
+        for write in self._writes:
+            write()
+        self._writes = []
+
+
+def transactional(function):
+    """Stand-in for firestore.transactional: run once, then commit the writes"""
+    def run(transaction, *args, **kwargs):
+        result = function(transaction, *args, **kwargs)
+        transaction.commit()
+        return result
+    return run
+
+
+class FakeFirestore:
+    def __init__(self):
+        self._collections: Dict[str, FakeCollection] = {}
+        self._lock = threading.Lock()
+
+    def collection(self, name: str) -> FakeCollection:
+        with self._lock:
+            return self._collections.setdefault(name, FakeCollection(name))
+
+    def get_all(self, references: List[FakeDocumentReference]):
+        return [reference.get() for reference in references]
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch()
+
+    def transaction(self) -> FakeWriteBatch:
+        return FakeWriteBatch()
+
+    def close(self):
+        pass
+
+
+def install() -> FakeFirestore:
+    """Patch Firebase and Redis client creation, return the fake database"""
+    import fakeredis
+    import firebase_admin
+    import redis
+    from firebase_admin import credentials, firestore
+
+    db = FakeFirestore()
+    credentials.Certificate = lambda *args, **kwargs: None
+    firebase_admin.initialize_app = lambda *args, **kwargs: None
+    firestore.client = lambda *args, **kwargs: db
+    firestore.transactional = transactional
+
+    # Every client talks to the same server, like processes sharing one Redis
+    server = fakeredis.FakeServer()
+    redis.Redis = functools.partial(fakeredis.FakeRedis, server=server)
+    return db
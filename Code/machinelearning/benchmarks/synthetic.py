@@ -0,0 +1,93 @@
+"""Synthetic menus, users and orders for benchmarks.
+
+Items belong to restaurants and cuisines; users prefer a few cuisines and
+mostly order from them, so text and collaborative signals both carry
+information. Everything is generated from one seed.
+"""
+from typing import Dict, Iterator, List
+
+import numpy as np
+
+CUISINES = (
+    'italian', 'mexican', 'japanese', 'indian', 'thai', 'chinese', 'french', 'greek',
+    'korean', 'vietnamese', 'spanish', 'lebanese', 'turkish', 'american', 'ethiopian', 'peruvian'
+)
+WORDS_PER_CUISINE = 60
+SHARED_WORDS = ('grilled', 'fried', 'roasted', 'fresh', 'house', 'classic', 'crispy', 'smoked', 'braised', 'sweet')
+DIETARY = ('vegetarian', 'vegan', 'gluten_free')
+PRICE_CATEGORIES = ('low', 'medium', 'high')
+SPICE_LEVELS = ('mild', 'medium', 'hot')
+
+
+def cuisine_words(cuisine: str) -> List[str]:
+    return [f"{cuisine[:4]}{word}" for word in range(WORDS_PER_CUISINE)]
+
+
+def menu_items(n_items: int, n_restaurants: int, rng: np.random.Generator) -> Dict[str, Dict]:
+    """Menu documents keyed by item id"""
+    vocabulary = {cuisine: cuisine_words(cuisine) for cuisine in CUISINES}
+    restaurant_cuisine = rng.integers(0, len(CUISINES), n_restaurants)
+    restaurants = rng.integers(0, n_restaurants, n_items)
+    items = {}
+    for i, restaurant in enumerate(restaurants):
+        cuisine = CUISINES[restaurant_cuisine[restaurant]]
+        words = vocabulary[cuisine]
+        peak_start = int(rng.integers(0, 22))
+        items[f"item{i}"] = {
+            'name': f"{rng.choice(SHARED_WORDS)} {' '.join(rng.choice(words, 2))}",
+            'description': ' '.join(rng.choice(words, 6)),
+            'category': cuisine,
+            'restaurant_id': f"restaurant{restaurant}",
+            'price': float(np.round(rng.uniform(4, 40), 2)),
+            'price_category': str(rng.choice(PRICE_CATEGORIES)),
+            'is_vegetarian': bool(rng.random() < 0.3),
+            'is_vegan': bool(rng.random() < 0.1),
+            'is_gluten_free': bool(rng.random() < 0.15),
+            'is_spicy': bool(rng.random() < 0.25),
+            'is_special': bool(rng.random() < 0.05),
+            'average_rating': float(np.round(rng.uniform(1, 5), 1)),
+            'order_frequency': int(rng.integers(0, 500)),
+            'preparation_time': int(rng.integers(5, 60)),
+            'peak_hours': [peak_start, peak_start + 1] if rng.random() < 0.5 else []
+        }
+    return items
+
+
+def user_preferences(n_users: int, rng: np.random.Generator) -> Dict[str, Dict]:
+    """Preference documents keyed by user id"""
+    users = {}
+    for i in range(n_users):
+        users[f"user{i}"] = {
+            'favorite_cuisines': list(rng.choice(CUISINES, int(rng.integers(1, 4)), replace=False)),
+            'dietary_restrictions': [str(d) for d in DIETARY if rng.random() < 0.1],
+            'spice_preference': str(rng.choice(SPICE_LEVELS)),
+            'price_range': str(rng.choice(PRICE_CATEGORIES))
+        }
+    return users
+
+
+def orders(
+    n_orders: int,
+    users: Dict[str, Dict],
+    items: Dict[str, Dict],
+    rng: np.random.Generator,
+    loyalty: float = 0.8
+) -> Iterator[Dict]:
+    """Orders whose lines mostly come from the user's favorite cuisines"""
+    user_ids = list(users)
+    item_ids = np.array(list(items))
+    by_cuisine = {
+        cuisine: np.array([item_id for item_id, item in items.items() if item['category'] == cuisine])
+        for cuisine in CUISINES
+    }
+    for _ in range(n_orders):
+        user_id = user_ids[int(rng.integers(0, len(user_ids)))]
+        favorites = [c for c in users[user_id]['favorite_cuisines'] if len(by_cuisine[c])]
+        lines = []
+        for _ in range(int(rng.integers(1, 4))):
+            if favorites and rng.random() < loyalty:
+                pool = by_cuisine[favorites[int(rng.integers(0, len(favorites)))]]
+            else:
+                pool = item_ids
+            lines.append({'item_id': str(pool[int(rng.integers(0, len(pool)))]), 'quantity': int(rng.integers(1, 3))})
+        yield {'user_id': user_id, 'items': lines}
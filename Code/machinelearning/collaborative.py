@@ -0,0 +1,237 @@
+"""Collaborative filtering signal from order history.
+
+Orders are streamed into a sparse user-by-item count matrix and factorized
+with implicit ALS (confidence 1 + ALPHA * count, Hu, Koren & Volinsky).
+Only the item factors are kept: a user's vector is folded in at request
+time from their order history with one small f-by-f solve, so users who
+ordered after the last training are covered and no per-user state has to
+be stored.
+"""
+import json
+import logging
+import os
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+ORDERS_COLLECTION = 'orders'
+FACTORS = 32
+REGULARIZATION = 0.1
+ALPHA = 20.0  # confidence added per ordered unit
+ITERATIONS = 15
+CG_STEPS = 3  # conjugate gradient steps per ALS half-sweep
+DOT_CHUNK = 1_000_000  # interactions per chunk when evaluating A @ x
+
+FACTORS_FILE = 'item_factors.npy'
+METADATA_FILE = 'collaborative.json'
+INTERACTIONS_FILE = 'interactions.npz'
+INTERACTION_IDS_FILE = 'interactions.json'
+
+
+def build_interactions(orders: Iterable[Dict]) -> Tuple[sparse.csr_matrix, List[str], List[str]]:
+    """Stream orders into a CSR matrix of ordered quantities per (user, item)"""
+    user_index: Dict[str, int] = {}
+    item_index: Dict[str, int] = {}
+    rows = array('i')
+    cols = array('i')
+    quantities = array('f')
+
+    for order in orders:
+        user_id = order.get('user_id')
+        if not user_id:
+            continue
+        user = user_index.setdefault(user_id, len(user_index))
+        for entry in order.get('items', []):
+            item_id = entry.get('item_id')
+            if not item_id:
+                continue
+            rows.append(user)
+            cols.append(item_index.setdefault(item_id, len(item_index)))
+            quantities.append(entry.get('quantity') or 1)
+
+    # Duplicate (user, item) pairs are summed by the conversion to CSR
+    matrix = sparse.coo_matrix(
+        (np.frombuffer(quantities, dtype=np.float32),
+         (np.frombuffer(rows, dtype=np.int32), np.frombuffer(cols, dtype=np.int32))),
+        shape=(len(user_index), len(item_index))
+    ).tocsr()
+    return matrix, list(user_index), list(item_index)
+
+
+def save_interactions(directory: str, matrix: sparse.csr_matrix, user_ids: List[str], item_ids: List[str]):
+    os.makedirs(directory, exist_ok=True)
+    sparse.save_npz(os.path.join(directory, INTERACTIONS_FILE), matrix)
+    with open(os.path.join(directory, INTERACTION_IDS_FILE), 'w') as f:
+        json.dump({'user_ids': user_ids, 'item_ids': item_ids}, f)
+
+
+def load_interactions(directory: str) -> Tuple[sparse.csr_matrix, List[str], List[str]]:
+    matrix = sparse.load_npz(os.path.join(directory, INTERACTIONS_FILE)).tocsr()
+    with open(os.path.join(directory, INTERACTION_IDS_FILE)) as f:
+        ids = json.load(f)
+    return matrix, ids['user_ids'], ids['item_ids']
+
+
+def remove_interactions(directory: str):
+    for name in (INTERACTIONS_FILE, INTERACTION_IDS_FILE):
+        os.remove(os.path.join(directory, name))
+
+
+def _conjugate_gradient(confidence: sparse.csr_matrix, X: np.ndarray, Y: np.ndarray, regularization: float, steps: int):
+    """Improve every row of X towards its ALS solution with Y fixed.
+
+    Row u solves (YtY + reg*I + Yt C_u Y) x_u = Yt (1 + C_u) p_u, where
+    confidence holds C_u - the extra confidence of observed pairs. All rows
+    are iterated together; A @ V touches only the stored interactions.
+    """
+    gram = Y.T @ Y + regularization * np.eye(Y.shape[1], dtype=Y.dtype)
+    rows = np.repeat(np.arange(confidence.shape[0], dtype=np.int32), np.diff(confidence.indptr))
+    cols = confidence.indices
+
+    def apply(V):
+        dots = np.empty(len(cols), dtype=Y.dtype)
+        for start in range(0, len(cols), DOT_CHUNK):
+            stop = start + DOT_CHUNK
+            dots[start:stop] = np.einsum('ij,ij->i', V[rows[start:stop]], Y[cols[start:stop]])
+        weighted = sparse.csr_matrix((dots * confidence.data, cols, confidence.indptr), shape=confidence.shape)
+        return V @ gram + weighted @ Y
+
+    b = sparse.csr_matrix((1 + confidence.data, cols, confidence.indptr), shape=confidence.shape) @ Y
+    residual = b - apply(X)
+    direction = residual.copy()
+    rs_old = np.einsum('ij,ij->i', residual, residual)
+    for _ in range(steps):
+        A_direction = apply(direction)
+        curvature = np.einsum('ij,ij->i', direction, A_direction)
+        step = np.divide(rs_old, curvature, out=np.zeros_like(rs_old), where=curvature > 0)
+        X += step[:, None] * direction
+        residual -= step[:, None] * A_direction
+        rs_new = np.einsum('ij,ij->i', residual, residual)
+        beta = np.divide(rs_new, rs_old, out=np.zeros_like(rs_new), where=rs_old > 0)
+        direction = residual + beta[:, None] * direction
+        rs_old = rs_new
+    return X
+
+
+def fit_implicit_als(
+    interactions: sparse.csr_matrix,
+    factors: int = FACTORS,
+    regularization: float = REGULARIZATION,
+    alpha: float = ALPHA,
+    iterations: int = ITERATIONS,
+    seed: int = 42
+) -> Tuple[np.ndarray, np.ndarray]:
+    """User and item factors of a user-by-item count matrix"""
+    rng = np.random.default_rng(seed)
+    n_users, n_items = interactions.shape
+    X = (rng.standard_normal((n_users, factors)) * 0.01).astype(np.float32)
+    Y = (rng.standard_normal((n_items, factors)) * 0.01).astype(np.float32)
+
+    user_confidence = interactions.astype(np.float32)
+    user_confidence.data *= alpha
+    item_confidence = user_confidence.T.tocsr()
+
+    for _ in range(iterations):
+        X = _conjugate_gradient(user_confidence, X, Y, regularization, CG_STEPS)
+        Y = _conjugate_gradient(item_confidence, Y, X, regularization, CG_STEPS)
+    return X, Y
+
+
+class CollaborativeModel:
+    """Item factors with request-time fold-in of a user's order history"""
+
+    def __init__(self, item_ids: List[str], item_factors: np.ndarray, regularization: float, alpha: float):
+        self.item_ids = item_ids
+        self.item_factors = item_factors
+        self.regularization = regularization
+        self.alpha = alpha
+        self.row_of = {item_id: row for row, item_id in enumerate(item_ids)}
+        factors = np.asarray(item_factors, dtype=np.float64)
+        self.gram = factors.T @ factors + regularization * np.eye(factors.shape[1])
+        # (menu version, menu factors), replaced as one reference so readers
+        # never pair a version with the factors of another menu
+        self._menu: Optional[Tuple[str, Tuple[np.ndarray, np.ndarray]]] = None
+
+    @classmethod
+    def train(cls, interactions: sparse.csr_matrix, item_ids: List[str], **params) -> 'CollaborativeModel':
+        params.setdefault('regularization', REGULARIZATION)
+        params.setdefault('alpha', ALPHA)
+        _, item_factors = fit_implicit_als(interactions, **params)
+        return cls(item_ids, item_factors, params['regularization'], params['alpha'])
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, FACTORS_FILE), self.item_factors)
+        with open(os.path.join(directory, METADATA_FILE), 'w') as f:
+            json.dump({
+                'item_ids': self.item_ids,
+                'regularization': self.regularization,
+                'alpha': self.alpha
+            }, f)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> 'CollaborativeModel':
+        with open(os.path.join(directory, METADATA_FILE)) as f:
+            metadata = json.load(f)
+        item_factors = np.load(os.path.join(directory, FACTORS_FILE), mmap_mode='r' if mmap else None)
+        return cls(metadata['item_ids'], item_factors, metadata['regularization'], metadata['alpha'])
+
+    def user_vector(self, history: List[str]) -> Optional[np.ndarray]:
+        """ALS user factors for an order history, None when no item is known"""
+        counts = Counter(item_id for item_id in history if item_id in self.row_of)
+        if not counts:
+            return None
+        rows = [self.row_of[item_id] for item_id in counts]
+        confidence = self.alpha * np.array(list(counts.values()), dtype=np.float64)
+        factors = np.asarray(self.item_factors[rows], dtype=np.float64)
+        A = self.gram + (factors.T * confidence) @ factors
+        return np.linalg.solve(A, factors.T @ (1 + confidence))
+
+    def menu_factors(self, menu_item_ids: List[str], version: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Mask of menu items with factors and their factor rows, kept per menu version
+
+        Factor rows are aligned with the menu, zero where the mask is False.
+        """
+        cached = self._menu
+        if version is not None and cached is not None and cached[0] == version:
+            return cached[1]
+
+        rows = np.array([self.row_of.get(item_id, -1) for item_id in menu_item_ids], dtype=np.int64)
+        known = rows >= 0
+        factors = np.zeros((len(rows), self.item_factors.shape[1]), dtype=np.float32)
+        factors[known] = self.item_factors[rows[known]]
+        menu_factors = (known, factors)
+        if version is not None:
+            self._menu = (version, menu_factors)
+        return menu_factors
+
+    def menu_scores(
+        self,
+        user: np.ndarray,
+        menu_item_ids: List[str],
+        version: Optional[str] = None,
+        rows: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """Predicted preference in [0, 1] of a folded-in user, NaN for items without factors
+
+        With rows, only those menu rows are scored.
+        """
+        known, factors = self.menu_factors(menu_item_ids, version)
+        if rows is not None:
+            known, factors = known[rows], factors[rows]
+        return np.where(known, np.clip(factors @ user.astype(np.float32), 0.0, 1.0), np.nan)
+
+    def scores(self, history: List[str], menu_item_ids: List[str], version: Optional[str] = None) -> Optional[np.ndarray]:
+        """Predicted preference in [0, 1] per menu item, NaN for items without factors.
+
+        Returns None for cold-start users whose history has no known item.
+        """
+        user = self.user_vector(history or [])
+        if user is None:
+            return None
+        return self.menu_scores(user, menu_item_ids, version)
@@ -1,15 +1,115 @@
 import numpy as np
-import pandas as pd
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.preprocessing import StandardScaler, OneHotEncoder
-from sklearn.compose import ColumnTransformer
-from sklearn.pipeline import Pipeline
-from datetime import datetime, timedelta
+from itertools import chain
+from datetime import datetime
 import joblib
+import logging
+import os
+import sys
+from lean_pricing import CATEGORY_SPLIT, NUMERIC_SPLIT, LeanPricingModel
+from price_grid import PriceGrid
+import time
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_CATEGORIES = {
+    'weather_condition': ['sunny', 'rainy', 'cloudy'],
+    'event_type': ['none', 'sports', 'concert', 'festival'],
+    'category': ['appetizer', 'main', 'dessert', 'beverage']
+}
+# Continuous features interpolated on the price grid and their knot counts,
+# the other continuous features are held at their training median
+PRICE_GRID_KNOTS = {
+    'current_demand': 6,
+    'inventory_level': 6
+}
+PRICE_GRID_CHUNK = 200_000
+
+HISTORY_CHUNK_ROWS = 1_000_000  # rows read and fitted at a time by train_out_of_core
+TREES_PER_CHUNK = 10  # trees added per chunk of history
+TRAINING_JOBS = -1  # fit trees on all cores
+RANDOM_STATE = 42
+
+SAMPLE_DTYPES = {
+    'base_price': np.float32,
+    'hour': np.int8,
+    'day_of_week': np.int8,
+    'is_weekend': np.int8,
+    'is_holiday': np.int8,
+    'current_demand': np.int8,
+    'competitor_price_ratio': np.float32,
+    'historical_sales': np.int16,
+    'inventory_level': np.int8,
+    'preparation_time': np.int8,
+    'price_multiplier': np.float32
+}
+
+def float32_split_bound(thresholds):
+    """Bound in float64 equivalent to sklearn's float32 split test
+
+    Trees compare float32(x) <= threshold. That holds exactly when x is
+    below the midpoint between the largest float32 not above the threshold
+    and the next float32, so folding that midpoint keeps raw-space splits
+    on the same side as the original ones.
+    """
+    lower = thresholds.astype(np.float32)
+    above = lower.astype(np.float64) > thresholds
+    lower[above] = np.nextafter(lower[above], np.float32(-np.inf))
+    upper = np.nextafter(lower, np.float32(np.inf))
+    return (lower.astype(np.float64) + upper.astype(np.float64)) / 2
+
+def _memory_mb():
+    """Current and peak resident set size of the process in MB, None where unavailable"""
+    try:
+        with open('/proc/self/status') as f:
+            fields = dict(line.split(':', 1) for line in f if line.startswith(('VmRSS:', 'VmHWM:')))
+        return round(int(fields['VmRSS'].split()[0]) / 1024, 1), round(int(fields['VmHWM'].split()[0]) / 1024, 1)
+    except (OSError, KeyError, ValueError):
+        pass
+    if sys.platform == 'win32':
+        return None, None
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return None, round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+class TrainingRun:
+    """Wall time and peak memory of one training run.
+
+    The peak is the process high-water mark, so the growth over the RSS at
+    the start is only known when the run set a new peak, None otherwise.
+    """
+
+    def __init__(self, mode):
+        self.report = {'mode': mode, 'rows': 0, 'chunks': 0}
+
+    def __enter__(self):
+        self.rss_before, self.peak_before = _memory_mb()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.report['wall_seconds'] = round(time.perf_counter() - self.started, 3)
+        _, peak = _memory_mb()
+        self.report['rss_before_mb'] = self.rss_before
+        self.report['peak_rss_mb'] = peak
+        self.report['peak_rss_growth_mb'] = (
+            round(peak - self.rss_before, 1)
+            if self.rss_before is not None and peak is not None and peak > self.peak_before else None
+        )
+        return False
+
+    def add_chunk(self, rows):
+        self.report['rows'] += rows
+        self.report['chunks'] += 1
 
 class DynamicPricingML:
-    def __init__(self):
+    def __init__(self, precompute_grid=False):
         self.model = None
+        self.precompute_grid = precompute_grid
+        self.price_grid = None
+        self.price_grid_report = None
+        self.training_report = None
         self.price_multiplier_bounds = (0.8, 1.3)  # Min and max price multipliers
         self.feature_columns = [
             'hour', 'day_of_week', 'is_weekend', 'is_holiday',
@@ -17,136 +117,531 @@ class DynamicPricingML:
             'weather_condition', 'event_type', 'historical_sales',
             'inventory_level', 'category', 'preparation_time'
         ]
+        self.numeric_features = [
+            'hour', 'day_of_week', 'is_weekend', 'is_holiday',
+            'current_demand', 'competitor_price_ratio',
+            'historical_sales', 'inventory_level', 'preparation_time'
+        ]
+        self.categorical_features = ['weather_condition', 'event_type', 'category']
+
+    def prepare_sample_data(self, n_samples=10000, seed=42):
+        """Generate sample historical data for training
+
+        Draws from a RandomState seeded with `seed` in the same order as the
+        original per-row generator, so the default call returns the same
+        data it always has.
+        """
+        import pandas as pd
+
+        rng = np.random.RandomState(seed)
+        data = self._sample_features(rng, n_samples)
+        noise = rng.normal(0, 0.05, n_samples)
+        data['price_multiplier'] = self._price_multiplier_targets(data, noise)
+        for column, categories in SAMPLE_CATEGORIES.items():
+            data[column] = np.array(categories)[data[column]]
+        return pd.DataFrame(data)
 
-    def prepare_sample_data(self):
-        """Generate sample historical data for training"""
-        np.random.seed(42)
-        n_samples = 10000
-
-        data = {
-            'base_price': np.random.uniform(5, 50, n_samples),
-            'hour': np.random.randint(0, 24, n_samples),
-            'day_of_week': np.random.randint(0, 7, n_samples),
-            'is_weekend': np.random.randint(0, 2, n_samples),
-            'is_holiday': np.random.randint(0, 2, n_samples),
-            'current_demand': np.random.randint(0, 100, n_samples),
-            'competitor_price_ratio': np.random.uniform(0.8, 1.2, n_samples),
-            'weather_condition': np.random.choice(['sunny', 'rainy', 'cloudy'], n_samples),
-            'event_type': np.random.choice(['none', 'sports', 'concert', 'festival'], n_samples),
-            'historical_sales': np.random.randint(0, 1000, n_samples),
-            'inventory_level': np.random.randint(0, 100, n_samples),
-            'category': np.random.choice(['appetizer', 'main', 'dessert', 'beverage'], n_samples),
-            'preparation_time': np.random.randint(5, 60, n_samples)
+    def generate_sample_data(self, n_samples, chunk_size=1_000_000, seed=42, compact=True):
+        """Yield sample training data as DataFrames of at most chunk_size rows
+
+        Seed contract: chunk i is drawn from its own generator seeded with
+        SeedSequence(seed, spawn_key=(i,)), so the output depends only on
+        (seed, chunk_size) and chunks can be produced independently. With
+        compact=True columns use the smallest fitting dtypes and pandas
+        categoricals.
+        """
+        import pandas as pd
+
+        for chunk_index, start in enumerate(range(0, n_samples, chunk_size)):
+            rows = min(chunk_size, n_samples - start)
+            rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(chunk_index,)))
+            data = self._sample_features(rng, rows)
+            noise = rng.normal(0, 0.05, rows)
+            data['price_multiplier'] = self._price_multiplier_targets(data, noise)
+
+            for column, categories in SAMPLE_CATEGORIES.items():
+                data[column] = pd.Categorical.from_codes(data[column], categories=categories)
+            chunk = pd.DataFrame(data, index=pd.RangeIndex(start, start + rows))
+            if compact:
+                yield chunk.astype(SAMPLE_DTYPES)
+            else:
+                yield chunk.astype({column: object for column in SAMPLE_CATEGORIES})
+
+    def write_sample_shards(self, directory, n_samples, chunk_size=1_000_000, seed=42):
+        """Write generated sample data as one Parquet file per chunk"""
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for shard, chunk in enumerate(self.generate_sample_data(n_samples, chunk_size, seed)):
+            path = os.path.join(directory, f"sample-{shard:05d}.parquet")
+            chunk.to_parquet(path, index=False)
+            paths.append(path)
+        return paths
+
+    def _sample_features(self, rng, n_samples):
+        """Draw the raw feature columns, works with RandomState and Generator
+
+        Categorical columns are returned as codes into SAMPLE_CATEGORIES.
+        Drawing codes consumes the same random stream as RandomState.choice.
+        """
+        integers = rng.integers if hasattr(rng, 'integers') else rng.randint
+
+        return {
+            'base_price': rng.uniform(5, 50, n_samples),
+            'hour': integers(0, 24, n_samples),
+            'day_of_week': integers(0, 7, n_samples),
+            'is_weekend': integers(0, 2, n_samples),
+            'is_holiday': integers(0, 2, n_samples),
+            'current_demand': integers(0, 100, n_samples),
+            'competitor_price_ratio': rng.uniform(0.8, 1.2, n_samples),
+            'weather_condition': integers(0, len(SAMPLE_CATEGORIES['weather_condition']), n_samples),
+            'event_type': integers(0, len(SAMPLE_CATEGORIES['event_type']), n_samples),
+            'historical_sales': integers(0, 1000, n_samples),
+            'inventory_level': integers(0, 100, n_samples),
+            'category': integers(0, len(SAMPLE_CATEGORIES['category']), n_samples),
+            'preparation_time': integers(5, 60, n_samples)
         }
 
-        # Generate target price multipliers with some business logic
-        multipliers = []
-        for i in range(n_samples):
-            base_multiplier = 1.0
-
-            # Peak hours adjustment (lunch and dinner times)
-            if 11 <= data['hour'][i] <= 13 or 18 <= data['hour'][i] <= 20:
-                base_multiplier *= 1.1
+    def _price_multiplier_targets(self, data, noise):
+        """Generate target price multipliers with some business logic"""
+        hour = data['hour']
+        base_multiplier = np.ones(len(hour))
 
-            # Weekend adjustment
-            if data['is_weekend'][i]:
-                base_multiplier *= 1.05
+        # Peak hours adjustment (lunch and dinner times)
+        base_multiplier[((11 <= hour) & (hour <= 13)) | ((18 <= hour) & (hour <= 20))] *= 1.1
 
-            # Holiday adjustment
-            if data['is_holiday'][i]:
-                base_multiplier *= 1.15
+        # Weekend adjustment
+        base_multiplier[data['is_weekend'] != 0] *= 1.05
 
-            # Demand adjustment
-            demand_factor = data['current_demand'][i] / 100
-            base_multiplier *= (1 + 0.2 * demand_factor)
+        # Holiday adjustment
+        base_multiplier[data['is_holiday'] != 0] *= 1.15
 
-            # Weather adjustment
-            if data['weather_condition'][i] == 'rainy':
-                base_multiplier *= 0.95
+        # Demand adjustment
+        demand_factor = data['current_demand'] / 100
+        base_multiplier *= (1 + 0.2 * demand_factor)
 
-            # Event adjustment
-            if data['event_type'][i] != 'none':
-                base_multiplier *= 1.1
+        # Weather adjustment
+        base_multiplier[data['weather_condition'] == SAMPLE_CATEGORIES['weather_condition'].index('rainy')] *= 0.95
 
-            # Inventory adjustment
-            if data['inventory_level'][i] < 20:
-                base_multiplier *= 1.1
-            elif data['inventory_level'][i] > 80:
-                base_multiplier *= 0.9
+        # Event adjustment
+        base_multiplier[data['event_type'] != SAMPLE_CATEGORIES['event_type'].index('none')] *= 1.1
 
-            # Add some random noise
-            noise = np.random.normal(0, 0.05)
-            multiplier = base_multiplier + noise
+        # Inventory adjustment
+        inventory = data['inventory_level']
+        base_multiplier[inventory < 20] *= 1.1
+        base_multiplier[inventory > 80] *= 0.9
 
-            # Clip to bounds
-            multiplier = np.clip(multiplier, self.price_multiplier_bounds[0], self.price_multiplier_bounds[1])
-            multipliers.append(multiplier)
+        # Add some random noise and clip to bounds
+        return np.clip(
+            base_multiplier + noise,
+            self.price_multiplier_bounds[0],
+            self.price_multiplier_bounds[1]
+        )
 
-        data['price_multiplier'] = multipliers
-        return pd.DataFrame(data)
+    def train_model(self, data=None, n_jobs=TRAINING_JOBS):
+        """Train the pricing model on a DataFrame holding the whole history"""
+        from sklearn.pipeline import Pipeline
 
-    def train_model(self, data=None):
-        """Train the pricing model"""
         if data is None:
             data = self.prepare_sample_data()
 
-        # Create preprocessing pipeline
-        numeric_features = [
-            'hour', 'day_of_week', 'is_weekend', 'is_holiday',
-            'current_demand', 'competitor_price_ratio',
-            'historical_sales', 'inventory_level', 'preparation_time'
-        ]
-        categorical_features = ['weather_condition', 'event_type', 'category']
-
-        preprocessor = ColumnTransformer(
-            transformers=[
-                ('num', StandardScaler(), numeric_features),
-                ('cat', OneHotEncoder(drop='first', sparse=False), categorical_features)
+        with TrainingRun('full') as run:
+            self.model = Pipeline([
+                ('preprocessor', self._preprocessor()),
+                ('regressor', self._forest(100, n_jobs))
             ])
 
-        # Create and train the model pipeline
+            X = data[self.feature_columns]
+            y = data['price_multiplier']
+
+            self.model.fit(X, y)
+            run.add_chunk(len(data))
+            self._finish_training(run, data)
+        self._record_run(run)
+        return self
+
+    def read_history(self, paths, chunk_size=HISTORY_CHUNK_ROWS, columns=None):
+        """Yield history from Parquet or CSV files as DataFrames of at most chunk_size rows
+
+        Numeric columns are read as float32 and categorical ones as pandas
+        categoricals, so a chunk takes a fraction of the memory of the
+        default dtypes.
+        """
+        import pandas as pd
+
+        columns = columns or self.feature_columns + ['price_multiplier']
+        dtypes = {
+            column: 'category' if column in self.categorical_features else np.float32
+            for column in columns
+        }
+        for path in paths:
+            if path.endswith('.parquet'):
+                import pyarrow.parquet as pq
+
+                batches = (
+                    batch.to_pandas()
+                    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns)
+                )
+            else:
+                batches = pd.read_csv(path, usecols=columns, dtype=dtypes, chunksize=chunk_size)
+            for chunk in batches:
+                yield chunk.astype(dtypes)
+
+    def scan_categories(self, paths, chunk_size=HISTORY_CHUNK_ROWS):
+        """Sorted values of every categorical feature over the history, reading only those columns"""
+        values = {column: set() for column in self.categorical_features}
+        for chunk in self.read_history(paths, chunk_size, columns=self.categorical_features):
+            for column in self.categorical_features:
+                values[column].update(chunk[column].dropna().unique().tolist())
+        return {column: sorted(str(value) for value in found) for column, found in values.items()}
+
+    def train_out_of_core(self, paths, chunk_size=HISTORY_CHUNK_ROWS, trees_per_chunk=TREES_PER_CHUNK,
+                          n_jobs=TRAINING_JOBS):
+        """Train on history files too large for memory, one chunk at a time
+
+        A first pass reads only the categorical columns to fix the one-hot
+        categories. The second fits trees_per_chunk trees on each chunk, so
+        memory is bounded by the chunk size rather than the history. The
+        scaler is fitted on the first chunk; trees do not depend on the
+        scaling, only on it being the same for every chunk.
+        """
+        from sklearn.pipeline import Pipeline
+
+        categories = self.scan_categories(paths, chunk_size)
+        chunks = self.read_history(paths, chunk_size)
+        first = next(chunks, None)
+        if first is None:
+            raise ValueError("No training history in the given files.")
+
+        preprocessor = self._preprocessor(categories, dtype=np.float32)
+        preprocessor.fit(first[self.feature_columns])
         self.model = Pipeline([
             ('preprocessor', preprocessor),
-            ('regressor', RandomForestRegressor(
-                n_estimators=100,
-                max_depth=10,
-                min_samples_split=5,
-                min_samples_leaf=2,
-                random_state=42
-            ))
+            ('regressor', self._forest(0, n_jobs))
         ])
+        return self._fit_chunks(chain([first], chunks), trees_per_chunk, None, n_jobs, 'out_of_core')
 
-        X = data[self.feature_columns]
-        y = data['price_multiplier']
+    def update_model(self, chunks, trees_per_chunk=TREES_PER_CHUNK, max_trees=None, n_jobs=TRAINING_JOBS):
+        """Add trees fitted on new history instead of retraining
 
-        self.model.fit(X, y)
+        chunks is an iterable of DataFrames, such as read_history of the
+        files since the last training. With max_trees, the oldest trees are
+        dropped once the forest grows beyond it, so the model follows
+        recent history. Categories must be ones the model was trained on.
+        """
+        if self.model is None:
+            raise ValueError("Model not trained. Call train_model() first.")
+        return self._fit_chunks(chunks, trees_per_chunk, max_trees, n_jobs, 'incremental')
+
+    def _fit_chunks(self, chunks, trees_per_chunk, max_trees, n_jobs, mode):
+        preprocessor = self.model.named_steps['preprocessor']
+        forest = self.model.named_steps['regressor']
+        forest.set_params(warm_start=True, n_jobs=n_jobs)
+        last = None
+        with TrainingRun(mode) as run:
+            for chunk in chunks:
+                X = preprocessor.transform(chunk[self.feature_columns])
+                trees = len(getattr(forest, 'estimators_', []))
+                # A new seed per chunk, trees dropped by max_trees do not repeat theirs
+                forest.set_params(n_estimators=trees + trees_per_chunk, random_state=RANDOM_STATE + run.report['chunks'] + trees)
+                forest.fit(X, chunk['price_multiplier'].to_numpy())
+                if max_trees is not None and len(forest.estimators_) > max_trees:
+                    forest.estimators_ = forest.estimators_[-max_trees:]
+                    forest.set_params(n_estimators=max_trees)
+                run.add_chunk(len(chunk))
+                last = chunk
+
+            if last is None:
+                raise ValueError("No training history in the given chunks.")
+            forest.set_params(warm_start=False)
+            self._finish_training(run, last)
+        self._record_run(run)
         return self
 
+    def _preprocessor(self, categories=None, dtype=np.float64):
+        """Scaler for numeric features and one-hot encoding kept sparse for categorical ones.
+
+        The encoded blocks are only made dense when the combined matrix is
+        dense enough, which it is for these features, as trees fit sparse
+        input several times slower.
+        """
+        from sklearn.compose import ColumnTransformer
+        from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+        return ColumnTransformer(
+            transformers=[
+                ('num', StandardScaler(), self.numeric_features),
+                ('cat', OneHotEncoder(
+                    categories=[categories[column] for column in self.categorical_features] if categories else 'auto',
+                    drop='first',
+                    handle_unknown='ignore',
+                    sparse_output=True,
+                    dtype=dtype
+                ), self.categorical_features)
+            ])
+
+    def _forest(self, n_estimators, n_jobs):
+        from sklearn.ensemble import RandomForestRegressor
+
+        return RandomForestRegressor(
+            n_estimators=n_estimators,
+            max_depth=10,
+            min_samples_split=5,
+            min_samples_leaf=2,
+            random_state=RANDOM_STATE,
+            n_jobs=n_jobs
+        )
+
+    def _finish_training(self, run, data):
+        # Serving predicts small batches, where tree threads cost more than they save
+        forest = self.model.named_steps['regressor']
+        forest.set_params(n_jobs=None)
+        run.report['trees'] = len(forest.estimators_)
+
+        # Keep the price grid in line with the new model
+        if self.precompute_grid or self.price_grid is not None:
+            self.build_price_grid(data)
+
+    def _record_run(self, run):
+        self.training_report = run.report
+        logger.info(f"Trained pricing model: {run.report}")
+
+    def build_price_grid(self, data, knots=None, n_eval=5000):
+        """Evaluate the model over a discretized feature grid
+
+        Discrete features take every value, continuous features in `knots`
+        get that many quantile knots from `data` and the remaining ones are
+        fixed at their median. Returns a report with the grid size, build
+        time and the approximation error of lookups against the full model
+        on up to n_eval rows of `data`.
+        """
+        if self.model is None:
+            raise ValueError("Model not trained. Call train_model() first.")
+
+        started = time.perf_counter()
+        knots = knots or PRICE_GRID_KNOTS
+        encoder = self.model.named_steps['preprocessor'].named_transformers_['cat']
+
+        discrete = [
+            ('hour', list(range(24))),
+            ('day_of_week', list(range(7))),
+            ('is_weekend', [0, 1]),
+            ('is_holiday', [0, 1])
+        ]
+        discrete += [
+            (column, [str(category) for category in encoder.categories_[position]])
+            for position, column in enumerate(self.categorical_features)
+        ]
+        knot_axes = [
+            (column, sorted(set(np.quantile(data[column].astype(np.float64), np.linspace(0, 1, count)).tolist())))
+            for column, count in knots.items()
+        ]
+        discrete_columns = {column for column, _ in discrete}
+        fixed = {
+            column: float(data[column].median())
+            for column in self.numeric_features
+            if column not in discrete_columns and column not in knots
+        }
+
+        shape = tuple(len(values) for _, values in discrete + knot_axes)
+        size = int(np.prod(shape))
+        multipliers = np.empty(size, dtype=np.float32)
+        for start in range(0, size, PRICE_GRID_CHUNK):
+            stop = min(start + PRICE_GRID_CHUNK, size)
+            points = PriceGrid.grid_points(discrete, knot_axes, fixed, start, stop)
+            multipliers[start:stop] = self.predict_encoded(self.encode_features(points))
+
+        self.price_grid = PriceGrid(discrete, knot_axes, fixed, multipliers.reshape(shape))
+
+        sample = data.sample(min(n_eval, len(data)), random_state=0)
+        errors = np.abs(self.price_grid.lookup({
+            column: sample[column].to_numpy() for column in self.feature_columns
+        }) - self.predict_many(sample))
+        self.price_grid_report = {
+            'cells': size,
+            'bytes': multipliers.nbytes,
+            'build_seconds': round(time.perf_counter() - started, 3),
+            'mean_abs_error': float(errors.mean()),
+            'p99_abs_error': float(np.quantile(errors, 0.99)),
+            'max_abs_error': float(errors.max())
+        }
+        return self.price_grid_report
+
+    def lookup_price_multipliers(self, features):
+        """Price multipliers from the precomputed grid"""
+        if self.price_grid is None:
+            raise ValueError("No price grid. Call build_price_grid() first.")
+
+        return np.clip(
+            self.price_grid.lookup(features),
+            self.price_multiplier_bounds[0],
+            self.price_multiplier_bounds[1]
+        )
+
     def predict_price_multiplier(self, features_dict):
         """Predict price multiplier for given features"""
+        return self.predict_many([features_dict])[0]
+
+    def predict_many(self, features):
+        """Predict price multipliers for a batch of items in one model call
+
+        features can be a DataFrame, a list of feature dicts or a dict of
+        equally long columns.
+        """
+        import pandas as pd
+
         if self.model is None:
             raise ValueError("Model not trained. Call train_model() first.")
 
-        # Create a DataFrame with the input features
-        features_df = pd.DataFrame([features_dict])
+        if not isinstance(features, pd.DataFrame):
+            features = pd.DataFrame(features)
 
-        # Make prediction
-        predicted_multiplier = self.model.predict(features_df)[0]
-
-        # Clip to bounds
-        predicted_multiplier = np.clip(
-            predicted_multiplier,
+        # Make prediction and clip to bounds
+        return np.clip(
+            self.model.predict(features),
             self.price_multiplier_bounds[0],
             self.price_multiplier_bounds[1]
         )
 
-        return predicted_multiplier
+    def encode_features(self, features):
+        """Encode raw features into the matrix the regressor expects
+
+        Applies the fitted scaler and one-hot encoding with NumPy only, which
+        avoids building a DataFrame. features can be a dict of columns or a
+        list of feature dicts. Callers repricing the same items repeatedly
+        can encode once and pass the result to predict_encoded. Categories
+        the encoder was not fitted on are encoded as all zeros, as
+        OneHotEncoder does with handle_unknown='ignore'.
+        """
+        if self.model is None:
+            raise ValueError("Model not trained. Call train_model() first.")
+
+        if not isinstance(features, dict):
+            features = {column: [row[column] for row in features] for column in self.feature_columns}
+
+        preprocessor = self.model.named_steps['preprocessor']
+        scaler = preprocessor.named_transformers_['num']
+        encoder = preprocessor.named_transformers_['cat']
+
+        numeric = np.column_stack([
+            np.asarray(features[column], dtype=np.float64) for column in self.numeric_features
+        ])
+        blocks = [(numeric - scaler.mean_) / scaler.scale_]
+
+        for position, column in enumerate(self.categorical_features):
+            categories = encoder.categories_[position]
+            # Looked up as objects, a cast to the categories' dtype would truncate or coerce values
+            code_of = {category: code for code, category in enumerate(categories.tolist())}
+            codes = np.array([code_of.get(value, -1) for value in features[column]], dtype=np.intp)
+
+            one_hot = codes[:, None] == np.arange(len(categories))
+            drop = encoder.drop_idx_[position] if encoder.drop_idx_ is not None else None
+            if drop is not None:
+                one_hot = np.delete(one_hot, drop, axis=1)
+            blocks.append(one_hot)
+
+        return np.hstack(blocks).astype(np.float64)
+
+    def predict_encoded(self, encoded):
+        """Predict price multipliers from a matrix built by encode_features"""
+        if self.model is None:
+            raise ValueError("Model not trained. Call train_model() first.")
+
+        return np.clip(
+            self.model.named_steps['regressor'].predict(encoded),
+            self.price_multiplier_bounds[0],
+            self.price_multiplier_bounds[1]
+        )
 
     def calculate_dynamic_price(self, base_price, features_dict):
         """Calculate final dynamic price"""
         multiplier = self.predict_price_multiplier(features_dict)
         return round(base_price * multiplier, 2)
 
+    def calculate_dynamic_prices(self, base_prices, features):
+        """Calculate final dynamic prices for a batch of items"""
+        multipliers = self.predict_many(features)
+        return np.round(np.asarray(base_prices, dtype=np.float64) * multipliers, 2)
+
+    def export_forest(self, directory):
+        """Export the trained forest as flat arrays for LeanPricingModel
+
+        The StandardScaler is folded into numeric thresholds
+        (x_scaled <= t becomes x <= t * scale + mean, with t widened to the
+        float32 rounding boundary the trees really split on) and one-hot splits
+        become equality tests on category codes, so the exported model
+        runs on raw features.
+        """
+        if self.model is None:
+            raise ValueError("No model to export. Train the model first.")
+
+        preprocessor = self.model.named_steps['preprocessor']
+        scaler = preprocessor.named_transformers_['num']
+        encoder = preprocessor.named_transformers_['cat']
+        forest = self.model.named_steps['regressor']
+
+        # Map every encoded column back to a raw feature and how to test it
+        column_feature = []
+        column_kind = []
+        column_code = []
+        for position, column in enumerate(self.numeric_features):
+            column_feature.append(self.feature_columns.index(column))
+            column_kind.append(NUMERIC_SPLIT)
+            column_code.append(position)
+        for position, column in enumerate(self.categorical_features):
+            drop = encoder.drop_idx_[position] if encoder.drop_idx_ is not None else None
+            for code in range(len(encoder.categories_[position])):
+                if code == drop:
+                    continue
+                column_feature.append(self.feature_columns.index(column))
+                column_kind.append(CATEGORY_SPLIT)
+                column_code.append(code)
+
+        arrays = {name: [] for name in ('feature', 'kind', 'threshold', 'left', 'right', 'value')}
+        roots = []
+        offset = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            internal = tree.children_left != -1
+            encoded_column = np.where(internal, tree.feature, 0)
+            kind = np.array(column_kind)[encoded_column]
+            code = np.array(column_code)[encoded_column]
+
+            numeric = internal & (kind == NUMERIC_SPLIT)
+            threshold = np.where(
+                numeric,
+                float32_split_bound(tree.threshold) * scaler.scale_[code] + scaler.mean_[code],
+                code
+            )
+
+            arrays['feature'].append(np.where(internal, np.array(column_feature)[encoded_column], -2))
+            arrays['kind'].append(kind)
+            arrays['threshold'].append(np.where(internal, threshold, 0.0))
+            arrays['left'].append(np.where(internal, tree.children_left + offset, -1))
+            arrays['right'].append(np.where(internal, tree.children_right + offset, -1))
+            arrays['value'].append(tree.value[:, 0, 0])
+            roots.append(offset)
+            offset += tree.node_count
+
+        dtypes = {
+            'feature': np.int32, 'kind': np.uint8, 'threshold': np.float64,
+            'left': np.int32, 'right': np.int32, 'value': np.float64
+        }
+        arrays = {name: np.concatenate(parts).astype(dtypes[name]) for name, parts in arrays.items()}
+        arrays['roots'] = np.array(roots, dtype=np.int32)
+
+        metadata = {
+            'feature_columns': self.feature_columns,
+            'categories': {
+                column: [str(category) for category in encoder.categories_[position]]
+                for position, column in enumerate(self.categorical_features)
+            },
+            'price_multiplier_bounds': list(self.price_multiplier_bounds),
+            'max_depth': int(max(estimator.tree_.max_depth for estimator in forest.estimators_)),
+            'n_trees': len(forest.estimators_)
+        }
+        LeanPricingModel.save(directory, arrays, metadata)
+        return directory
+
     def save_model(self, filepath):
         """Save the trained model"""
         if self.model is None:
@@ -0,0 +1,531 @@
+"""Append-only log of recommendation events in fixed-size binary records.
+
+Every /recommend appends one record (user, recommended item ids, scores,
+served model version, time) to the active segment of its process, a
+plain write into the page cache. A background thread fsyncs every
+FSYNC_INTERVAL seconds or FSYNC_EVENTS records, and rotates the segment
+once it reaches SEGMENT_BYTES or SEGMENT_SECONDS, which seals it:
+
+    <log dir>/<started ns>-<pid>.open    active segment of one process
+    <log dir>/<started ns>-<pid>.seg     sealed segment, ready to export
+    <log dir>/<started ns>-<pid>.names   id of every hash in the segment
+
+Ids are stored as 64-bit hashes so records keep a fixed size; the names
+file of a segment maps them back. A segment is a 16 byte header followed
+by records of EVENT_DTYPE, so readers memory-map it as a NumPy array,
+active segments included (up to their last complete record).
+
+An EventExporter claims sealed segments, merges them (oldest first) into
+one compacted segment in the export directory (e.g. a mounted bucket)
+and deletes them. Training jobs read the exported segments with
+read_events. Delivery is at-least-once: a crash between writing a
+compacted segment and deleting its sources exports those events again.
+"""
+import hashlib
+import logging
+import os
+import struct
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import orjson
+
+logger = logging.getLogger(__name__)
+
+EVENT_LOG_DIR = 'event_log'
+EXPORT_DIR = 'event_export'
+EVENT_ITEMS = 10  # items kept per event, the service's MAX_RECOMMENDATIONS
+SEGMENT_BYTES = 64 * 1024 * 1024  # about 440k events per segment
+SEGMENT_SECONDS = 300  # seal segments at least every 5 minutes
+FSYNC_INTERVAL = 1.0  # seconds of events lost at most on a machine crash
+FSYNC_EVENTS = 1000  # events that wake the syncer before FSYNC_INTERVAL
+EXPORT_INTERVAL = 60  # seconds between exports
+EXPORT_BYTES = 256 * 1024 * 1024  # sealed segments merged into one compacted segment
+CLAIM_TIMEOUT = 600  # seconds before segments claimed by a dead exporter are retried
+
+MAGIC = b'RECEVT\x00\x01'
+HEADER = struct.Struct('<8sII')  # magic, record size, items per record
+EVENT_DTYPE = np.dtype([
+    ('timestamp', '<f8'),  # seconds since the epoch
+    ('user', '<u8'),  # id_hash of the user id
+    ('model_version', '<u8'),  # id_hash of the served model version, 0 without one
+    ('items', '<u8', (EVENT_ITEMS,)),  # id_hash of the recommended items, best first
+    ('scores', '<f4', (EVENT_ITEMS,)),
+    ('count', '<u4')  # recommended items, items and scores are zero after them
+], align=True)
+RECORD = struct.Struct(f"<dQQ{EVENT_ITEMS}Q{EVENT_ITEMS}fI4x")
+assert RECORD.size == EVENT_DTYPE.itemsize
+
+OPEN_SUFFIX = '.open'
+SEGMENT_SUFFIX = '.seg'
+CLAIMED_SUFFIX = '.claimed'
+NAMES_SUFFIX = '.names'
+
+
+def id_hash(value: Optional[str]) -> int:
+    """64-bit hash of an id, the same in every process, 0 for no id"""
+    if not value:
+        return 0
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def id_hashes(values: Iterable[str]) -> np.ndarray:
+    """id_hash of every id, e.g. to match menu item ids against logged items"""
+    return np.fromiter((id_hash(value) for value in values), dtype=np.uint64)
+
+
+def segment_header() -> bytes:
+    return HEADER.pack(MAGIC, EVENT_DTYPE.itemsize, EVENT_ITEMS)
+
+
+def read_segment(path: str) -> np.ndarray:
+    """Records of a segment file, memory-mapped read-only"""
+    with open(path, 'rb') as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return np.empty(0, dtype=EVENT_DTYPE)
+    magic, record_size, items = HEADER.unpack(header)
+    if magic != MAGIC or record_size != EVENT_DTYPE.itemsize or items != EVENT_ITEMS:
+        raise ValueError(f"{path} is not an event segment of this format")
+    # A segment being appended to can end in a partly written record
+    count = (os.path.getsize(path) - HEADER.size) // EVENT_DTYPE.itemsize
+    if not count:
+        return np.empty(0, dtype=EVENT_DTYPE)
+    return np.memmap(path, dtype=EVENT_DTYPE, mode='r', offset=HEADER.size, shape=(count,))
+
+
+def names_path(path: str) -> str:
+    return os.path.splitext(path)[0] + NAMES_SUFFIX
+
+
+def read_names(path: str) -> Dict[int, str]:
+    """Id of every hash in the segment at path"""
+    names = {}
+    try:
+        with open(names_path(path), 'rb') as f:
+            for line in f:
+                # The last line of an active segment can be partly written
+                if line.endswith(b'\n'):
+                    hashed, name = orjson.loads(line)
+                    names[hashed] = name
+    except FileNotFoundError:
+        pass
+    return names
+
+
+def segment_files(directory: str) -> List[str]:
+    """Sealed or exported segments in directory, oldest first"""
+    if not os.path.isdir(directory):
+        return []
+    return [
+        os.path.join(directory, name) for name in sorted(os.listdir(directory))
+        if name.endswith(SEGMENT_SUFFIX) and not name.startswith('.')
+    ]
+
+
+def iter_segments(directory: str) -> Iterator[Tuple[str, np.ndarray]]:
+    """Path and memory-mapped records of every segment in directory, one at a time"""
+    for path in segment_files(directory):
+        records = read_segment(path)
+        if len(records):
+            yield path, records
+
+
+def read_events(directory: str) -> Tuple[np.ndarray, Dict[int, str]]:
+    """All events of the segments in directory as one array, and the ids of their hashes"""
+    chunks = []
+    names = {}
+    for path, records in iter_segments(directory):
+        chunks.append(records)
+        names.update(read_names(path))
+    if not chunks:
+        return np.empty(0, dtype=EVENT_DTYPE), names
+    return np.concatenate(chunks), names
+
+
+def event_summary(directory: str) -> Dict:
+    """Counts over the segments in directory, read one segment at a time"""
+    events = 0
+    users = []
+    items = []
+    first, last = np.inf, -np.inf
+    for _, records in iter_segments(directory):
+        events += len(records)
+        first = min(first, float(records['timestamp'].min()))
+        last = max(last, float(records['timestamp'].max()))
+        users.append(np.unique(records['user']))
+        shown = records['items'][np.arange(EVENT_ITEMS) < records['count'][:, None]]
+        items.append(np.unique(shown))
+    if not events:
+        return {'events': 0}
+    return {
+        'events': events,
+        'users': int(len(np.unique(np.concatenate(users)))),
+        'items': int(len(np.unique(np.concatenate(items)))),
+        'first': datetime.fromtimestamp(first).isoformat(),
+        'last': datetime.fromtimestamp(last).isoformat()
+    }
+
+
+def _fsync_directory(directory: str):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _pid_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class _Segment:
+    """Open files of the active segment"""
+
+    def __init__(self, directory: str):
+        self.stem = os.path.join(directory, f"{time.time_ns()}-{os.getpid()}")
+        self.path = self.stem + OPEN_SUFFIX
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self.names_fd = os.open(self.stem + NAMES_SUFFIX, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        os.write(self.fd, segment_header())
+        self.opened_at = time.time()
+        self.size = HEADER.size
+        self.records = 0
+        # Hashes whose id is already in the names file
+        self.names = {0}
+
+    def fsync(self):
+        # Names first, so synced records never lack their ids
+        os.fsync(self.names_fd)
+        os.fsync(self.fd)
+
+    def seal(self) -> str:
+        os.close(self.names_fd)
+        os.close(self.fd)
+        sealed = self.stem + SEGMENT_SUFFIX
+        os.rename(self.path, sealed)
+        return sealed
+
+
+class EventLog:
+    """Appends recommendation events to local segments with batched fsyncs"""
+
+    def __init__(
+        self,
+        directory: str = EVENT_LOG_DIR,
+        segment_bytes: int = SEGMENT_BYTES,
+        segment_seconds: float = SEGMENT_SECONDS,
+        fsync_interval: float = FSYNC_INTERVAL,
+        fsync_events: int = FSYNC_EVENTS
+    ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.fsync_interval = fsync_interval
+        self.fsync_events = fsync_events
+
+        self._active: Optional[_Segment] = None
+        self._retired: List[_Segment] = []
+        self._unsynced = 0
+        self._lock = threading.Lock()
+        # Held while fsyncing and sealing, so a segment is never closed mid-fsync
+        self._sync_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._counts = {'appended': 0, 'failed': 0, 'fsyncs': 0, 'sealed': 0, 'recovered': 0}
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.recover()
+        self._thread = threading.Thread(target=self._run, name='event-log-sync', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Sync and seal the active segment"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            if self._active is not None:
+                self._retired.append(self._active)
+                self._active = None
+        self.sync()
+
+    def append(
+        self,
+        user_id: str,
+        item_ids: List[str],
+        scores: List[float],
+        model_version: Optional[str] = None,
+        timestamp: Optional[float] = None
+    ):
+        """Append one event, durable after the next fsync"""
+        count = min(len(item_ids), EVENT_ITEMS)
+        hashes = [id_hash(item_id) for item_id in item_ids[:count]]
+        padding = EVENT_ITEMS - count
+        record = RECORD.pack(
+            time.time() if timestamp is None else timestamp,
+            id_hash(user_id),
+            id_hash(model_version),
+            *hashes, *([0] * padding),
+            *[float(score or 0.0) for score in scores[:count]], *([0.0] * padding),
+            count
+        )
+        named = [(id_hash(user_id), user_id), (id_hash(model_version), model_version)]
+        named.extend(zip(hashes, item_ids))
+
+        with self._lock:
+            try:
+                if self._active is None:
+                    self._active = _Segment(self.directory)
+                segment = self._active
+                names = b''.join(
+                    orjson.dumps([hashed, name]) + b'\n'
+                    for hashed, name in named if hashed not in segment.names
+                )
+                if names:
+                    os.write(segment.names_fd, names)
+                    segment.names.update(hashed for hashed, _ in named)
+                os.write(segment.fd, record)
+            except Exception:
+                self._counts['failed'] += 1
+                raise
+            segment.size += len(record)
+            segment.records += 1
+            self._counts['appended'] += 1
+            self._unsynced += 1
+            if segment.size >= self.segment_bytes:
+                # Sealed by the syncer, appends continue in a new segment
+                self._retired.append(segment)
+                self._active = None
+            wake = self._unsynced >= self.fsync_events or bool(self._retired)
+        if wake:
+            self._wakeup.set()
+
+    def sync(self) -> int:
+        """Fsync appended events and seal full or old segments, returns the events synced"""
+        with self._sync_lock:
+            with self._lock:
+                active = self._active
+                if active is not None and time.time() - active.opened_at >= self.segment_seconds:
+                    self._retired.append(active)
+                    self._active = active = None
+                retired, self._retired = self._retired, []
+                unsynced, self._unsynced = self._unsynced, 0
+
+            if unsynced:
+                for segment in retired + ([active] if active is not None else []):
+                    segment.fsync()
+                self._counts['fsyncs'] += 1
+            for segment in retired:
+                segment.seal()
+                self._counts['sealed'] += 1
+            if retired:
+                _fsync_directory(self.directory)
+            return unsynced
+
+    def recover(self) -> int:
+        """Seal the active segments of processes that exited, returns how many"""
+        recovered = 0
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(OPEN_SUFFIX):
+                continue
+            stem = name[:-len(OPEN_SUFFIX)]
+            try:
+                pid = int(stem.rsplit('-', 1)[1])
+            except (IndexError, ValueError):
+                continue
+            if pid != os.getpid() and _pid_running(pid):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                # Drop a record the process was writing when it died
+                size = os.path.getsize(path)
+                complete = HEADER.size + (size - HEADER.size) // EVENT_DTYPE.itemsize * EVENT_DTYPE.itemsize
+                if size != complete:
+                    os.truncate(path, complete if size >= HEADER.size else 0)
+                os.rename(path, os.path.join(self.directory, stem + SEGMENT_SUFFIX))
+                recovered += 1
+            except FileNotFoundError:
+                # Recovered by another worker
+                pass
+        self._counts['recovered'] += recovered
+        if recovered:
+            logger.info(f"Recovered {recovered} event log segments of exited processes")
+        return recovered
+
+    def stats(self) -> Dict:
+        with self._lock:
+            active = self._active
+            return dict(
+                self._counts,
+                unsynced=self._unsynced,
+                active_segment=os.path.basename(active.path) if active is not None else None,
+                active_records=active.records if active is not None else 0
+            )
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.fsync_interval)
+            self._wakeup.clear()
+            try:
+                self.sync()
+            except Exception as e:
+                logger.error(f"Error syncing event log: {str(e)}")
+
+
+class EventExporter:
+    """Merges sealed segments into compacted segments in the export directory.
+
+    Several processes can export from the same log directory: segments are
+    claimed by renaming them, which only one process succeeds at.
+    """
+
+    def __init__(
+        self,
+        directory: str = EVENT_LOG_DIR,
+        destination: str = EXPORT_DIR,
+        interval: float = EXPORT_INTERVAL,
+        max_bytes: int = EXPORT_BYTES
+    ):
+        self.directory = directory
+        self.destination = destination
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._counts = {'exports': 0, 'segments': 0, 'events': 0, 'bytes': 0, 'failed_exports': 0}
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        os.makedirs(self.destination, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='event-exporter', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def export(self) -> int:
+        """Export one batch of sealed segments, returns the events exported"""
+        with self._lock:
+            claimed = self._claim()
+            if not claimed:
+                return 0
+            try:
+                events = self._compact(claimed)
+            except Exception as e:
+                self._release(claimed)
+                self._counts['failed_exports'] += 1
+                logger.error(f"Error exporting event segments: {str(e)}")
+                return 0
+
+            for path in claimed:
+                os.remove(path)
+                try:
+                    os.remove(names_path(path))
+                except FileNotFoundError:
+                    pass
+            self._counts['exports'] += 1
+            self._counts['segments'] += len(claimed)
+            self._counts['events'] += events
+            return events
+
+    def stats(self) -> Dict:
+        return dict(self._counts, pending_segments=len(segment_files(self.directory)))
+
+    def _claim(self) -> List[str]:
+        """Claim the oldest sealed (or abandoned) segments up to max_bytes"""
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name.endswith(CLAIMED_SUFFIX) and os.path.getmtime(path) < now - CLAIM_TIMEOUT:
+                    os.rename(path, path[:-len(CLAIMED_SUFFIX)] + SEGMENT_SUFFIX)
+            except FileNotFoundError:
+                pass
+
+        claimed = []
+        size = 0
+        for path in segment_files(self.directory):
+            if size >= self.max_bytes:
+                break
+            target = path[:-len(SEGMENT_SUFFIX)] + CLAIMED_SUFFIX
+            try:
+                os.rename(path, target)
+                os.utime(target)
+            except FileNotFoundError:
+                # Claimed by another exporter
+                continue
+            claimed.append(target)
+            size += os.path.getsize(target)
+        return claimed
+
+    def _release(self, claimed: List[str]):
+        for path in claimed:
+            try:
+                os.rename(path, path[:-len(CLAIMED_SUFFIX)] + SEGMENT_SUFFIX)
+            except FileNotFoundError:
+                pass
+
+    def _compact(self, claimed: List[str]) -> int:
+        """Write the claimed segments, oldest first, as one segment with their names.
+
+        Records are streamed from the memory-mapped segments, so an export
+        never holds more than one page range of them in memory.
+        """
+        segments = [read_segment(path) for path in claimed]
+        names = {}
+        for path in claimed:
+            names.update(read_names(path))
+        first = next((float(records['timestamp'][0]) for records in segments if len(records)), time.time())
+        stem = os.path.join(
+            self.destination,
+            f"events-{datetime.fromtimestamp(first).strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        )
+
+        # Names first, so an exported segment never lacks its ids
+        self._write(stem + NAMES_SUFFIX, [orjson.dumps([hashed, name]) + b'\n' for hashed, name in names.items()])
+        self._write(stem + SEGMENT_SUFFIX, [segment_header()] + [memoryview(records) for records in segments if len(records)])
+        _fsync_directory(self.destination)
+
+        events = sum(len(records) for records in segments)
+        self._counts['bytes'] += HEADER.size + events * EVENT_DTYPE.itemsize
+        logger.info(f"Exported {events} recommendation events from {len(claimed)} segments to {stem}{SEGMENT_SUFFIX}")
+        return events
+
+    @staticmethod
+    def _write(path: str, chunks: List):
+        """Write a file in the export directory atomically"""
+        temporary = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+        with open(temporary, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                # Drain while full batches are waiting
+                while self.export() and len(segment_files(self.directory)) and not self._stop.is_set():
+                    pass
+            except Exception as e:
+                logger.error(f"Error in event exporter: {str(e)}")
@@ -0,0 +1,338 @@
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+FEEDBACK_COLLECTION = 'feedback'
+MENU_COLLECTION = 'menu_items'
+MAX_QUEUE_DEPTH = 100000  # pending feedback before enqueue is refused
+FLUSH_BATCH_SIZE = 250  # feedback records per flush, with their item updates one batched write
+FLUSH_INTERVAL = 1.0  # seconds between flushes when the queue is not full
+MAX_BATCH_WRITES = 500  # Firestore limit per batched write
+CLAIM_TIMEOUT = 60  # seconds before a batch claimed by a dead flusher is retried
+MAX_ATTEMPTS = 8  # failed flushes of a record before it is committed alone and parked if rejected
+MAX_BACKOFF = 60  # seconds between flushes while commits keep failing
+
+
+class QueueFull(Exception):
+    """Raised when the feedback queue is at MAX_QUEUE_DEPTH"""
+
+
+class FeedbackPipeline:
+    """Write-behind pipeline for feedback ingestion.
+
+    Requests append feedback to a SQLite write-ahead queue on local disk
+    and return at once. A background flusher claims the oldest batch,
+    coalesces ratings per item and commits the feedback documents together
+    with `Increment` updates of the item statistics in one atomic batched
+    write, then removes the batch from the queue. Claims let several
+    worker processes share one queue file. Delivery is at-least-once: feedback documents have
+    stable ids, but a crash between commit and dequeue re-applies the
+    increments of that batch.
+
+    Records that cannot be decoded are moved to the `feedback_dead_letter`
+    table at once. A batch that failed MAX_ATTEMPTS times is committed
+    record by record and the records Firestore rejects are parked there
+    too, until `requeue_dead_letters` puts them back.
+    """
+
+    def __init__(
+        self,
+        db,
+        path: str,
+        menu_item: Callable[[str], Optional[Dict]],
+        on_flush: Optional[Callable[[Dict[str, Tuple[int, float]]], None]] = None,
+        max_depth: int = MAX_QUEUE_DEPTH,
+        batch_size: int = FLUSH_BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+        max_attempts: int = MAX_ATTEMPTS
+    ):
+        self.db = db
+        self.menu_item = menu_item
+        self.on_flush = on_flush
+        self.max_depth = max_depth
+        # Every record adds at most one item update, so a flush fits in one batched write
+        self.batch_size = min(batch_size, MAX_BATCH_WRITES // 2)
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA busy_timeout=5000')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS feedback_queue ('
+            'seq INTEGER PRIMARY KEY AUTOINCREMENT, payload BLOB NOT NULL, '
+            'claimed_by TEXT, claimed_at REAL, attempts INTEGER NOT NULL DEFAULT 0)'
+        )
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(feedback_queue)')}
+        if 'attempts' not in columns:
+            # Queue files created before attempts were counted
+            self._conn.execute('ALTER TABLE feedback_queue ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS feedback_queue_claim ON feedback_queue (claimed_by)')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS feedback_dead_letter ('
+            'seq INTEGER PRIMARY KEY, payload BLOB NOT NULL, attempts INTEGER NOT NULL, '
+            'error TEXT, failed_at REAL)'
+        )
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._failures = 0
+        self._metrics = {
+            'enqueued': 0,
+            'rejected': 0,
+            'flushed': 0,
+            'flushes': 0,
+            'failed_flushes': 0,
+            'dead_lettered': 0,
+            'last_flush_seconds': 0.0,
+            'max_flush_seconds': 0.0,
+            'total_flush_seconds': 0.0
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='feedback-flusher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, flush: bool = True):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        if flush:
+            while self.flush():
+                pass
+
+    def enqueue(self, feedback_data: Dict) -> str:
+        """Durably queue one feedback record and return its feedback id"""
+        with self._lock:
+            depth = self._queue_depth()
+            if depth >= self.max_depth:
+                self._metrics['rejected'] += 1
+                raise QueueFull(f"Feedback queue is full ({depth} pending)")
+
+            feedback_id = uuid.uuid4().hex
+            payload = orjson.dumps({'id': feedback_id, 'data': feedback_data})
+            self._conn.execute('INSERT INTO feedback_queue (payload) VALUES (?)', (payload,))
+            self._metrics['enqueued'] += 1
+
+        if depth + 1 >= self.batch_size:
+            self._wakeup.set()
+        return feedback_id
+
+    def _queue_depth(self) -> int:
+        """Pending records, an upper bound read from the sequence range in O(1)"""
+        low, high = self._conn.execute('SELECT MIN(seq), MAX(seq) FROM feedback_queue').fetchone()
+        return 0 if low is None else high - low + 1
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            metrics = dict(
+                self._metrics,
+                queue_depth=self._queue_depth(),
+                dead_letter_depth=self._conn.execute('SELECT COUNT(*) FROM feedback_dead_letter').fetchone()[0]
+            )
+        flushes = metrics['flushes']
+        metrics['avg_flush_seconds'] = metrics['total_flush_seconds'] / flushes if flushes else 0.0
+        return metrics
+
+    def flush(self) -> int:
+        """Commit one batch from the queue, returns the number of records flushed"""
+        with self._flush_lock:
+            return self._flush()
+
+    def requeue_dead_letters(self) -> int:
+        """Move parked records back to the queue, e.g. after an outage, returns their number"""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                count = self._conn.execute(
+                    'INSERT INTO feedback_queue (payload) SELECT payload FROM feedback_dead_letter ORDER BY seq'
+                ).rowcount
+                self._conn.execute('DELETE FROM feedback_dead_letter')
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        self._wakeup.set()
+        return count
+
+    def _claim(self) -> Tuple[str, List]:
+        """Claim the oldest unclaimed (or abandoned) batch for this flusher"""
+        token = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'UPDATE feedback_queue SET claimed_by = ?, claimed_at = ? WHERE seq IN ('
+                'SELECT seq FROM feedback_queue WHERE claimed_by IS NULL OR claimed_at < ? '
+                'ORDER BY seq LIMIT ?)',
+                (token, now, now - CLAIM_TIMEOUT, self.batch_size)
+            )
+            rows = self._conn.execute(
+                'SELECT seq, payload, attempts FROM feedback_queue WHERE claimed_by = ? ORDER BY seq', (token,)
+            ).fetchall()
+        return token, rows
+
+    def _flush(self) -> int:
+        token, rows = self._claim()
+        if not rows:
+            return 0
+
+        started = time.perf_counter()
+        records = {}
+        for seq, payload, _ in rows:
+            try:
+                record = orjson.loads(payload)
+                self._coalesce([record])
+            except Exception as e:
+                self._park(seq, f"Invalid feedback record: {str(e)}")
+                continue
+            records[seq] = record
+
+        if max(attempts for _, _, attempts in rows) < self.max_attempts:
+            try:
+                if records:
+                    self._commit(list(records.values()), self._coalesce(list(records.values())))
+            except Exception as e:
+                with self._lock:
+                    self._conn.execute(
+                        'UPDATE feedback_queue SET claimed_by = NULL, attempts = attempts + 1 WHERE claimed_by = ?',
+                        (token,)
+                    )
+                    self._metrics['failed_flushes'] += 1
+                self._failures += 1
+                logger.error(f"Error flushing feedback batch: {str(e)}")
+                return 0
+            flushed = list(records.values())
+        else:
+            # The batch keeps failing, commit its records alone to find the ones Firestore rejects
+            flushed = []
+            for seq, record in records.items():
+                try:
+                    self._commit([record], self._coalesce([record]))
+                    flushed.append(record)
+                except Exception as e:
+                    self._park(seq, str(e))
+
+        deltas = self._coalesce(flushed)
+        with self._lock:
+            self._conn.execute('DELETE FROM feedback_queue WHERE claimed_by = ?', (token,))
+            elapsed = time.perf_counter() - started
+            self._metrics['flushed'] += len(flushed)
+            self._metrics['flushes'] += 1
+            self._metrics['last_flush_seconds'] = elapsed
+            self._metrics['max_flush_seconds'] = max(self._metrics['max_flush_seconds'], elapsed)
+            self._metrics['total_flush_seconds'] += elapsed
+        self._failures = 0
+
+        if self.on_flush is not None and deltas:
+            try:
+                self.on_flush(deltas)
+            except Exception as e:
+                logger.error(f"Error in feedback flush callback: {str(e)}")
+        return len(rows)
+
+    def _park(self, seq: int, error: str):
+        """Move one queued record to the dead letter table"""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.execute(
+                    'INSERT INTO feedback_dead_letter (seq, payload, attempts, error, failed_at) '
+                    'SELECT seq, payload, attempts, ?, ? FROM feedback_queue WHERE seq = ?',
+                    (error, time.time(), seq)
+                )
+                self._conn.execute('DELETE FROM feedback_queue WHERE seq = ?', (seq,))
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._metrics['dead_lettered'] += 1
+        logger.error(f"Moved feedback record {seq} to the dead letter table: {error}")
+
+    def _coalesce(self, records: List[Dict]) -> Dict[str, Tuple[int, float]]:
+        """Per-item rating count and sum of a batch"""
+        counts = defaultdict(int)
+        sums = defaultdict(float)
+        for record in records:
+            item_id = record['data']['item_id']
+            counts[item_id] += 1
+            sums[item_id] += record['data']['rating']
+        return {item_id: (counts[item_id], sums[item_id]) for item_id in counts}
+
+    def _commit(self, records: List[Dict], deltas: Dict[str, Tuple[int, float]]):
+        from firebase_admin import firestore
+
+        writes = []
+        for record in records:
+            writes.append(('set', self.db.collection(FEEDBACK_COLLECTION).document(record['id']), record['data']))
+
+        now = datetime.now().isoformat()
+        for item_id, (count, rating_sum) in deltas.items():
+            item = self.menu_item(item_id)
+            if item is None:
+                logger.error(f"Skipping statistics of unknown menu item {item_id}")
+                continue
+            if not (item.get('statistics') or {}).get('rating_sum_seeded'):
+                self._seed_rating_sum(item_id)
+            writes.append(('update', self.db.collection(MENU_COLLECTION).document(item_id), {
+                'statistics.rating_count': firestore.Increment(count),
+                'statistics.rating_sum': firestore.Increment(rating_sum),
+                'statistics.last_updated': now
+            }))
+
+        # One batch, so a failed flush retried later never re-applies increments
+        batch = self.db.batch()
+        for operation, ref, data in writes:
+            getattr(batch, operation)(ref, data)
+        batch.commit()
+
+    def _seed_rating_sum(self, item_id: str):
+        """Seed statistics.rating_sum of a document that predates it.
+
+        Such documents only have rating_count and average_rating. The sum
+        is derived from them once, in a transaction, so flushers in other
+        processes neither seed it twice nor lose an increment in between.
+        """
+        from firebase_admin import firestore
+
+        reference = self.db.collection(MENU_COLLECTION).document(item_id)
+
+        @firestore.transactional
+        def seed(transaction):
+            statistics = (reference.get(transaction=transaction).to_dict() or {}).get('statistics') or {}
+            if statistics.get('rating_sum_seeded'):
+                return
+            transaction.update(reference, {
+                'statistics.rating_sum': (statistics.get('average_rating') or 0) * (statistics.get('rating_count') or 0),
+                'statistics.rating_sum_seeded': True
+            })
+
+        seed(self.db.transaction())
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self._failures:
+                # Back off while commits fail, so an outage does not use up the attempts of a batch
+                self._stop.wait(min(self.flush_interval * 2 ** self._failures, MAX_BACKOFF))
+            else:
+                self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                # Drain while full batches are waiting
+                while self.flush() >= self.batch_size and not self._stop.is_set():
+                    pass
+            except Exception as e:
+                logger.error(f"Error in feedback flusher: {str(e)}")
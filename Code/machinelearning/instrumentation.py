@@ -0,0 +1,254 @@
+"""Request timing spans, latency histograms and sampled profiling.
+
+Spans time the stages of a request into Prometheus histograms. Every
+process counts into its own buckets and folds them into Redis hashes every
+FLUSH_INTERVAL seconds, so /metrics shows the totals of all workers
+whichever worker answers the scrape. A disabled registry hands out one
+shared no-op span, so instrumented code costs a method call.
+
+Profiling is opt-in: with a sample rate of N, every Nth request runs under
+cProfile and its stats are kept only when the request was slow.
+"""
+import cProfile
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'metrics'
+FLUSH_INTERVAL = 10  # seconds between folds of local counts into Redis
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROFILE_SLOW_SECONDS = 0.5  # sampled requests faster than this are not written
+PROFILE_DIR = 'profiles'
+
+SPAN_METRIC = 'recommender_span_seconds'
+REQUEST_METRIC = 'recommender_request_seconds'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_NULL_SPAN = nullcontext()
+
+
+class Histogram:
+    """Latency histogram with one series per combination of label values"""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        # label values -> [count per bucket, the last one above every bound], sum
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bucket] += 1
+            series[1] += value
+
+    def drain(self) -> Dict[Tuple[str, ...], list]:
+        """Take the counts observed since the last drain"""
+        with self._lock:
+            series, self._series = self._series, {}
+        return series
+
+    def merge(self, series: Dict[Tuple[str, ...], list]):
+        """Add drained counts back, e.g. after a failed flush"""
+        with self._lock:
+            for label_values, (counts, total) in series.items():
+                current = self._series.setdefault(label_values, [[0] * (len(self.buckets) + 1), 0.0])
+                current[0] = [a + b for a, b in zip(current[0], counts)]
+                current[1] += total
+
+    def render(self, series: Dict[Tuple[str, ...], list]) -> List[str]:
+        """Prometheus text exposition of cumulative series"""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values in sorted(series):
+            counts, total = series[label_values]
+            labels = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, label_values))
+            prefix = f"{labels}," if labels else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class _Span:
+    __slots__ = ('histogram', 'name', 'started')
+
+    def __init__(self, histogram: Histogram, name: str):
+        self.histogram = histogram
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, self.name)
+        return False
+
+
+class MetricsRegistry:
+    """Histograms of one process, aggregated across processes through Redis"""
+
+    def __init__(self, redis_client=None, enabled: bool = True, flush_interval: float = FLUSH_INTERVAL, prefix: str = KEY_PREFIX):
+        self.redis = redis_client
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.prefix = prefix
+        self.spans = Histogram(SPAN_METRIC, 'Time spent in a stage of a request', ('span',))
+        self.requests = Histogram(REQUEST_METRIC, 'Time to answer a request', ('route', 'method', 'status'))
+        self.histograms = [self.spans, self.requests]
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.enabled and self.redis is not None:
+            self._thread = threading.Thread(target=self._run, name='metrics-flusher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def span(self, name: str):
+        """Context manager timing one stage of a request"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self.spans, name)
+
+    def observe_request(self, route: str, method: str, status: int, seconds: float):
+        if self.enabled:
+            self.requests.observe(seconds, route, method, str(status))
+
+    def flush(self):
+        """Fold the counts observed since the last flush into Redis"""
+        if self.redis is None:
+            return
+        with self._flush_lock:
+            for histogram in self.histograms:
+                series = histogram.drain()
+                if not series:
+                    continue
+                key = f"{self.prefix}:{histogram.name}"
+                try:
+                    pipe = self.redis.pipeline(transaction=False)
+                    for label_values, (counts, total) in series.items():
+                        field = '\x1f'.join(label_values)
+                        for bucket, count in enumerate(counts):
+                            if count:
+                                pipe.hincrby(key, f"{field}:{bucket}", count)
+                        pipe.hincrbyfloat(key, f"{field}:sum", total)
+                    pipe.execute()
+                except Exception as e:
+                    histogram.merge(series)
+                    logger.error(f"Error flushing metrics: {str(e)}")
+
+    def render(self) -> str:
+        """Prometheus text exposition of all histograms"""
+        self.flush()
+        lines = []
+        for histogram in self.histograms:
+            lines.extend(histogram.render(self._totals(histogram)))
+        return '\n'.join(lines) + '\n'
+
+    def _totals(self, histogram: Histogram) -> Dict[Tuple[str, ...], list]:
+        if self.redis is None:
+            # Single process: the local counts are the totals, keep them
+            series = histogram.drain()
+            histogram.merge(series)
+            return series
+
+        series: Dict[Tuple[str, ...], list] = {}
+        for field, value in self.redis.hgetall(f"{self.prefix}:{histogram.name}").items():
+            labels, _, slot = field.rpartition(':')
+            label_values = tuple(labels.split('\x1f'))
+            counts, total = series.setdefault(label_values, [[0] * (len(histogram.buckets) + 1), 0.0])
+            if slot == 'sum':
+                series[label_values][1] = float(value)
+            else:
+                counts[int(slot)] = int(value)
+        return series
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+
+class RequestProfiler:
+    """cProfile every Nth request and keep the profiles of slow ones.
+
+    One profile runs at a time per process; sampled requests that overlap
+    a running profile are skipped.
+    """
+
+    def __init__(self, sample_rate: int = 0, slow_seconds: float = PROFILE_SLOW_SECONDS, directory: str = PROFILE_DIR):
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self.directory = directory
+        self._requests = 0
+        self._active = False
+        self._lock = threading.Lock()
+
+    def start(self) -> Optional[cProfile.Profile]:
+        """A running profile if this request is sampled, otherwise None"""
+        if not self.sample_rate:
+            return None
+        with self._lock:
+            self._requests += 1
+            if self._requests % self.sample_rate or self._active:
+                return None
+            self._active = True
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def finish(self, profile: cProfile.Profile, name: str, seconds: float):
+        profile.disable()
+        try:
+            if seconds >= self.slow_seconds:
+                os.makedirs(self.directory, exist_ok=True)
+                slug = re.sub(r'[^A-Za-z0-9]+', '_', name).strip('_') or 'request'
+                path = os.path.join(self.directory, f"{slug}-{int(time.time() * 1000)}-{os.getpid()}.prof")
+                profile.dump_stats(path)
+                logger.info(f"Slow request {name} took {seconds:.3f}s, profile written to {path}")
+        except Exception as e:
+            logger.error(f"Error writing profile: {str(e)}")
+        finally:
+            with self._lock:
+                self._active = False
+
+    @contextmanager
+    def profile(self, name: str):
+        """Profile the enclosed block when it is sampled"""
+        profile = self.start()
+        if profile is None:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.finish(profile, name, time.perf_counter() - started)
@@ -0,0 +1,280 @@
+import logging
+import math
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MENU_COLLECTION = 'menu_items'
+TREND_HALF_LIFE = 6 * 3600  # seconds for a trending contribution to halve
+REFRESH_INTERVAL = 10  # seconds between refreshes of the recommender view
+CHECKPOINT_INTERVAL = 300  # seconds between Firestore checkpoints
+STATS_SHARDS = 16
+MAX_BATCH_WRITES = 500
+
+DECAY_RATE = math.log(2) / TREND_HALF_LIFE
+STAT_FIELDS = ('rating_count', 'rating_sum', 'order_count', 'trend_score', 'trend_at')
+
+# Seeds the hash from the document statistics on first use, then applies
+# the rating/order deltas and decays the trending score to ARGV[7]
+UPDATE_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 0 then
+    redis.call('hset', KEYS[1], 'rating_count', ARGV[1], 'rating_sum', ARGV[2],
+               'order_count', ARGV[3], 'trend_score', 0, 'trend_at', ARGV[7])
+end
+redis.call('hincrby', KEYS[1], 'rating_count', ARGV[4])
+redis.call('hincrbyfloat', KEYS[1], 'rating_sum', ARGV[5])
+redis.call('hincrby', KEYS[1], 'order_count', ARGV[6])
+local values = redis.call('hmget', KEYS[1], 'trend_score', 'trend_at')
+local elapsed = math.max(tonumber(ARGV[7]) - tonumber(values[2]), 0)
+local score = tonumber(values[1]) * math.exp(-tonumber(ARGV[8]) * elapsed) + tonumber(ARGV[9])
+redis.call('hset', KEYS[1], 'trend_score', tostring(score), 'trend_at', ARGV[7])
+return 1
+"""
+
+
+def document_seed(item: Optional[Dict]) -> Tuple[int, float, int]:
+    """Rating count, rating sum and order count recorded on a menu document.
+
+    rating_sum is only used once the feedback pipeline seeded it from the
+    legacy average, before that it covers part of rating_count at most.
+    """
+    if not item:
+        return 0, 0.0, 0
+    statistics = item.get('statistics') or {}
+    rating_count = int(statistics.get('rating_count', 0))
+    rating_sum = statistics.get('rating_sum')
+    if rating_sum is None or not statistics.get('rating_sum_seeded'):
+        rating_sum = (statistics.get('average_rating') or 0) * rating_count
+    return rating_count, float(rating_sum), int(item.get('order_frequency', 0))
+
+
+def summarize(stats: Dict, now: float) -> Dict:
+    """Derived statistics of one item, with the trending score decayed to now"""
+    rating_count = int(stats['rating_count'])
+    elapsed = max(now - float(stats['trend_at']), 0)
+    return {
+        'rating_count': rating_count,
+        'average_rating': float(stats['rating_sum']) / rating_count if rating_count else None,
+        'order_frequency': int(stats['order_count']),
+        'trending_score': float(stats['trend_score']) * math.exp(-DECAY_RATE * elapsed)
+    }
+
+
+class ShardedItemStats:
+    """In-memory item statistics split over independently locked shards.
+
+    The statistics are those of one process only, so this store is meant
+    for a single worker. Several workers need RedisItemStats.
+    """
+
+    def __init__(self, shards: int = STATS_SHARDS):
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+
+    def _shard(self, item_id: str):
+        return self._shards[hash(item_id) % len(self._shards)]
+
+    def record(
+        self,
+        item_id: str,
+        seed: Tuple[int, float, int],
+        rating_count: int = 0,
+        rating_sum: float = 0.0,
+        order_count: int = 0,
+        now: Optional[float] = None
+    ):
+        now = now or time.time()
+        values, lock = self._shard(item_id)
+        with lock:
+            stats = values.get(item_id)
+            if stats is None:
+                stats = values[item_id] = {
+                    'rating_count': seed[0], 'rating_sum': seed[1], 'order_count': seed[2],
+                    'trend_score': 0.0, 'trend_at': now
+                }
+            stats['rating_count'] += rating_count
+            stats['rating_sum'] += rating_sum
+            stats['order_count'] += order_count
+            decay = math.exp(-DECAY_RATE * max(now - stats['trend_at'], 0))
+            stats['trend_score'] = stats['trend_score'] * decay + rating_count + order_count
+            stats['trend_at'] = now
+
+    def record_many(self, updates: Iterable[Tuple[str, Tuple[int, float, int], int, float, int]], now=None):
+        for item_id, seed, rating_count, rating_sum, order_count in updates:
+            self.record(item_id, seed, rating_count, rating_sum, order_count, now)
+
+    def get_many(self, item_ids: List[str], now: Optional[float] = None) -> List[Optional[Dict]]:
+        now = now or time.time()
+        result = []
+        for item_id in item_ids:
+            values, lock = self._shard(item_id)
+            with lock:
+                stats = values.get(item_id)
+                result.append(summarize(stats, now) if stats is not None else None)
+        return result
+
+
+class RedisItemStats:
+    """Item statistics in Redis hashes, updated by an atomic Lua script"""
+
+    def __init__(self, redis_client, prefix: str = 'item_stats'):
+        self.redis = redis_client
+        self.prefix = prefix
+        self._update = redis_client.register_script(UPDATE_SCRIPT)
+
+    def record_many(self, updates: Iterable[Tuple[str, Tuple[int, float, int], int, float, int]], now=None):
+        now = now or time.time()
+        pipeline = self.redis.pipeline(transaction=False)
+        for item_id, seed, rating_count, rating_sum, order_count in updates:
+            self._update(
+                keys=[f"{self.prefix}:{item_id}"],
+                args=[seed[0], seed[1], seed[2], rating_count, rating_sum, order_count,
+                      now, DECAY_RATE, rating_count + order_count],
+                client=pipeline
+            )
+        pipeline.execute()
+
+    def record(self, item_id, seed, rating_count=0, rating_sum=0.0, order_count=0, now=None):
+        self.record_many([(item_id, seed, rating_count, rating_sum, order_count)], now)
+
+    def get_many(self, item_ids: List[str], now: Optional[float] = None) -> List[Optional[Dict]]:
+        now = now or time.time()
+        pipeline = self.redis.pipeline(transaction=False)
+        for item_id in item_ids:
+            pipeline.hmget(f"{self.prefix}:{item_id}", *STAT_FIELDS)
+        result = []
+        for values in pipeline.execute():
+            if values[0] is None:
+                result.append(None)
+            else:
+                result.append(summarize(dict(zip(STAT_FIELDS, values)), now))
+        return result
+
+
+class LiveItemStats:
+    """Statistics of every menu item aligned with one catalog snapshot"""
+
+    def __init__(self, version: int, menu_version: int, average_rating: np.ndarray, order_frequency: np.ndarray):
+        self.version = version
+        self.menu_version = menu_version
+        # NaN where the store has no statistics for the item
+        self.average_rating = average_rating
+        self.order_frequency = order_frequency
+
+
+class ItemStatsService:
+    """Feeds the stats store and publishes it to the recommender and Firestore.
+
+    Feedback deltas and orders are applied to the store with atomic
+    increments. A background thread periodically reads the store for the
+    whole menu into a LiveItemStats view, which the recommender uses
+    instead of the document fields, and checkpoints derived statistics to
+    Firestore.
+    """
+
+    def __init__(
+        self,
+        store,
+        db,
+        menu_catalog,
+        refresh_interval: float = REFRESH_INTERVAL,
+        checkpoint_interval: float = CHECKPOINT_INTERVAL
+    ):
+        self.store = store
+        self.db = db
+        self.menu_catalog = menu_catalog
+        self.refresh_interval = refresh_interval
+        self.checkpoint_interval = checkpoint_interval
+        self._live: Optional[LiveItemStats] = None
+        self._version = 0
+        self._stop = threading.Event()
+        self._last_checkpoint = time.time()
+
+    @property
+    def live(self) -> Optional[LiveItemStats]:
+        return self._live
+
+    def record_ratings(self, deltas: Dict[str, Tuple[int, float]]):
+        """Apply per-item (rating count, rating sum) deltas"""
+        snapshot = self.menu_catalog.snapshot
+        self.store.record_many(
+            (item_id, self._seed(snapshot, item_id), count, rating_sum, 0)
+            for item_id, (count, rating_sum) in deltas.items()
+        )
+
+    def record_orders(self, counts: Dict[str, int]):
+        """Apply per-item order counts"""
+        snapshot = self.menu_catalog.snapshot
+        self.store.record_many(
+            (item_id, self._seed(snapshot, item_id), 0, 0.0, count)
+            for item_id, count in counts.items()
+        )
+
+    def _seed(self, snapshot, item_id: str) -> Tuple[int, float, int]:
+        return document_seed(snapshot.get(item_id))
+
+    def refresh(self) -> LiveItemStats:
+        """Read the store for every item of the current menu"""
+        snapshot = self.menu_catalog.snapshot
+        stats = self.store.get_many(snapshot.ids)
+        average_rating = np.array(
+            [np.nan if s is None or s['average_rating'] is None else s['average_rating'] for s in stats],
+            dtype=np.float64
+        )
+        order_frequency = np.array(
+            [np.nan if s is None else s['order_frequency'] for s in stats],
+            dtype=np.float64
+        )
+        live = self._live
+        if (
+            live is not None and live.menu_version == snapshot.version
+            and np.array_equal(live.average_rating, average_rating, equal_nan=True)
+            and np.array_equal(live.order_frequency, order_frequency, equal_nan=True)
+        ):
+            # Unchanged, keep the version so scoring columns are not rebuilt
+            return live
+        self._version += 1
+        self._live = LiveItemStats(self._version, snapshot.version, average_rating, order_frequency)
+        return self._live
+
+    def checkpoint(self):
+        """Write derived statistics of every tracked item to Firestore"""
+        snapshot = self.menu_catalog.snapshot
+        stats = self.store.get_many(snapshot.ids)
+        now = datetime.now().isoformat()
+        writes = [
+            (item_id, {
+                'statistics.average_rating': s['average_rating'],
+                'statistics.order_frequency': s['order_frequency'],
+                'statistics.trending_score': s['trending_score'],
+                'statistics.checkpointed_at': now
+            })
+            for item_id, s in zip(snapshot.ids, stats) if s is not None
+        ]
+        for start in range(0, len(writes), MAX_BATCH_WRITES):
+            batch = self.db.batch()
+            for item_id, data in writes[start:start + MAX_BATCH_WRITES]:
+                batch.update(self.db.collection(MENU_COLLECTION).document(item_id), data)
+            batch.commit()
+        logger.info(f"Checkpointed statistics of {len(writes)} items")
+
+    def start(self):
+        threading.Thread(target=self._run, name='item-stats', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+                if time.time() - self._last_checkpoint >= self.checkpoint_interval:
+                    self._last_checkpoint = time.time()
+                    self.checkpoint()
+            except Exception as e:
+                logger.error(f"Error syncing item statistics: {str(e)}")
@@ -0,0 +1,118 @@
+"""Dependency-light evaluator for forests exported by DynamicPricingML.export_forest.
+
+Only NumPy is imported, so checkout paths can price items without loading
+sklearn, pandas or the pickled Pipeline.
+"""
+import json
+import os
+
+import numpy as np
+
+# Node kinds of the flattened forest
+NUMERIC_SPLIT = 0  # go left when x <= threshold
+CATEGORY_SPLIT = 1  # go right when x == threshold (a category code)
+
+NODE_ARRAYS = ('feature', 'kind', 'threshold', 'left', 'right', 'value', 'roots')
+METADATA_FILE = 'metadata.json'
+
+
+class LeanPricingModel:
+    """Array-backed random forest over raw pricing features.
+
+    Scaling and one-hot encoding are folded into the node thresholds at
+    export time: numeric splits compare raw values and one-hot splits test
+    a category code for equality. Leaves have left == -1.
+    """
+
+    def __init__(self, arrays, metadata):
+        self.feature = arrays['feature']
+        self.kind = arrays['kind']
+        self.threshold = arrays['threshold']
+        self.left = arrays['left']
+        self.right = arrays['right']
+        self.value = arrays['value']
+        self.roots = arrays['roots']
+        self.feature_columns = metadata['feature_columns']
+        self.categories = metadata['categories']
+        self.price_multiplier_bounds = tuple(metadata['price_multiplier_bounds'])
+        self.max_depth = metadata['max_depth']
+        self._category_codes = {
+            column: {category: code for code, category in enumerate(values)}
+            for column, values in self.categories.items()
+        }
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Load an exported forest, memory-mapping the node arrays by default"""
+        with open(os.path.join(directory, METADATA_FILE)) as f:
+            metadata = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r' if mmap else None)
+            for name in NODE_ARRAYS
+        }
+        return cls(arrays, metadata)
+
+    @staticmethod
+    def save(directory, arrays, metadata):
+        """Write node arrays and metadata in the format load expects"""
+        os.makedirs(directory, exist_ok=True)
+        for name in NODE_ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), arrays[name])
+        with open(os.path.join(directory, METADATA_FILE), 'w') as f:
+            json.dump(metadata, f, indent=2)
+
+    def encode(self, features):
+        """Raw feature matrix with categories replaced by their codes
+
+        features can be a dict of columns or a list of feature dicts.
+        """
+        if not isinstance(features, dict):
+            features = {column: [row[column] for row in features] for column in self.feature_columns}
+
+        columns = []
+        for column in self.feature_columns:
+            if column in self._category_codes:
+                codes = self._category_codes[column]
+                try:
+                    values = [codes[value] for value in features[column]]
+                except KeyError as e:
+                    raise ValueError(f"Found unknown category {e.args[0]!r} in column {column}")
+                columns.append(np.asarray(values, dtype=np.float64))
+            else:
+                columns.append(np.asarray(features[column], dtype=np.float64))
+        return np.column_stack(columns)
+
+    def predict_encoded(self, X):
+        """Predict price multipliers for a matrix built by encode"""
+        X = np.asarray(X, dtype=np.float64)
+        rows = np.arange(len(X))[:, None]
+        node = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+
+        # Every tree advances one level per iteration, all trees at once
+        for _ in range(self.max_depth + 1):
+            left = self.left[node]
+            internal = left != -1
+            if not internal.any():
+                break
+            x = X[rows, np.maximum(self.feature[node], 0)]
+            threshold = self.threshold[node]
+            go_left = np.where(
+                self.kind[node] == CATEGORY_SPLIT,
+                x != threshold,
+                x <= threshold
+            )
+            node = np.where(internal, np.where(go_left, left, self.right[node]), node)
+
+        return np.clip(
+            self.value[node].mean(axis=1),
+            self.price_multiplier_bounds[0],
+            self.price_multiplier_bounds[1]
+        )
+
+    def predict_many(self, features):
+        """Predict price multipliers for a batch of raw feature records"""
+        return self.predict_encoded(self.encode(features))
+
+    def predict_price_multiplier(self, features_dict):
+        """Predict the price multiplier of one item"""
+        return self.predict_many([features_dict])[0]
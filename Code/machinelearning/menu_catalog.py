@@ -0,0 +1,342 @@
+import hashlib
+import logging
+import math
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+from scoring import peak_hours_mask
+
+logger = logging.getLogger(__name__)
+
+MENU_COLLECTION = 'menu_items'
+POLL_INTERVAL = 30  # seconds
+FULL_RELOAD_EVERY = 20  # polls, picks up deletions the watermark query cannot see
+
+TEXT_FIELDS = ('name', 'description', 'category', 'restaurant_id')
+FLOAT_FIELDS = ('price', 'average_rating')
+INT_FIELDS = ('order_frequency', 'preparation_time')
+FLAG_FIELDS = ('is_vegetarian', 'is_vegan', 'is_gluten_free', 'is_spicy', 'is_special', 'is_seasonal')
+PRICE_CATEGORIES = ('low', 'medium', 'high')
+COLUMN_FIELDS = set(TEXT_FIELDS + FLOAT_FIELDS + INT_FIELDS + FLAG_FIELDS + ('price_category', 'peak_hours'))
+# Written by feedback flushes and statistics checkpoints, not read by the ranking
+UNRANKED_FIELDS = ('statistics', 'last_updated')
+
+
+def _canonical(value) -> str:
+    """repr of a field value with dict keys sorted, equal for equal content"""
+    if isinstance(value, dict):
+        return '{' + ', '.join(f"{key!r}: {_canonical(value[key])}" for key in sorted(value)) + '}'
+    if isinstance(value, list):
+        return '[' + ', '.join(_canonical(element) for element in value) + ']'
+    return repr(value)
+
+
+def _invalid_field(doc: Dict) -> Optional[str]:
+    """First field of a document that cannot be stored in its column, or None"""
+    for field in FLOAT_FIELDS + INT_FIELDS:
+        value = doc.get(field)
+        if value is not None:
+            try:
+                float(value)
+            except (TypeError, ValueError):
+                return field
+    if not isinstance(doc.get('peak_hours') or [], list):
+        return 'peak_hours'
+    return None
+
+
+class MenuSnapshot:
+    """Immutable column-oriented copy of the menu at one catalog version.
+
+    Fields the recommender reads are stored as typed NumPy columns, text
+    fields as plain lists and anything else per item in `extras`. Missing
+    numeric values are NaN so items round-trip without gaining defaults.
+    Rows are ordered by item id, so processes holding the same menu have
+    the same rows and the same digest.
+    """
+
+    def __init__(self, version: int, ids: List[str], columns: Dict, extras: List[Optional[Dict]]):
+        self.version = version
+        self.ids = ids
+        self.columns = columns
+        self.extras = extras
+        self.row_of = {item_id: row for row, item_id in enumerate(ids)}
+        self._items: Optional[List[Dict]] = None
+        self._digest: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def digest(self) -> str:
+        """Content hash of the snapshot.
+
+        Unlike `version`, which counts changes seen by this process, the
+        digest is equal across processes holding the same menu. Fields in
+        UNRANKED_FIELDS are left out, so statistics writes keep the digest.
+        """
+        if self._digest is None:
+            # Rows are sorted by id, so the hash does not depend on the order changes arrived in
+            digest = hashlib.blake2b(digest_size=8)
+            digest.update(repr(self.ids).encode('utf-8'))
+            for field in sorted(self.columns):
+                values = self.columns[field]
+                digest.update(values.tobytes() if isinstance(values, np.ndarray) else repr(values).encode('utf-8'))
+            ranked_extras = [
+                {key: value for key, value in extras.items() if key not in UNRANKED_FIELDS} if extras else None
+                for extras in self.extras
+            ]
+            digest.update(_canonical(ranked_extras).encode('utf-8'))
+            self._digest = digest.hexdigest()
+        return self._digest
+
+    @staticmethod
+    def _encode(documents: Dict[str, Dict]):
+        """Convert documents, sorted by id, into column arrays and per-item extras.
+
+        Documents with a field that does not fit its column are logged and left out.
+        """
+        ids = []
+        docs = []
+        for item_id in sorted(documents):
+            field = _invalid_field(documents[item_id])
+            if field is not None:
+                logger.error(f"Skipping menu item {item_id} with invalid {field}: {documents[item_id].get(field)!r}")
+                continue
+            ids.append(item_id)
+            docs.append(documents[item_id])
+        columns = {
+            field: [doc.get(field) or '' for doc in docs] for field in TEXT_FIELDS
+        }
+        for field in FLOAT_FIELDS + INT_FIELDS:
+            columns[field] = np.array(
+                [np.nan if doc.get(field) is None else doc[field] for doc in docs],
+                dtype=np.float64
+            )
+
+        flags = np.zeros(len(docs), dtype=np.uint8)
+        for bit, field in enumerate(FLAG_FIELDS):
+            flags |= np.array([bool(doc.get(field)) << bit for doc in docs], dtype=np.uint8)
+        columns['flags'] = flags
+        columns['price_category'] = np.array(
+            [PRICE_CATEGORIES.index(doc['price_category'])
+             if doc.get('price_category') in PRICE_CATEGORIES else -1 for doc in docs],
+            dtype=np.int8
+        )
+        columns['peak_hours'] = np.array([peak_hours_mask(doc.get('peak_hours')) for doc in docs], dtype=np.int32)
+
+        extras = [
+            {key: value for key, value in doc.items() if key not in COLUMN_FIELDS and key != 'id'} or None
+            for doc in docs
+        ]
+        return ids, columns, extras
+
+    @classmethod
+    def from_documents(cls, version: int, documents: Dict[str, Dict]) -> 'MenuSnapshot':
+        ids, columns, extras = cls._encode(documents)
+        return cls(version, ids, columns, extras)
+
+    def apply(self, version: int, upserts: Dict[str, Dict], removals: Iterable[str]) -> 'MenuSnapshot':
+        """New snapshot with documents upserted and removed, rows still ordered by id"""
+        removals = set(removals)
+        new_ids, new_columns, new_extras = self._encode(upserts)
+        encoded_row = {item_id: len(self.ids) + position for position, item_id in enumerate(new_ids)}
+
+        # Updated items take their new encoding, new items are merged in by id
+        all_ids = self.ids + new_ids
+        rows = [
+            encoded_row.get(item_id, row)
+            for row, item_id in enumerate(self.ids) if item_id not in removals
+        ]
+        rows += [encoded_row[item_id] for item_id in new_ids if item_id not in self.row_of]
+        # Two sorted runs, which the sort merges in linear time
+        rows.sort(key=all_ids.__getitem__)
+        rows = np.array(rows, dtype=np.int64)
+
+        all_extras = self.extras + new_extras
+        ids = [all_ids[row] for row in rows]
+        extras = [all_extras[row] for row in rows]
+        columns = {}
+        for field, values in self.columns.items():
+            if isinstance(values, np.ndarray):
+                columns[field] = np.concatenate([values, new_columns[field]])[rows]
+            else:
+                combined = values + new_columns[field]
+                columns[field] = [combined[row] for row in rows]
+        return MenuSnapshot(version, ids, columns, extras)
+
+    def item(self, row: int) -> Dict:
+        """Rebuild the document of one row as a dict"""
+        columns = self.columns
+        item = {'id': self.ids[row]}
+        # Text fields are always present, empty when the document lacks them
+        for field in TEXT_FIELDS:
+            item[field] = columns[field][row]
+        for field in FLOAT_FIELDS + INT_FIELDS:
+            value = columns[field][row]
+            if not math.isnan(value):
+                value = float(value)
+                item[field] = int(value) if field in INT_FIELDS and value.is_integer() else value
+        flags = int(columns['flags'][row])
+        for bit, field in enumerate(FLAG_FIELDS):
+            if flags & (1 << bit):
+                item[field] = True
+        if columns['price_category'][row] >= 0:
+            item['price_category'] = PRICE_CATEGORIES[columns['price_category'][row]]
+        mask = int(columns['peak_hours'][row])
+        if mask:
+            item['peak_hours'] = [hour for hour in range(24) if mask & (1 << hour)]
+        if self.extras[row]:
+            item.update(self.extras[row])
+        return item
+
+    def get(self, item_id: str) -> Optional[Dict]:
+        """Document of one item, None when it is not on the menu"""
+        row = self.row_of.get(item_id)
+        return self.item(row) if row is not None else None
+
+    def items(self) -> List[Dict]:
+        """Menu items as dicts, materialized once per snapshot"""
+        if self._items is None:
+            with self._lock:
+                if self._items is None:
+                    self._items = [self.item(row) for row in range(len(self.ids))]
+        return self._items
+
+
+class MenuCatalog:
+    """Process-local menu catalog kept current from Firestore.
+
+    The menu is loaded once, then kept up to date through an on_snapshot
+    listener. When listeners are unavailable the catalog polls for
+    documents whose `last_updated` field is newer than the last seen value.
+    Every applied change that alters the digest bumps `version`, which
+    downstream caches use to detect staleness. Changes to UNRANKED_FIELDS
+    only replace the snapshot under the same version.
+    """
+
+    def __init__(
+        self,
+        db,
+        collection: str = MENU_COLLECTION,
+        watermark_field: str = 'last_updated',
+        poll_interval: float = POLL_INTERVAL,
+        use_listener: bool = True
+    ):
+        self.db = db
+        self.collection = collection
+        self.watermark_field = watermark_field
+        self.poll_interval = poll_interval
+        self.use_listener = use_listener
+        self._snapshot = MenuSnapshot.from_documents(0, {})
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+        self._watermark = None
+        self._watch = None
+        self._stop = threading.Event()
+        self._poller: Optional[threading.Thread] = None
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    @property
+    def snapshot(self) -> MenuSnapshot:
+        return self._snapshot
+
+    def items(self) -> List[Dict]:
+        return self._snapshot.items()
+
+    def start(self, timeout: float = 30.0):
+        """Load the menu and subscribe to changes"""
+        if self.use_listener:
+            try:
+                self._watch = self.db.collection(self.collection).on_snapshot(self._on_snapshot)
+                if self._loaded.wait(timeout):
+                    return self
+                logger.error("Menu listener did not deliver an initial snapshot, falling back to polling")
+                self._watch.unsubscribe()
+                self._watch = None
+            except Exception as e:
+                logger.error(f"Error starting menu listener: {str(e)}")
+
+        self.reload()
+        self._poller = threading.Thread(target=self._poll_loop, name='menu-catalog-poll', daemon=True)
+        self._poller.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+
+    def reload(self):
+        """Replace the catalog with a full read of the collection"""
+        documents = {
+            doc.id: doc.to_dict() for doc in self.db.collection(self.collection).stream()
+        }
+        with self._lock:
+            self._snapshot = self._next(MenuSnapshot.from_documents(self._snapshot.version + 1, documents))
+            self._watermark = self._max_watermark(documents.values(), None)
+        self._loaded.set()
+        logger.info(f"Loaded {len(documents)} menu items, catalog version {self.version}")
+
+    def apply_changes(self, upserts: Dict[str, Dict], removals: Set[str]):
+        """Apply a batch of document changes as one new version"""
+        if not upserts and not removals:
+            return
+        with self._lock:
+            current = self._snapshot
+            removals = {item_id for item_id in removals if item_id in current.row_of}
+            if not upserts and not removals:
+                return
+            self._snapshot = self._next(current.apply(current.version + 1, upserts, removals))
+            self._watermark = self._max_watermark(upserts.values(), self._watermark)
+
+    def _next(self, snapshot: MenuSnapshot) -> MenuSnapshot:
+        """Keep the current version for a snapshot whose digest did not change"""
+        current = self._snapshot
+        if current.version and snapshot.digest == current.digest:
+            # Only unranked fields changed, nothing downstream needs to rebuild
+            snapshot.version = current.version
+        return snapshot
+
+    def _on_snapshot(self, collection_snapshot, changes, read_time):
+        try:
+            upserts = {}
+            removals = set()
+            for change in changes:
+                if change.type.name == 'REMOVED':
+                    removals.add(change.document.id)
+                    upserts.pop(change.document.id, None)
+                else:
+                    upserts[change.document.id] = change.document.to_dict()
+                    removals.discard(change.document.id)
+            self.apply_changes(upserts, removals)
+            self._loaded.set()
+        except Exception as e:
+            logger.error(f"Error applying menu changes: {str(e)}")
+
+    def _poll_loop(self):
+        polls = 0
+        while not self._stop.wait(self.poll_interval):
+            polls += 1
+            try:
+                if polls % FULL_RELOAD_EVERY == 0 or self._watermark is None:
+                    self.reload()
+                    continue
+                query = self.db.collection(self.collection).where(self.watermark_field, '>', self._watermark)
+                self.apply_changes({doc.id: doc.to_dict() for doc in query.stream()}, set())
+            except Exception as e:
+                logger.error(f"Error polling menu items: {str(e)}")
+
+    def _max_watermark(self, documents: Iterable[Dict], watermark):
+        for doc in documents:
+            value = doc.get(self.watermark_field)
+            if value is not None and (watermark is None or value > watermark):
+                watermark = value
+        return watermark
@@ -0,0 +1,236 @@
+import hashlib
+import logging
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+import numpy as np
+from scipy import sparse
+
+if TYPE_CHECKING:
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+logger = logging.getLogger(__name__)
+
+
+def build_vectorizer() -> 'TfidfVectorizer':
+    """Create the TF-IDF vectorizer used for menu text features"""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    return TfidfVectorizer(
+        stop_words='english',
+        max_features=5000,
+        ngram_range=(1, 2)
+    )
+
+
+def item_text_feature(item: Dict) -> str:
+    """Text feature of a menu item: name, description, category and dietary tags"""
+    dietary_tags = []
+    if item.get('is_vegetarian'):
+        dietary_tags.append('vegetarian')
+    if item.get('is_vegan'):
+        dietary_tags.append('vegan')
+    if item.get('is_gluten_free'):
+        dietary_tags.append('gluten_free')
+
+    return (
+        f"{item['name']} {item.get('description', '')} "
+        f"{item.get('category', '')} {' '.join(dietary_tags)} "
+        f"{'spicy' if item.get('is_spicy') else 'mild'}"
+    ).lower()
+
+
+def menu_fingerprint(item_keys: List[str], item_features: List[str]) -> str:
+    """Hash the ordered menu keys and features to detect menu changes"""
+    digest = hashlib.blake2b(digest_size=16)
+    for key, feature in zip(item_keys, item_features):
+        digest.update(key.encode('utf-8'))
+        digest.update(b'\x00')
+        digest.update(feature.encode('utf-8'))
+        digest.update(b'\x01')
+    return digest.hexdigest()
+
+
+def item_key(item: Dict) -> str:
+    """Stable key of a preprocessed menu item"""
+    return str(item.get('id') or item['features'])
+
+
+class MenuIndex:
+    """Fitted TF-IDF index over one version of the menu.
+
+    Instances are never mutated after construction, so a reference obtained
+    from MenuIndexManager can be used without locking.
+    """
+
+    def __init__(
+        self,
+        item_keys: List[str],
+        item_features: List[str],
+        matrix: sparse.csr_matrix,
+        tfidf: 'TfidfVectorizer',
+        version: str,
+        stale_rows: int = 0
+    ):
+        self.item_keys = item_keys
+        self.item_features = item_features
+        self.matrix = matrix
+        self.tfidf = tfidf
+        self.version = version
+        # Rows transformed with a vocabulary fitted on an older menu
+        self.stale_rows = stale_rows
+        self.row_of = {key: row for row, key in enumerate(item_keys)}
+
+    @classmethod
+    def fit(cls, item_keys: List[str], item_features: List[str], version: str) -> 'MenuIndex':
+        """Fit the vocabulary and item matrix from scratch"""
+        tfidf = build_vectorizer()
+        # TfidfVectorizer L2-normalizes rows, so cosine similarity is a dot product
+        matrix = tfidf.fit_transform(item_features).tocsr()
+        return cls(list(item_keys), list(item_features), matrix, tfidf, version)
+
+    def with_items(self, item_keys: List[str], item_features: List[str], version: str) -> 'MenuIndex':
+        """Derive an index for a changed menu reusing the fitted vocabulary.
+
+        Rows of unchanged items are copied, only new or edited items are
+        transformed. IDF weights stay those of the last full fit.
+        """
+        old_rows = []
+        new_features = []
+        order = []
+        for key, feature in zip(item_keys, item_features):
+            row = self.row_of.get(key)
+            if row is not None and self.item_features[row] == feature:
+                order.append(len(old_rows))
+                old_rows.append(row)
+            else:
+                order.append(-1 - len(new_features))
+                new_features.append(feature)
+
+        blocks = [self.matrix[old_rows]]
+        if new_features:
+            blocks.append(self.tfidf.transform(new_features))
+        stacked = sparse.vstack(blocks, format='csr')
+
+        # Map every position back to its row in the stacked matrix
+        offset = len(old_rows)
+        permutation = [slot if slot >= 0 else offset - 1 - slot for slot in order]
+        matrix = stacked[permutation]
+
+        return MenuIndex(
+            list(item_keys),
+            list(item_features),
+            matrix,
+            self.tfidf,
+            version,
+            stale_rows=self.stale_rows + len(new_features)
+        )
+
+    def with_version(self, version: str) -> 'MenuIndex':
+        """The same index under another menu version"""
+        return MenuIndex(self.item_keys, self.item_features, self.matrix, self.tfidf, version, self.stale_rows)
+
+    def similarities(self, user_feature: str) -> np.ndarray:
+        """Cosine similarity of the user feature against every menu item"""
+        user_vector = self.tfidf.transform([user_feature])
+        return (self.matrix @ user_vector.T).toarray().ravel()
+
+
+class MenuIndexManager:
+    """Keeps the current MenuIndex resident and swaps in new versions.
+
+    The first build happens on the calling thread. Later menu changes are
+    served immediately by an incremental index that reuses the fitted
+    vocabulary, while a full refit runs in a background thread and replaces
+    it once finished.
+    """
+
+    def __init__(self, refit_in_background: bool = True):
+        self.refit_in_background = refit_in_background
+        self._current: Optional[MenuIndex] = None
+        self._lock = threading.Lock()
+        self._refit_running = False
+        self._refit_target: Optional[str] = None
+
+    @property
+    def current(self) -> Optional[MenuIndex]:
+        return self._current
+
+    def get(self, menu_items: List[Dict], version: Optional[str] = None) -> MenuIndex:
+        """Return an index matching menu_items, rebuilding it if the menu changed"""
+        item_keys = [item_key(item) for item in menu_items]
+        item_features = [item['features'] for item in menu_items]
+        if version is None:
+            version = menu_fingerprint(item_keys, item_features)
+
+        index = self._current
+        if index is not None and index.version == version:
+            return index
+
+        with self._lock:
+            index = self._current
+            if index is not None and index.version == version:
+                return index
+
+            if index is not None and index.item_keys == item_keys and index.item_features == item_features:
+                # Only fields the index does not read changed
+                index = index.with_version(version)
+            elif index is None or not self.refit_in_background:
+                index = self._full_fit(item_keys, item_features, version)
+            else:
+                index = index.with_items(item_keys, item_features, version)
+                self._schedule_refit(item_keys, item_features, version)
+
+            self._current = index
+            return index
+
+    def install(self, index: MenuIndex) -> bool:
+        """Serve a prebuilt index, such as one published by the model trainer.
+
+        The index is only taken while nothing is loaded yet or when it
+        matches the current menu version and replaces an incremental index.
+        """
+        with self._lock:
+            current = self._current
+            if current is not None and (current.version != index.version or not current.stale_rows):
+                return False
+            self._current = index
+            logger.info(f"Installed prebuilt menu index {index.version}")
+            return True
+
+    def _full_fit(self, item_keys: List[str], item_features: List[str], version: str) -> MenuIndex:
+        index = MenuIndex.fit(item_keys, item_features, version)
+        logger.info(f"Built menu index {version} with {len(item_keys)} items")
+        return index
+
+    def _schedule_refit(self, item_keys: List[str], item_features: List[str], version: str):
+        """Start a background refit, or retarget the one already running.
+
+        Must be called with self._lock held.
+        """
+        self._refit_target = version
+        if self._refit_running:
+            return
+        self._refit_running = True
+
+        def refit():
+            try:
+                target = version
+                keys, features = item_keys, item_features
+                while True:
+                    index = self._full_fit(keys, features, target)
+                    with self._lock:
+                        if self._refit_target == target:
+                            self._current = index
+                            self._refit_running = False
+                            return
+                        # The menu changed again during the fit, refit the latest one
+                        current = self._current
+                        target = current.version
+                        keys, features = current.item_keys, current.item_features
+            except Exception as e:
+                logger.error(f"Error refitting menu index: {str(e)}")
+                with self._lock:
+                    self._refit_running = False
+
+        threading.Thread(target=refit, name='menu-index-refit', daemon=True).start()
@@ -0,0 +1,117 @@
+import heapq
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from menu_index import MenuIndex, MenuIndexManager, item_key, item_text_feature, menu_fingerprint
+from scoring import MenuColumns, select_top_k
+
+logger = logging.getLogger(__name__)
+
+SHARD_FIELD = 'restaurant_id'
+SHARD_WORKERS = 8
+
+
+class MenuShard:
+    """Global menu rows of one shard, with its fingerprint computed on first use"""
+
+    def __init__(self, shard_id: str, rows: np.ndarray):
+        self.shard_id = shard_id
+        self.rows = rows
+        self.fingerprint: Optional[str] = None
+
+
+class ShardedMenuIndex:
+    """TF-IDF indexes per restaurant, scored with scatter-gather.
+
+    Every shard has its own MenuIndexManager, keyed by a fingerprint of
+    the shard's items, so a change to one restaurant only rebuilds that
+    restaurant's index. A request scores the shards it is scoped to in a
+    thread pool; each shard keeps its local top-k and the lists are merged
+    by score. Like per-shard IDF in search engines, text similarities use
+    each shard's own vocabulary, while rating and frequency columns come
+    from the global MenuColumns so the remaining terms are comparable.
+    """
+
+    def __init__(self, field: str = SHARD_FIELD, max_workers: int = SHARD_WORKERS):
+        self.field = field
+        self._managers: Dict[str, MenuIndexManager] = {}
+        self._layout: Optional[Tuple[str, Dict[str, MenuShard]]] = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='menu-shard')
+
+    def layout(self, menu_items: List[Dict], version: str) -> Dict[str, MenuShard]:
+        """Shards of one menu version, grouped once per version"""
+        layout = self._layout
+        if layout is not None and layout[0] == version:
+            return layout[1]
+
+        with self._lock:
+            layout = self._layout
+            if layout is not None and layout[0] == version:
+                return layout[1]
+
+            rows: Dict[str, List[int]] = {}
+            for row, item in enumerate(menu_items):
+                rows.setdefault(item.get(self.field) or '', []).append(row)
+            shards = {
+                shard_id: MenuShard(shard_id, np.array(shard_rows, dtype=np.int64))
+                for shard_id, shard_rows in rows.items()
+            }
+            # Restaurants that left the menu release their index
+            for shard_id in list(self._managers):
+                if shard_id not in shards:
+                    del self._managers[shard_id]
+            self._layout = (version, shards)
+            return shards
+
+    def shard_index(self, shard: MenuShard, menu_items: List[Dict]) -> MenuIndex:
+        """Fitted index of one shard, rebuilt only when the shard's items changed"""
+        items = [menu_items[row] for row in shard.rows]
+        for item in items:
+            if 'features' not in item:
+                item['features'] = item_text_feature(item)
+        if shard.fingerprint is None:
+            shard.fingerprint = menu_fingerprint([item_key(item) for item in items], [item['features'] for item in items])
+        with self._lock:
+            manager = self._managers.setdefault(shard.shard_id, MenuIndexManager())
+        return manager.get(items, shard.fingerprint)
+
+    def top_k(
+        self,
+        menu_items: List[Dict],
+        version: str,
+        columns: MenuColumns,
+        user_feature: str,
+        shard_ids: List[str],
+        k: int,
+        min_score: float,
+        current_hour: int,
+        blend: Optional[Callable[[np.ndarray, np.ndarray], np.ndarray]] = None
+    ) -> List[Tuple[float, int]]:
+        """Best (score, global row) pairs over the given shards, best first.
+
+        blend(text_similarities, rows) can adjust a shard's similarities
+        before scoring, e.g. to mix in collaborative scores.
+        """
+        layout = self.layout(menu_items, version)
+        shards = [layout[shard_id] for shard_id in dict.fromkeys(shard_ids) if shard_id in layout]
+
+        def score_shard(shard: MenuShard) -> List[Tuple[float, int]]:
+            text_similarities = self.shard_index(shard, menu_items).similarities(user_feature)
+            if blend is not None:
+                text_similarities = blend(text_similarities, shard.rows)
+            scores = columns.score(text_similarities, current_hour, shard.rows)
+            return [(scores[i], int(shard.rows[i])) for i in select_top_k(scores, k, min_score)]
+
+        if len(shards) == 1:
+            results = [score_shard(shards[0])]
+        else:
+            results = list(self._executor.map(score_shard, shards))
+
+        # Ties resolve by menu row, as in a single select_top_k over all shards
+        return heapq.nsmallest(k, chain.from_iterable(results), key=lambda pair: (-pair[0], pair[1]))
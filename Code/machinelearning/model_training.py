@@ -0,0 +1,484 @@
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import joblib
+import numpy as np
+
+from collaborative import (
+    FACTORS_FILE, ORDERS_COLLECTION, CollaborativeModel,
+    build_interactions, load_interactions, remove_interactions, save_interactions
+)
+from event_log import EXPORT_DIR as EVENT_EXPORT_DIR, event_summary, segment_files
+from lean_pricing import LeanPricingModel
+from menu_index import MenuIndex, item_key, item_text_feature
+from price_grid import METADATA_FILE as PRICE_GRID_METADATA_FILE, PriceGrid
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_DIR = 'model_artifacts'
+RETRAIN_FEEDBACK_THRESHOLD = 1000  # feedback records since the last training
+RETRAIN_INTERVAL = 24 * 3600  # seconds, retrain at least daily
+MIN_RETRAIN_INTERVAL = 600  # seconds, feedback bursts cannot retrain more often
+CHECK_INTERVAL = 60  # seconds between trigger checks
+LOCK_TIMEOUT = 300  # seconds, renewed while a training job runs
+KEEP_VERSIONS = 3
+MODEL_POLL_INTERVAL = 15  # seconds between checks for a newly published version
+
+FEEDBACK_COUNT_KEY = 'model_training:feedback_count'
+LAST_TRAINED_KEY = 'last_model_update'
+LOCK_KEY = 'model_training:lock'
+CURRENT_FILE = 'CURRENT'
+MANIFEST_FILE = 'manifest.json'
+MENU_INDEX_FILE = 'menu_index.joblib'
+PRICING_PIPELINE_FILE = 'pricing_pipeline.joblib'
+PRICING_FOREST_DIR = 'pricing_forest'
+PRICE_GRID_DIR = 'price_grid'
+COLLABORATIVE_DIR = 'collaborative'
+
+# Extends the lock only while it still holds our token
+RENEW_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Deletes the lock only if it still holds our token
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def pricing_history_files(directory: Optional[str]) -> List[str]:
+    """Parquet and CSV files of pricing history in directory, oldest name first"""
+    if not directory or not os.path.isdir(directory):
+        return []
+    return [
+        os.path.join(directory, name) for name in sorted(os.listdir(directory))
+        if name.endswith(('.parquet', '.csv'))
+    ]
+
+
+def train_artifacts(directory: str, menu_items: List[Dict], menu_digest: str) -> Dict:
+    """Train every model into directory and return the manifest fields.
+
+    Runs in a training worker process, so it only takes picklable
+    arguments and imports the pricing model there.
+    """
+    from dynamicPricing import DynamicPricingML
+
+    os.makedirs(directory, exist_ok=True)
+    timings = {}
+
+    started = time.perf_counter()
+    index = MenuIndex.fit(
+        [item_key(item) for item in menu_items],
+        [item_text_feature(item) for item in menu_items],
+        menu_digest
+    )
+    joblib.dump(index, os.path.join(directory, MENU_INDEX_FILE))
+    timings['menu_index'] = time.perf_counter() - started
+
+    # Pricing history exported as Parquet or CSV files is read in chunks,
+    # without it the model trains on generated samples
+    started = time.perf_counter()
+    pricing_model = DynamicPricingML(precompute_grid=True)
+    history = pricing_history_files(os.getenv('PRICING_HISTORY_DIR'))
+    if history:
+        pricing_model.train_out_of_core(history)
+    else:
+        pricing_model.train_model()
+    pricing_model.save_model(os.path.join(directory, PRICING_PIPELINE_FILE))
+    pricing_model.export_forest(os.path.join(directory, PRICING_FOREST_DIR))
+    # Rebuilt by every training run, served by lookup instead of the forest
+    pricing_model.price_grid.save(os.path.join(directory, PRICE_GRID_DIR))
+    timings['pricing'] = time.perf_counter() - started
+
+    manifest = {
+        'menu_digest': menu_digest,
+        'menu_items': len(menu_items),
+        'training_seconds': timings,
+        'pricing_training': pricing_model.training_report,
+        'price_grid': pricing_model.price_grid_report
+    }
+
+    # Recommendation events exported from the workers' event logs, read
+    # as memory-mapped arrays one segment at a time
+    events_directory = os.getenv('EVENT_EXPORT_DIR', EVENT_EXPORT_DIR)
+    if segment_files(events_directory):
+        started = time.perf_counter()
+        manifest['recommendation_events'] = event_summary(events_directory)
+        timings['recommendation_events'] = time.perf_counter() - started
+
+    # Order interactions are exported by the scheduler when it has a database
+    if os.path.exists(os.path.join(directory, COLLABORATIVE_DIR)):
+        started = time.perf_counter()
+        collaborative = os.path.join(directory, COLLABORATIVE_DIR)
+        interactions, user_ids, item_ids = load_interactions(collaborative)
+        if interactions.nnz:
+            CollaborativeModel.train(interactions, item_ids).save(collaborative)
+        # Only the item factors are published
+        remove_interactions(collaborative)
+        manifest['interactions'] = {'users': len(user_ids), 'items': len(item_ids), 'nnz': int(interactions.nnz)}
+        timings['collaborative'] = time.perf_counter() - started
+    return manifest
+
+
+class ArtifactStore:
+    """Versioned model artifacts in a directory.
+
+    Every version is trained into a staging directory, renamed into
+    `versions/` and then made current by atomically replacing the
+    CURRENT pointer file, so readers never see a partial version.
+    """
+
+    def __init__(self, directory: str = ARTIFACT_DIR, keep: int = KEEP_VERSIONS):
+        self.directory = directory
+        self.keep = keep
+        os.makedirs(os.path.join(directory, 'versions'), exist_ok=True)
+
+    @staticmethod
+    def new_version() -> str:
+        return f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+    def path(self, version: str) -> str:
+        return os.path.join(self.directory, 'versions', version)
+
+    def staging_path(self, version: str) -> str:
+        return os.path.join(self.directory, f".staging-{version}")
+
+    def current(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.directory, CURRENT_FILE)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def manifest(self, version: str) -> Dict:
+        with open(os.path.join(self.path(version), MANIFEST_FILE)) as f:
+            return json.load(f)
+
+    def publish(self, version: str, manifest: Dict):
+        """Move a staged version into place and point CURRENT at it"""
+        staging = self.staging_path(version)
+        with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+            json.dump(dict(manifest, version=version), f, indent=2)
+        os.rename(staging, self.path(version))
+
+        pointer = os.path.join(self.directory, f".{CURRENT_FILE}-{version}")
+        with open(pointer, 'w') as f:
+            f.write(version)
+        os.replace(pointer, os.path.join(self.directory, CURRENT_FILE))
+        self.prune()
+
+    def discard(self, version: str):
+        shutil.rmtree(self.staging_path(version), ignore_errors=True)
+
+    def prune(self):
+        """Remove all but the newest `keep` versions, never the current one"""
+        current = self.current()
+        versions = sorted(os.listdir(os.path.join(self.directory, 'versions')), reverse=True)
+        for version in versions[self.keep:]:
+            if version != current:
+                shutil.rmtree(self.path(version), ignore_errors=True)
+
+
+class TrainingScheduler:
+    """Retrains models off the request path when enough feedback arrived or time passed.
+
+    Feedback flushes add to a shared Redis counter. Every check_interval
+    one Redis round-trip reads the counter and the last training time;
+    when a trigger fires, the process holding the Redis lock trains in a
+    worker process and publishes a new artifact version.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        store: ArtifactStore,
+        menu_catalog,
+        feedback_threshold: int = RETRAIN_FEEDBACK_THRESHOLD,
+        retrain_interval: float = RETRAIN_INTERVAL,
+        min_retrain_interval: float = MIN_RETRAIN_INTERVAL,
+        check_interval: float = CHECK_INTERVAL,
+        db=None
+    ):
+        self.redis = redis_client
+        self.store = store
+        self.menu_catalog = menu_catalog
+        # Firestore client to export order history from, None skips collaborative filtering
+        self.db = db
+        self.feedback_threshold = feedback_threshold
+        self.retrain_interval = retrain_interval
+        self.min_retrain_interval = min_retrain_interval
+        self.check_interval = check_interval
+        self._renew_lock = redis_client.register_script(RENEW_LOCK_SCRIPT)
+        self._release_lock = redis_client.register_script(RELEASE_LOCK_SCRIPT)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._stop = threading.Event()
+        self._last_run: Optional[Dict] = None
+
+    def record_feedback(self, count: int):
+        """Count flushed feedback towards the next retraining"""
+        try:
+            self.redis.incrby(FEEDBACK_COUNT_KEY, count)
+        except Exception as e:
+            logger.error(f"Error counting feedback for training: {str(e)}")
+
+    def due(self) -> Optional[str]:
+        """Reason to retrain now, or None"""
+        feedback_count, last_trained = self.redis.mget(FEEDBACK_COUNT_KEY, LAST_TRAINED_KEY)
+        feedback_count = int(feedback_count or 0)
+        if last_trained is None:
+            return 'initial'
+
+        age = (datetime.now() - datetime.fromisoformat(last_trained)).total_seconds()
+        if age >= self.retrain_interval:
+            return 'interval'
+        if feedback_count >= self.feedback_threshold and age >= self.min_retrain_interval:
+            return 'feedback'
+        return None
+
+    def status(self) -> Dict:
+        feedback_count, last_trained = self.redis.mget(FEEDBACK_COUNT_KEY, LAST_TRAINED_KEY)
+        return {
+            'current_version': self.store.current(),
+            'feedback_since_training': int(feedback_count or 0),
+            'last_trained': last_trained,
+            'last_run': self._last_run
+        }
+
+    def run_once(self, force: bool = False) -> Optional[str]:
+        """Train and publish if due and no other process is training, returns the new version"""
+        reason = 'manual' if force else self.due()
+        if reason is None:
+            return None
+
+        token = uuid.uuid4().hex
+        if not self.redis.set(LOCK_KEY, token, nx=True, ex=LOCK_TIMEOUT):
+            return None
+        version = self.store.new_version()
+        try:
+            # Feedback arriving during training counts towards the next run
+            feedback_count = int(self.redis.get(FEEDBACK_COUNT_KEY) or 0)
+            snapshot = self.menu_catalog.snapshot
+            started = time.time()
+            if self.db is not None:
+                self._export_orders(os.path.join(self.store.staging_path(version), COLLABORATIVE_DIR))
+
+            future = self._submit(self.store.staging_path(version), snapshot.items(), snapshot.digest)
+            manifest = self._wait(future, token)
+
+            manifest.update(
+                reason=reason,
+                feedback_count=feedback_count,
+                trained_at=datetime.now().isoformat()
+            )
+            self.store.publish(version, manifest)
+            pipeline = self.redis.pipeline()
+            pipeline.set(LAST_TRAINED_KEY, manifest['trained_at'])
+            pipeline.decrby(FEEDBACK_COUNT_KEY, feedback_count)
+            pipeline.execute()
+
+            self._last_run = {'version': version, 'reason': reason, 'seconds': time.time() - started}
+            logger.info(f"Published model version {version} ({reason})")
+            return version
+        except Exception as e:
+            logger.error(f"Error training models: {str(e)}")
+            self._last_run = {'error': str(e), 'reason': reason}
+            self.store.discard(version)
+            return None
+        finally:
+            try:
+                self._release_lock(keys=[LOCK_KEY], args=[token])
+            except Exception as e:
+                logger.error(f"Error releasing training lock: {str(e)}")
+
+    def _export_orders(self, directory: str):
+        """Stream the orders collection into a sparse interaction matrix for the trainer"""
+        orders = self.db.collection(ORDERS_COLLECTION).select(['user_id', 'items']).stream()
+        matrix, user_ids, item_ids = build_interactions(doc.to_dict() for doc in orders)
+        save_interactions(directory, matrix, user_ids, item_ids)
+        logger.info(f"Exported {matrix.nnz} interactions of {len(user_ids)} users")
+
+    def _submit(self, directory: str, menu_items: List[Dict], menu_digest: str) -> Future:
+        if self._executor is None:
+            # Spawned workers do not inherit this process's threads and clients
+            self._executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+        try:
+            return self._executor.submit(train_artifacts, directory, menu_items, menu_digest)
+        except BrokenProcessPool:
+            self._reset_executor()
+            return self._submit(directory, menu_items, menu_digest)
+
+    def _reset_executor(self):
+        """Drop a pool whose worker died, the next job starts a new one"""
+        logger.error("Training worker died, restarting the process pool")
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _wait(self, future: Future, token: str) -> Dict:
+        """Wait for a training job, keeping the lock alive meanwhile"""
+        while True:
+            try:
+                return future.result(timeout=LOCK_TIMEOUT / 3)
+            except TimeoutError:
+                if not self._renew_lock(keys=[LOCK_KEY], args=[token, LOCK_TIMEOUT]):
+                    raise RuntimeError("Lost the training lock")
+            except BrokenProcessPool:
+                self._reset_executor()
+                raise
+
+    def start(self):
+        threading.Thread(target=self.run, name='training-scheduler', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def run(self):
+        """Check the triggers every check_interval until stopped, blocking the caller"""
+        while not self._stop.wait(self.check_interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Error in training scheduler: {str(e)}")
+
+
+class ModelArtifacts:
+    """Models of one published version, loaded once and never mutated"""
+
+    def __init__(
+        self,
+        version: str,
+        manifest: Dict,
+        menu_index: MenuIndex,
+        pricing: LeanPricingModel,
+        collaborative: Optional[CollaborativeModel] = None,
+        price_grid: Optional[PriceGrid] = None
+    ):
+        self.version = version
+        self.manifest = manifest
+        self.menu_index = menu_index
+        self.pricing = pricing
+        self.collaborative = collaborative
+        self.price_grid = price_grid
+
+    @classmethod
+    def load(cls, store: ArtifactStore, version: str) -> 'ModelArtifacts':
+        directory = store.path(version)
+        collaborative = os.path.join(directory, COLLABORATIVE_DIR)
+        price_grid = os.path.join(directory, PRICE_GRID_DIR)
+        return cls(
+            version,
+            store.manifest(version),
+            # Uncompressed dump, so the matrix arrays map straight from the page cache
+            joblib.load(os.path.join(directory, MENU_INDEX_FILE), mmap_mode='r'),
+            LeanPricingModel.load(os.path.join(directory, PRICING_FOREST_DIR)),
+            CollaborativeModel.load(collaborative) if os.path.exists(os.path.join(collaborative, FACTORS_FILE)) else None,
+            # Versions published before the grid was built only have the forest
+            PriceGrid.load(price_grid) if os.path.exists(os.path.join(price_grid, PRICE_GRID_METADATA_FILE)) else None
+        )
+
+    def price_multipliers(self, features) -> np.ndarray:
+        """Price multipliers from the price grid, or the forest for values off the grid"""
+        if self.price_grid is not None:
+            try:
+                return np.clip(
+                    self.price_grid.lookup(features),
+                    self.pricing.price_multiplier_bounds[0],
+                    self.pricing.price_multiplier_bounds[1]
+                )
+            except ValueError:
+                pass
+        return self.pricing.predict_many(features)
+
+
+class ModelRegistry:
+    """Hot-swaps the models served by this process to the current published version.
+
+    A background thread watches the CURRENT pointer, loads a new version
+    completely and then replaces the `current` reference, so requests keep
+    using the previous models until the new ones are ready.
+    """
+
+    def __init__(self, store: ArtifactStore, poll_interval: float = MODEL_POLL_INTERVAL, on_load=None):
+        self.store = store
+        self.poll_interval = poll_interval
+        self.on_load = on_load
+        self._current: Optional[ModelArtifacts] = None
+        self._stop = threading.Event()
+
+    @property
+    def current(self) -> Optional[ModelArtifacts]:
+        return self._current
+
+    def refresh(self) -> bool:
+        """Load the published version if it differs from the served one"""
+        version = self.store.current()
+        if version is None or (self._current is not None and self._current.version == version):
+            return False
+
+        artifacts = ModelArtifacts.load(self.store, version)
+        self._current = artifacts
+        logger.info(f"Serving model version {version}")
+        if self.on_load is not None:
+            self.on_load(artifacts)
+        return True
+
+    def start(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error(f"Error loading models: {str(e)}")
+        threading.Thread(target=self._run, name='model-registry', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Error loading models: {str(e)}")
+
+
+def main():
+    """Run the training scheduler as its own process next to the web workers"""
+    from services import Services
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    # Connects to Firebase and Redis from the same settings as the web workers
+    services = Services()
+    scheduler = TrainingScheduler(
+        services.redis_client,
+        services.model_store,
+        services.menu_catalog,
+        db=services.db
+    )
+    scheduler.run()
+
+
+if __name__ == '__main__':
+    main()
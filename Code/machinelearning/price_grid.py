@@ -0,0 +1,111 @@
+import json
+import os
+
+import numpy as np
+
+GRID_FILE = 'grid.npy'
+METADATA_FILE = 'grid.json'
+
+
+class PriceGrid:
+    """Precomputed price multipliers over a discretized feature space.
+
+    Discrete features (hour, weekday, flags, categories) index the grid
+    directly. Continuous features listed in `knots` are interpolated
+    linearly between their knots, and the remaining continuous features
+    were held at `fixed` values when the grid was evaluated.
+    """
+
+    def __init__(self, discrete, knots, fixed, multipliers):
+        self.discrete = discrete  # list of (column, values)
+        self.knots = knots  # list of (column, knot values)
+        self.fixed = fixed
+        self.multipliers = multipliers
+        self._discrete_values = [np.asarray(values) for _, values in discrete]
+        self._sort_order = [np.argsort(values) for values in self._discrete_values]
+        self._knot_values = [np.asarray(values, dtype=np.float64) for _, values in knots]
+
+    @property
+    def shape(self):
+        return tuple(len(values) for _, values in self.discrete) + tuple(len(values) for _, values in self.knots)
+
+    @classmethod
+    def grid_points(cls, discrete, knots, fixed, start, stop):
+        """Feature columns of the flattened grid points in [start, stop)"""
+        shape = tuple(len(values) for _, values in discrete) + tuple(len(values) for _, values in knots)
+        positions = np.unravel_index(np.arange(start, stop), shape)
+        columns = {}
+        for (column, values), position in zip(discrete + knots, positions):
+            columns[column] = np.asarray(values)[position]
+        for column, value in fixed.items():
+            columns[column] = np.full(stop - start, value)
+        return columns
+
+    def lookup(self, features):
+        """Interpolated multipliers for a batch of feature records
+
+        features can be a dict of columns or a list of feature dicts.
+        Discrete values outside the grid raise ValueError.
+        """
+        if not isinstance(features, dict):
+            columns = [column for column, _ in self.discrete + self.knots]
+            features = {column: [row[column] for row in features] for column in columns}
+
+        indices = []
+        for (column, _), values, order in zip(self.discrete, self._discrete_values, self._sort_order):
+            requested = np.asarray(features[column]).astype(values.dtype)
+            sorted_position = np.minimum(np.searchsorted(values[order], requested), len(values) - 1)
+            index = order[sorted_position]
+            off_grid = values[index] != requested
+            if off_grid.any():
+                raise ValueError(f"Value {requested[off_grid][0]!r} of {column} is not on the price grid")
+            indices.append(index)
+
+        lower = []
+        weights = []
+        for (column, _), knot_values in zip(self.knots, self._knot_values):
+            x = np.clip(np.asarray(features[column], dtype=np.float64), knot_values[0], knot_values[-1])
+            if len(knot_values) == 1:
+                lower.append(np.zeros(len(x), dtype=np.intp))
+                weights.append(np.zeros(len(x)))
+                continue
+            index = np.clip(np.searchsorted(knot_values, x, side='right') - 1, 0, len(knot_values) - 2)
+            lower.append(index)
+            weights.append((x - knot_values[index]) / (knot_values[index + 1] - knot_values[index]))
+
+        # Multilinear interpolation over the corners of the enclosing cell
+        result = np.zeros(len(indices[0]) if indices else len(lower[0]))
+        for corner in range(1 << len(self.knots)):
+            corner_weight = np.ones_like(result)
+            corner_index = []
+            for axis, (index, weight) in enumerate(zip(lower, weights)):
+                upper = (corner >> axis) & 1
+                corner_weight *= weight if upper else 1 - weight
+                corner_index.append(np.minimum(index + upper, len(self._knot_values[axis]) - 1))
+            result += corner_weight * self.multipliers[tuple(indices + corner_index)]
+        return result
+
+    def save(self, directory):
+        """Write the grid array and its axes"""
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, GRID_FILE), self.multipliers)
+        metadata = {
+            'discrete': [[column, list(values)] for column, values in self.discrete],
+            'knots': [[column, [float(value) for value in values]] for column, values in self.knots],
+            'fixed': {column: float(value) for column, value in self.fixed.items()}
+        }
+        with open(os.path.join(directory, METADATA_FILE), 'w') as f:
+            json.dump(metadata, f, indent=2)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Load a saved grid, memory-mapping the array by default"""
+        with open(os.path.join(directory, METADATA_FILE)) as f:
+            metadata = json.load(f)
+        multipliers = np.load(os.path.join(directory, GRID_FILE), mmap_mode='r' if mmap else None)
+        return cls(
+            [tuple(axis) for axis in metadata['discrete']],
+            [tuple(axis) for axis in metadata['knots']],
+            metadata['fixed'],
+            multipliers
+        )
@@ -0,0 +1,209 @@
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, Union
+
+import orjson
+
+from instrumentation import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+CACHE_EXPIRATION = 3600  # seconds a cached result is served as fresh
+STALE_EXPIRATION = 600  # seconds a result may be served while it is recomputed
+LOCK_TIMEOUT = 30  # seconds before an abandoned recompute lock expires
+LOCK_WAIT = 5  # seconds a miss waits for another process to fill the key
+LOCK_FAILED = object()  # _acquire result when Redis failed: compute at once, nobody else holds the lock
+
+# Deletes the lock only if it still holds our token
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def preferences_hash(preferences: Dict) -> str:
+    """Short stable hash of a user's preferences"""
+    payload = orjson.dumps(preferences, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    return hashlib.blake2b(payload, digest_size=8).hexdigest()
+
+
+class RecommendationCache:
+    """Redis cache for recommendation results.
+
+    Keys include the preference hash and menu version, so edits to either
+    never serve an outdated result. Entries are orjson documents holding
+    the value and the time it stops being fresh. Once that passes, the
+    entry is still served for STALE_EXPIRATION seconds while one caller
+    recomputes it in the background. Misses are single-flight: one thread
+    per process and one process per key (through a Redis lock) computes,
+    the others wait for its result. Threads wait on the in-flight future of
+    their key, so misses on other keys never wait behind them.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        prefix: str = 'recommendations',
+        expiration: int = CACHE_EXPIRATION,
+        stale_expiration: int = STALE_EXPIRATION,
+        metrics: Optional[MetricsRegistry] = None
+    ):
+        self.redis = redis_client
+        self.prefix = prefix
+        self.expiration = expiration
+        self.stale_expiration = stale_expiration
+        self.metrics = metrics or MetricsRegistry(enabled=False)
+        self._release_lock = redis_client.register_script(RELEASE_LOCK_SCRIPT)
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
+        self._refreshing = set()
+        self._counters = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'recomputes': 0, 'errors': 0}
+        self._counters_lock = threading.Lock()
+
+    def key(self, user_id: str, preferences: Dict, menu_version: str) -> str:
+        return f"{self.prefix}:{user_id}:{preferences_hash(preferences)}:{menu_version}"
+
+    def stats(self) -> Dict[str, int]:
+        with self._counters_lock:
+            return dict(self._counters)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Dict]) -> Dict:
+        """Return the cached value for key, computing it at most once on a miss"""
+        entry = self._read(key)
+        if entry is not None:
+            if entry['fresh_until'] > time.time():
+                self._count('hits')
+            else:
+                self._count('stale_hits')
+                self._refresh_in_background(key, compute)
+            return entry['value']
+
+        self._count('misses')
+        with self._inflight_lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = Future()
+        if not leader:
+            # Another thread of this process is filling the key
+            return flight.result()
+
+        try:
+            value = self._fill(key, compute)
+            flight.set_result(value)
+            return value
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+
+    def _fill(self, key: str, compute: Callable[[], Dict]) -> Dict:
+        """Value of a missed key, computed unless another process fills it"""
+        # A flight that just finished may have filled the key
+        entry = self._read(key)
+        if entry is not None:
+            return entry['value']
+
+        token = self._acquire(key)
+        if token is None:
+            # Another process is computing it
+            entry = self._wait_for(key)
+            if entry is not None:
+                return entry['value']
+        try:
+            return self._recompute(key, compute)
+        finally:
+            if isinstance(token, str):
+                self._release(key, token)
+
+    def _recompute(self, key: str, compute: Callable[[], Dict]) -> Dict:
+        self._count('recomputes')
+        value = compute()
+        entry = {'fresh_until': time.time() + self.expiration, 'value': value}
+        try:
+            with self.metrics.span('cache_write'):
+                self.redis.setex(
+                    key,
+                    self.expiration + self.stale_expiration,
+                    orjson.dumps(entry, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+                )
+        except Exception as e:
+            self._count('errors')
+            logger.error(f"Error writing cache entry {key}: {str(e)}")
+        return value
+
+    def _refresh_in_background(self, key: str, compute: Callable[[], Dict]):
+        with self._counters_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            token = None
+            try:
+                token = self._acquire(key)
+                if isinstance(token, str):
+                    self._recompute(key, compute)
+            except Exception as e:
+                self._count('errors')
+                logger.error(f"Error refreshing cache entry {key}: {str(e)}")
+            finally:
+                if isinstance(token, str):
+                    self._release(key, token)
+                with self._counters_lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name='cache-refresh', daemon=True).start()
+
+    def _read(self, key: str) -> Optional[Dict]:
+        try:
+            with self.metrics.span('cache_read'):
+                payload = self.redis.get(key)
+                return orjson.loads(payload) if payload else None
+        except Exception as e:
+            self._count('errors')
+            logger.error(f"Error reading cache entry {key}: {str(e)}")
+            return None
+
+    def _acquire(self, key: str) -> Union[str, object, None]:
+        """Lock token, None when another process holds the lock, LOCK_FAILED when Redis failed"""
+        token = uuid.uuid4().hex
+        try:
+            if self.redis.set(f"lock:{key}", token, nx=True, ex=LOCK_TIMEOUT):
+                return token
+        except Exception as e:
+            self._count('errors')
+            logger.error(f"Error acquiring cache lock {key}: {str(e)}")
+            return LOCK_FAILED
+        return None
+
+    def _release(self, key: str, token: str):
+        try:
+            self._release_lock(keys=[f"lock:{key}"], args=[token])
+        except Exception as e:
+            logger.error(f"Error releasing cache lock {key}: {str(e)}")
+
+    def _wait_for(self, key: str) -> Optional[Dict]:
+        """Poll for a value another process is computing"""
+        deadline = time.time() + LOCK_WAIT
+        delay = 0.01
+        with self.metrics.span('cache_wait'):
+            while time.time() < deadline:
+                time.sleep(delay)
+                entry = self._read(key)
+                if entry is not None:
+                    return entry
+                delay = min(delay * 2, 0.2)
+        return None
+
+    def _count(self, counter: str):
+        with self._counters_lock:
+            self._counters[counter] += 1
@@ -0,0 +1,192 @@
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Score weights and multipliers of the recommendation ranking
+TEXT_WEIGHT = 0.6
+RATING_WEIGHT = 0.2
+FREQUENCY_WEIGHT = 0.1
+PEAK_HOUR_BOOST = 1.2
+SPECIAL_BOOST = 1.1
+SEASONAL_BOOST = 1.15
+HISTORY_WEIGHT = 0.5  # share of the text term taken by the collaborative score
+
+# Numeric features of an item for a user, in column order of MenuColumns.numeric_features
+NUMERIC_FEATURES = ('price_match', 'rating', 'order_frequency', 'preparation_time', 'is_special')
+PRICE_LEVELS = {'low': 0, 'medium': 1, 'high': 2}
+
+
+def standardize(values: np.ndarray) -> np.ndarray:
+    """Zero mean and unit variance per column, like sklearn's StandardScaler.
+
+    Constant columns are only centered.
+    """
+    scale = values.std(axis=0)
+    scale[scale < 10 * np.finfo(values.dtype).eps] = 1.0
+    return (values - values.mean(axis=0)) / scale
+
+
+def peak_hours_mask(peak_hours: Optional[List]) -> int:
+    """Encode a list of peak hours as a 24-bit mask"""
+    mask = 0
+    for hour in peak_hours or []:
+        if isinstance(hour, (int, float)) and hour == int(hour) and 0 <= hour < 24:
+            mask |= 1 << int(hour)
+    return mask
+
+
+class MenuColumns:
+    """Columnar view of a menu version used by the vectorized scoring path.
+
+    The numeric features are standardized over the whole menu once per
+    version, so they do not depend on the request. Price match is the
+    only feature that depends on the user, through their price range, so
+    one float32 block is kept per price level and a request only looks it
+    up. When live_stats (an item_stats.LiveItemStats aligned with
+    menu_items) is given, its values replace the document fields where
+    available.
+    """
+
+    def __init__(
+        self,
+        menu_items: List[Dict],
+        version: Optional[str] = None,
+        live_stats=None
+    ):
+        self.version = version
+        self.size = len(menu_items)
+        self.is_special = np.array([bool(item.get('is_special', False)) for item in menu_items], dtype=bool)
+        self.is_seasonal = np.array([bool(item.get('is_seasonal', False)) for item in menu_items], dtype=bool)
+        self.peak_hours = np.array(
+            [peak_hours_mask(item.get('peak_hours')) for item in menu_items],
+            dtype=np.int64
+        )
+
+        self.price_level = np.array(
+            [PRICE_LEVELS.get(item.get('price_category', 'medium'), PRICE_LEVELS['medium']) for item in menu_items],
+            dtype=np.int8
+        )
+
+        # One block per user price level, the other columns are shared
+        self.numeric = np.zeros((len(PRICE_LEVELS), self.size, len(NUMERIC_FEATURES)), dtype=np.float32)
+        if menu_items:
+            raw = np.array(
+                [
+                    [item.get('average_rating', 3.0), item.get('order_frequency', 0), item.get('preparation_time', 30)]
+                    for item in menu_items
+                ],
+                dtype=np.float64
+            )
+            if live_stats is not None:
+                # Prefer streaming statistics over the document fields
+                live = np.column_stack([live_stats.average_rating, live_stats.order_frequency])
+                raw[:, :2] = np.where(np.isnan(live), raw[:, :2], live)
+            scaled = standardize(np.column_stack([raw, self.is_special]))
+            self.numeric[:, :, 1:] = scaled
+            for level in PRICE_LEVELS.values():
+                price_match = np.abs(level - self.price_level.astype(np.float64))
+                self.numeric[level, :, 0] = standardize(price_match[:, None])[:, 0]
+        else:
+            scaled = np.empty((0, 4))
+        # Shared by every request of this version
+        self.numeric.flags.writeable = False
+        self.rating = np.ascontiguousarray(scaled[:, 0])
+        self.order_frequency = np.ascontiguousarray(scaled[:, 1])
+        self._prior_rows: Optional[Tuple[int, np.ndarray]] = None
+
+    def numeric_features(self, price_range: str = 'medium') -> np.ndarray:
+        """Standardized NUMERIC_FEATURES of every item for a user's price range"""
+        return self.numeric[PRICE_LEVELS.get(price_range, PRICE_LEVELS['medium'])]
+
+    def score(self, text_similarities: np.ndarray, current_hour: int, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Final recommendation score of every item.
+
+        text_similarities is either one row per menu item or a
+        (users, items) matrix, in which case every row is scored. With
+        rows, text_similarities holds only those menu rows.
+        """
+        rating, order_frequency = self.rating, self.order_frequency
+        peak_hours, is_special, is_seasonal = self.peak_hours, self.is_special, self.is_seasonal
+        if rows is not None:
+            rating, order_frequency = rating[rows], order_frequency[rows]
+            peak_hours, is_special, is_seasonal = peak_hours[rows], is_special[rows], is_seasonal[rows]
+
+        scores = text_similarities * TEXT_WEIGHT
+        scores += (rating / 5.0) * RATING_WEIGHT
+        scores += np.minimum(order_frequency / 100, 1.0) * FREQUENCY_WEIGHT
+
+        # Multipliers are applied in the same order as the per-item rules
+        peak = (peak_hours >> current_hour) & 1 == 1
+        scores[..., peak] *= PEAK_HOUR_BOOST
+        scores[..., is_special] *= SPECIAL_BOOST
+        scores[..., is_seasonal] *= SEASONAL_BOOST
+        return scores
+
+    def prior_rows(self, k: int) -> np.ndarray:
+        """Rows of the k items scoring best without any text similarity.
+
+        Scored as if every item were at its peak hour, so these are the
+        items that can rank without a text match at any time of day.
+        """
+        if self._prior_rows is None or self._prior_rows[0] != k:
+            prior = (self.rating / 5.0) * RATING_WEIGHT
+            prior += np.minimum(self.order_frequency / 100, 1.0) * FREQUENCY_WEIGHT
+            prior[self.peak_hours != 0] *= PEAK_HOUR_BOOST
+            prior[self.is_special] *= SPECIAL_BOOST
+            prior[self.is_seasonal] *= SEASONAL_BOOST
+            self._prior_rows = (k, np.sort(select_top_k(prior, k, -np.inf)))
+        return self._prior_rows[1]
+
+
+def blend_history(text_similarities: np.ndarray, history_scores: Optional[np.ndarray]) -> np.ndarray:
+    """Mix collaborative scores into the text similarities.
+
+    Items without a collaborative score (NaN) and cold-start users
+    (history_scores is None) keep the pure text similarity.
+    """
+    if history_scores is None:
+        return text_similarities
+    blended = (1 - HISTORY_WEIGHT) * text_similarities + HISTORY_WEIGHT * history_scores
+    return np.where(np.isnan(history_scores), text_similarities, blended)
+
+
+def select_top_k(scores: np.ndarray, k: int, min_score: float) -> np.ndarray:
+    """Indices of the k best scores at or above min_score, best first.
+
+    Ties keep menu order, matching a stable descending sort.
+    """
+    candidates = np.flatnonzero(scores >= min_score)
+    if len(candidates) > k:
+        candidate_scores = scores[candidates]
+        kth = candidate_scores[np.argpartition(-candidate_scores, k - 1)[k - 1]]
+        # Keep every candidate tied with the k-th score so ties resolve by position
+        candidates = candidates[candidate_scores >= kth]
+
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order[:k]]
+
+
+class MenuColumnsCache:
+    """Keeps the MenuColumns of the current menu version resident"""
+
+    def __init__(self):
+        self._current: Optional[MenuColumns] = None
+        self._lock = threading.Lock()
+
+    def get(self, menu_items: List[Dict], version: str, live_stats=None) -> MenuColumns:
+        if live_stats is not None:
+            version = f"{version}:stats{live_stats.version}"
+        columns = self._current
+        if columns is not None and columns.version == version:
+            return columns
+
+        with self._lock:
+            columns = self._current
+            if columns is None or columns.version != version:
+                columns = MenuColumns(menu_items, version, live_stats)
+                self._current = columns
+            return columns
@@ -0,0 +1,260 @@
+"""Clients and shared components of the recommendation service, built on first use.
+
+Importing this module is cheap: Firebase, Redis, the menu catalog and the
+model registry are created the first time a request (or warm_up) touches
+them, and the heavy libraries behind them are imported at that point.
+Each component is built once per process under its own lock, so
+concurrent first uses wait for the same build while components that are
+ready stay available.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+FIREBASE_CREDENTIALS = 'firebase_credentials.json'
+CACHE_EXPIRATION = 3600  # 1 hour
+
+
+class lazy:
+    """Attribute computed on first access and then stored on the instance"""
+
+    def __init__(self, build):
+        self.build = build
+        self.name = build.__name__
+        self.__doc__ = build.__doc__
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        # Once built, the instance attribute shadows this descriptor
+        with instance._lock:
+            lock = instance._build_locks.setdefault(self.name, threading.Lock())
+        with lock:
+            # Another thread may have built it while we waited
+            if self.name not in instance.__dict__:
+                instance.__dict__[self.name] = self.build(instance)
+        return instance.__dict__[self.name]
+
+
+class Services:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_locks: Dict[str, threading.Lock] = {}
+
+    @lazy
+    def firebase_app(self):
+        from firebase_admin import credentials, initialize_app
+
+        cred = credentials.Certificate(os.getenv('FIREBASE_CREDENTIALS', FIREBASE_CREDENTIALS))
+        return initialize_app(cred)
+
+    @lazy
+    def db(self):
+        from firebase_admin import firestore
+
+        self.firebase_app
+        return firestore.client()
+
+    @lazy
+    def redis_client(self):
+        import redis
+
+        # Connections are opened by the first command
+        return redis.Redis(
+            host=os.getenv('REDIS_HOST', 'localhost'),
+            port=int(os.getenv('REDIS_PORT', 6379)),
+            db=0,
+            decode_responses=True
+        )
+
+    @lazy
+    def menu_catalog(self):
+        """Menu kept in memory and current through Firestore listeners"""
+        from menu_catalog import MenuCatalog
+
+        return MenuCatalog(self.db).start()
+
+    @lazy
+    def menu_index(self):
+        """Fitted TF-IDF index over the menu, shared by all requests"""
+        from menu_index import MenuIndexManager
+
+        return MenuIndexManager()
+
+    @lazy
+    def menu_columns(self):
+        """Scoring columns over the menu, shared by all requests"""
+        from scoring import MenuColumnsCache
+
+        return MenuColumnsCache()
+
+    @lazy
+    def menu_shards(self):
+        """Per-restaurant indexes for requests scoped to some restaurants"""
+        from menu_shards import ShardedMenuIndex
+
+        return ShardedMenuIndex()
+
+    @lazy
+    def ann_index(self):
+        """Embedding index for retrieve-then-rank on menus too large to scan per request"""
+        from ann_index import AnnIndexManager
+
+        return AnnIndexManager()
+
+    @lazy
+    def metrics(self):
+        """Latency histograms of request stages, served on /metrics"""
+        from instrumentation import MetricsRegistry
+
+        return MetricsRegistry(self.redis_client, enabled=os.getenv('METRICS_ENABLED', 'true').lower() == 'true').start()
+
+    @lazy
+    def request_profiler(self):
+        """Opt-in cProfile of every Nth request, kept when the request was slow"""
+        from instrumentation import PROFILE_DIR, RequestProfiler
+
+        return RequestProfiler(
+            int(os.getenv('PROFILE_SAMPLE_RATE', 0)),
+            float(os.getenv('PROFILE_SLOW_SECONDS', 0.5)),
+            os.getenv('PROFILE_DIR', PROFILE_DIR)
+        )
+
+    @lazy
+    def recommendation_cache(self):
+        """Recommendation results keyed by user, preferences and menu version"""
+        from recommendation_cache import RecommendationCache
+
+        return RecommendationCache(self.redis_client, expiration=CACHE_EXPIRATION, metrics=self.metrics)
+
+    @lazy
+    def item_stats(self):
+        """Running item statistics read by the recommender instead of document fields"""
+        from item_stats import ItemStatsService, RedisItemStats, ShardedItemStats
+
+        backend = os.getenv('ITEM_STATS_BACKEND', 'redis')
+        if backend != 'redis' and int(os.getenv('WEB_CONCURRENCY', '1')) > 1:
+            # In-memory statistics are per process, every worker would checkpoint its own counts
+            logger.error(f"ITEM_STATS_BACKEND={backend} keeps statistics per process and needs a single worker, using Redis")
+            backend = 'redis'
+        return ItemStatsService(
+            RedisItemStats(self.redis_client) if backend == 'redis' else ShardedItemStats(),
+            self.db,
+            self.menu_catalog
+        ).start()
+
+    @lazy
+    def model_store(self):
+        from model_training import ARTIFACT_DIR, ArtifactStore
+
+        return ArtifactStore(os.getenv('MODEL_ARTIFACT_DIR', ARTIFACT_DIR))
+
+    @lazy
+    def training_scheduler(self):
+        """Counts feedback towards retraining, done by the scheduler process (model_training.py)"""
+        from model_training import TrainingScheduler
+
+        return TrainingScheduler(self.redis_client, self.model_store, self.menu_catalog)
+
+    @lazy
+    def model_registry(self):
+        """Models hot-swapped to each version the scheduler publishes"""
+        from model_training import ModelRegistry
+
+        return ModelRegistry(self.model_store, on_load=self.on_models_loaded).start()
+
+    @lazy
+    def feedback_pipeline(self):
+        """Feedback queued on local disk and written to Firestore in batches"""
+        from feedback_pipeline import FeedbackPipeline
+
+        return FeedbackPipeline(
+            self.db,
+            os.getenv('FEEDBACK_QUEUE_PATH', 'feedback_queue.db'),
+            menu_item=lambda item_id: self.menu_catalog.snapshot.get(item_id),
+            on_flush=self.on_feedback_flushed
+        ).start()
+
+    @lazy
+    def trending(self):
+        """Trending items per restaurant and region, counted from order and feedback listeners"""
+        from trending import SNAPSHOT_PATH, TrendingService
+
+        return TrendingService(
+            self.db,
+            self.menu_catalog,
+            snapshot_path=os.getenv('TRENDING_SNAPSHOT_PATH', SNAPSHOT_PATH)
+        ).start()
+
+    @lazy
+    def event_log(self):
+        """Recommendation events appended to local segments, exported in bulk by event_exporter"""
+        from event_log import EVENT_LOG_DIR, EventLog
+
+        self.event_exporter
+        return EventLog(os.getenv('EVENT_LOG_DIR', EVENT_LOG_DIR)).start()
+
+    @lazy
+    def event_exporter(self):
+        """Moves sealed event log segments to EVENT_EXPORT_DIR, where training reads them"""
+        from event_log import EVENT_LOG_DIR, EXPORT_DIR, EventExporter
+
+        return EventExporter(
+            os.getenv('EVENT_LOG_DIR', EVENT_LOG_DIR),
+            os.getenv('EVENT_EXPORT_DIR', EXPORT_DIR)
+        ).start()
+
+    def live_item_stats(self, menu_snapshot):
+        """Streaming item statistics if they were read for this menu snapshot"""
+        live = self.item_stats.live
+        if live is not None and live.menu_version == menu_snapshot.version:
+            return live
+        return None
+
+    def on_models_loaded(self, artifacts):
+        self.menu_index.install(artifacts.menu_index)
+
+    def on_feedback_flushed(self, deltas: Dict[str, Tuple[int, float]]):
+        self.item_stats.record_ratings(deltas)
+        self.training_scheduler.record_feedback(sum(count for count, _ in deltas.values()))
+
+    def warm_up(self) -> Dict[str, float]:
+        """Build what the first /recommend needs and return seconds per stage.
+
+        Published models are memory-mapped from the artifact store; without
+        them the menu index is fitted here instead of on the first request.
+        """
+        timings = {}
+
+        def timed(stage, build):
+            started = time.perf_counter()
+            result = build()
+            timings[stage] = round(time.perf_counter() - started, 3)
+            return result
+
+        timed('clients', lambda: (self.db, self.redis_client, self.metrics, self.recommendation_cache))
+        snapshot = timed('menu_catalog', lambda: self.menu_catalog.snapshot)
+        models = timed('model_artifacts', lambda: self.model_registry.current)
+        timed('item_stats', lambda: self.item_stats)
+
+        def menu_state():
+            from menu_index import item_text_feature
+
+            items = snapshot.items()
+            for item in items:
+                if 'features' not in item:
+                    item['features'] = item_text_feature(item)
+            self.menu_index.get(items, snapshot.digest)
+            self.menu_columns.get(items, snapshot.digest, self.live_item_stats(snapshot))
+
+        if len(snapshot):
+            timed('menu_index', menu_state)
+        timed('feedback_pipeline', lambda: self.feedback_pipeline)
+        timed('event_log', lambda: self.event_log)
+        timed('trending', lambda: self.trending)
+        logger.info(f"Warmed up in {sum(timings.values()):.3f}s, models {models.version if models else None}: {timings}")
+        return timings
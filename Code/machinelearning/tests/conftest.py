@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'benchmarks')]
+
+import fakes  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """Fake Firestore, with Firebase and Redis client creation patched"""
+    return fakes.install()
+
+
+@pytest.fixture
+def redis_client(db):
+    import redis
+
+    return redis.Redis(decode_responses=True)
@@ -0,0 +1,149 @@
+import sqlite3
+
+import pytest
+
+from app import feedback_request_error
+from feedback_pipeline import FeedbackPipeline
+
+MENU = {
+    'legacy': {'statistics': {'rating_count': 4, 'average_rating': 4.0}},
+    'new': {}
+}
+
+
+@pytest.fixture
+def menu(db):
+    for item_id, document in MENU.items():
+        db.collection('menu_items').document(item_id).set(document)
+    return dict(MENU)
+
+
+@pytest.fixture
+def pipeline(db, menu, tmp_path):
+    flushed = []
+    pipeline = FeedbackPipeline(
+        db, str(tmp_path / 'queue.db'), menu_item=menu.get, on_flush=flushed.append, max_attempts=2
+    )
+    pipeline.flushed = flushed
+    yield pipeline
+    pipeline._conn.close()
+
+
+def feedback(item_id, rating):
+    return {'user_id': 'u1', 'item_id': item_id, 'rating': rating, 'interaction_type': 'rating'}
+
+
+def statistics(db, item_id):
+    return db.collection('menu_items').documents[item_id]['statistics']
+
+
+def test_flush_commits_feedback_and_item_statistics(db, pipeline):
+    feedback_id = pipeline.enqueue(feedback('new', 5))
+    pipeline.enqueue(feedback('new', 3))
+
+    assert pipeline.flush() == 2
+    assert pipeline.flush() == 0
+    assert db.collection('feedback').documents[feedback_id]['rating'] == 5
+    assert statistics(db, 'new')['rating_count'] == 2
+    assert statistics(db, 'new')['rating_sum'] == 8
+    assert pipeline.flushed == [{'new': (2, 8.0)}]
+    assert pipeline.metrics()['queue_depth'] == 0
+
+
+def test_flush_batches_are_claimed_in_order(db, menu, tmp_path):
+    pipeline = FeedbackPipeline(db, str(tmp_path / 'queue.db'), menu_item=menu.get, batch_size=2)
+    for rating in (1, 2, 3):
+        pipeline.enqueue(feedback('new', rating))
+
+    assert pipeline.flush() == 2
+    assert pipeline.flush() == 1
+    assert statistics(db, 'new')['rating_sum'] == 6
+
+
+def test_legacy_rating_sum_is_seeded_from_the_average(db, pipeline):
+    pipeline.enqueue(feedback('legacy', 2))
+    pipeline.flush()
+
+    stats = statistics(db, 'legacy')
+    assert stats['rating_count'] == 5
+    assert stats['rating_sum'] == 4.0 * 4 + 2
+    assert stats['rating_sum_seeded']
+
+
+def test_failed_commit_keeps_the_batch(db, pipeline, monkeypatch):
+    def unavailable(records, deltas):
+        raise RuntimeError('down')
+
+    pipeline.enqueue(feedback('new', 4))
+    monkeypatch.setattr(pipeline, '_commit', unavailable)
+
+    assert pipeline.flush() == 0
+    assert pipeline.metrics()['failed_flushes'] == 1
+    assert pipeline._conn.execute('SELECT attempts, claimed_by FROM feedback_queue').fetchall() == [(1, None)]
+
+    monkeypatch.undo()
+    assert pipeline.flush() == 1
+    assert statistics(db, 'new')['rating_count'] == 1
+
+
+def test_undecodable_record_is_parked(db, pipeline):
+    pipeline._conn.execute('INSERT INTO feedback_queue (payload) VALUES (?)', (b'not json',))
+    pipeline.enqueue(feedback('new', 5))
+
+    assert pipeline.flush() == 2
+    assert statistics(db, 'new')['rating_count'] == 1
+    metrics = pipeline.metrics()
+    assert metrics['dead_lettered'] == 1
+    assert metrics['dead_letter_depth'] == 1
+
+
+def test_rejected_record_is_parked_after_max_attempts(db, pipeline, monkeypatch):
+    commit = pipeline._commit
+
+    def reject_poison(records, deltas):
+        if any(record['data']['item_id'] == 'poison' for record in records):
+            raise ValueError('rejected')
+        commit(records, deltas)
+
+    monkeypatch.setattr(pipeline, '_commit', reject_poison)
+    pipeline.menu_item = lambda item_id: {} if item_id == 'poison' else MENU.get(item_id)
+    pipeline.enqueue(feedback('poison', 1))
+    pipeline.enqueue(feedback('new', 5))
+
+    assert pipeline.flush() == 0
+    assert pipeline.flush() == 0
+    # Committed one by one once the batch failed max_attempts times
+    assert pipeline.flush() == 2
+    assert statistics(db, 'new')['rating_count'] == 1
+    assert pipeline._conn.execute('SELECT attempts, error FROM feedback_dead_letter').fetchall() == [(2, 'rejected')]
+
+    assert pipeline.requeue_dead_letters() == 1
+    assert pipeline.metrics()['dead_letter_depth'] == 0
+    assert pipeline._conn.execute('SELECT attempts FROM feedback_queue').fetchall() == [(0,)]
+
+
+def test_queue_files_without_attempts_are_migrated(db, menu, tmp_path):
+    path = str(tmp_path / 'queue.db')
+    conn = sqlite3.connect(path)
+    conn.execute(
+        'CREATE TABLE feedback_queue (seq INTEGER PRIMARY KEY AUTOINCREMENT, payload BLOB NOT NULL, '
+        'claimed_by TEXT, claimed_at REAL)'
+    )
+    conn.commit()
+    conn.close()
+
+    pipeline = FeedbackPipeline(db, path, menu_item=menu.get)
+    pipeline.enqueue(feedback('new', 5))
+    assert pipeline.flush() == 1
+
+
+@pytest.mark.parametrize('changes, error', [
+    ({}, None),
+    ({'rating': 0}, "Rating must be between 1 and 5"),
+    ({'rating': '5'}, "Rating must be a number"),
+    ({'rating': True}, "Rating must be a number"),
+    ({'item_id': ''}, "Item id must be a non-empty string"),
+    ({'item_id': 7}, "Item id must be a non-empty string")
+])
+def test_feedback_request_validation(changes, error):
+    assert feedback_request_error(dict(feedback('new', 4), **changes)) == error
@@ -0,0 +1,66 @@
+from menu_catalog import MenuCatalog, MenuSnapshot
+from menu_index import MenuIndexManager
+
+
+def menu():
+    return {
+        f"item{n}": {
+            'name': f"dish {n}",
+            'category': 'main',
+            'restaurant_id': 'r1',
+            'price': 10.0 + n,
+            'features': f"dish {n} main",
+            'statistics': {'rating_count': n, 'rating_sum': 4.0 * n},
+            'last_updated': '2026-01-01T00:00:00'
+        }
+        for n in range(5)
+    }
+
+
+def started_catalog(db, documents):
+    for item_id, document in documents.items():
+        db.collection('menu_items').document(item_id).set(document)
+    return MenuCatalog(db).start(timeout=1)
+
+
+def test_digest_ignores_document_order():
+    documents = menu()
+    reversed_documents = dict(reversed(list(documents.items())))
+    assert MenuSnapshot.from_documents(1, documents).digest == MenuSnapshot.from_documents(2, reversed_documents).digest
+
+
+def test_statistics_writes_keep_version_and_digest(db):
+    catalog = started_catalog(db, menu())
+    version, digest = catalog.version, catalog.snapshot.digest
+
+    db.collection('menu_items').document('item1').set({
+        'statistics': {'rating_count': 9, 'rating_sum': 40.0}, 'last_updated': '2026-01-02T00:00:00'
+    }, merge=True)
+
+    assert catalog.snapshot.get('item1')['statistics']['rating_count'] == 9
+    assert catalog.version == version
+    assert catalog.snapshot.digest == digest
+
+
+def test_ranked_field_change_bumps_version_and_digest(db):
+    catalog = started_catalog(db, menu())
+    version, digest = catalog.version, catalog.snapshot.digest
+
+    db.collection('menu_items').document('item1').set({'price': 99.0}, merge=True)
+
+    assert catalog.version == version + 1
+    assert catalog.snapshot.digest != digest
+
+
+def test_index_is_not_refitted_for_unchanged_items():
+    snapshot = MenuSnapshot.from_documents(1, menu())
+    manager = MenuIndexManager()
+    index = manager.get(snapshot.items(), snapshot.digest)
+
+    updated = menu()
+    updated['item1']['statistics'] = {'rating_count': 9}
+    reversioned = manager.get(MenuSnapshot.from_documents(2, updated).items(), 'other')
+
+    assert reversioned.version == 'other'
+    assert reversioned.matrix is index.matrix
+    assert not manager._refit_running
@@ -0,0 +1,101 @@
+import threading
+import time
+
+import orjson
+
+from recommendation_cache import RecommendationCache
+
+
+def test_concurrent_misses_compute_once(redis_client):
+    cache = RecommendationCache(redis_client)
+    calls = []
+    started = threading.Event()
+
+    def compute():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return {'items': [1, 2]}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('k', compute))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    started.wait(1)
+
+    # A miss on another key does not wait for the one in flight
+    began = time.perf_counter()
+    assert cache.get_or_compute('other', lambda: {'items': []}) == {'items': []}
+    assert time.perf_counter() - began < 0.1
+
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [{'items': [1, 2]}] * 8
+    assert cache._inflight == {}
+
+
+def test_failed_compute_reaches_every_waiter(redis_client):
+    cache = RecommendationCache(redis_client)
+
+    def compute():
+        time.sleep(0.1)
+        raise ValueError('boom')
+
+    errors = []
+
+    def request():
+        try:
+            cache.get_or_compute('k', compute)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=request) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 3
+    assert cache._inflight == {}
+
+
+def test_stale_entry_is_served_while_refreshed(redis_client):
+    cache = RecommendationCache(redis_client)
+    redis_client.set('k', orjson.dumps({'fresh_until': time.time() - 1, 'value': {'items': ['old']}}))
+    refreshed = threading.Event()
+
+    def compute():
+        refreshed.set()
+        return {'items': ['new']}
+
+    assert cache.get_or_compute('k', compute) == {'items': ['old']}
+    assert refreshed.wait(1)
+    deadline = time.time() + 1
+    while cache.get_or_compute('k', compute) != {'items': ['new']}:
+        assert time.time() < deadline
+        time.sleep(0.01)
+    assert cache.stats()['stale_hits'] >= 1
+
+
+def test_redis_failure_computes_without_waiting(redis_client):
+    cache = RecommendationCache(redis_client)
+
+    def down(*args, **kwargs):
+        raise ConnectionError('down')
+
+    redis_client.get = redis_client.set = redis_client.setex = down
+    began = time.perf_counter()
+    assert cache.get_or_compute('k', lambda: {'items': [3]}) == {'items': [3]}
+    assert time.perf_counter() - began < 0.5
+
+
+def test_miss_waits_for_another_process(redis_client):
+    cache = RecommendationCache(redis_client)
+    redis_client.set('lock:k', 'other-process')
+
+    def fill():
+        time.sleep(0.1)
+        redis_client.set('k', orjson.dumps({'fresh_until': time.time() + 60, 'value': {'items': ['theirs']}}))
+
+    threading.Thread(target=fill).start()
+    assert cache.get_or_compute('k', lambda: {'items': ['ours']}) == {'items': ['theirs']}
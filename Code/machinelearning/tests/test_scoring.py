@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from scoring import HISTORY_WEIGHT, blend_history, select_top_k
+
+
+def sorted_top_k(scores, k, min_score):
+    """Reference: stable descending sort of the items at or above min_score"""
+    order = sorted(range(len(scores)), key=lambda row: scores[row], reverse=True)
+    return [row for row in order if scores[row] >= min_score][:k]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_select_top_k_matches_sort(seed):
+    rng = np.random.default_rng(seed)
+    # Rounded so that ties are common
+    scores = np.round(rng.random(rng.integers(1, 300)), 2)
+    for k in (1, 5, 10, len(scores), len(scores) + 5):
+        for min_score in (0.0, 0.3, 0.99, 1.5):
+            assert select_top_k(scores, k, min_score).tolist() == sorted_top_k(scores, k, min_score)
+
+
+def test_select_top_k_keeps_menu_order_for_ties():
+    scores = np.array([0.5, 0.9, 0.5, 0.9, 0.5])
+    assert select_top_k(scores, 3, 0.1).tolist() == [1, 3, 0]
+
+
+def test_select_top_k_empty():
+    assert select_top_k(np.array([]), 5, 0.1).tolist() == []
+    assert select_top_k(np.array([0.05, 0.01]), 5, 0.1).tolist() == []
+
+
+def test_blend_history_matches_per_item_blend():
+    rng = np.random.default_rng(0)
+    text = rng.random(200)
+    history = rng.random(200)
+    history[rng.random(200) < 0.3] = np.nan
+
+    expected = [
+        t if np.isnan(h) else (1 - HISTORY_WEIGHT) * t + HISTORY_WEIGHT * h
+        for t, h in zip(text, history)
+    ]
+    np.testing.assert_allclose(blend_history(text, history), expected)
+
+
+def test_blend_history_cold_start_keeps_text_scores():
+    text = np.array([0.2, 0.4])
+    assert blend_history(text, None) is text
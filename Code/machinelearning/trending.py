@@ -0,0 +1,416 @@
+"""Trending menu items over a sliding window of order and feedback events.
+
+Events are counted in Count-Min sketches, one per BUCKET_SECONDS time
+bucket, and the window is the running sum of the last WINDOW_BUCKETS
+buckets. Keys combine a scope (all items, one restaurant or one region)
+with an item id, so every scope shares the same fixed-size sketches.
+Each scope keeps its HEAVY_HITTERS best estimated items, which is all
+/trending reads: memory is bounded by the sketch size and the number of
+scopes, and answering does not depend on the event volume.
+
+Every worker listens to the orders and feedback collections and builds
+the same state. The listeners are moved to the start of every new bucket,
+so they hold at most about two buckets of documents. The state is snapshotted to a local file and restored on
+start, after which only events newer than the snapshot are read back.
+"""
+import hashlib
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ORDERS_COLLECTION = 'orders'
+FEEDBACK_COLLECTION = 'feedback'
+TIME_FIELD = 'timestamp'  # ISO 8601 string or Firestore timestamp on orders and feedback
+BUCKET_SECONDS = 300  # 5 minutes
+WINDOW_BUCKETS = 12  # trending over the last hour
+SKETCH_WIDTH = 16384  # counters per row, estimates exceed the true count by at most e / width of the window total
+SKETCH_DEPTH = 4
+HEAVY_HITTERS = 50  # items tracked per scope
+MAX_SCOPES = 10000  # restaurants and regions with their own heavy hitters
+SNAPSHOT_INTERVAL = 60  # seconds between snapshots
+SNAPSHOT_PATH = 'trending_snapshot.npz'
+ORDER_WEIGHT = 1.0  # per ordered unit
+FEEDBACK_WEIGHT = 0.5
+GLOBAL_SCOPE = 'all'
+
+
+def sketch_columns(key: str, width: int, depth: int) -> np.ndarray:
+    """Column of key in every sketch row, the same in every process"""
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], 'little')
+    h2 = int.from_bytes(digest[8:], 'little') | 1
+    return np.array([(h1 + row * h2) % width for row in range(depth)], dtype=np.int64)
+
+
+def scope_key(restaurant_id: Optional[str] = None, region: Optional[str] = None) -> str:
+    if restaurant_id:
+        return f"restaurant:{restaurant_id}"
+    if region:
+        return f"region:{region}"
+    return GLOBAL_SCOPE
+
+
+def event_time(document: Dict) -> float:
+    """Seconds since the epoch at which an order or feedback happened"""
+    value = document.get(TIME_FIELD)
+    try:
+        if isinstance(value, str):
+            return datetime.fromisoformat(value).timestamp()
+        if value is not None:
+            return value.timestamp()
+    except (AttributeError, ValueError):
+        pass
+    return time.time()
+
+
+class HeavyHitters:
+    """The items of one scope with the highest estimated counts.
+
+    A min-heap with lazy deletion finds the entry to evict: every
+    update pushes a new entry and outdated ones are skipped when popped.
+    """
+
+    def __init__(self, capacity: int = HEAVY_HITTERS):
+        self.capacity = capacity
+        self.estimates: Dict[str, float] = {}
+        self.columns: Dict[str, np.ndarray] = {}
+        self._heap: List[Tuple[float, str]] = []
+
+    def offer(self, item_id: str, estimate: float, columns: np.ndarray):
+        if item_id not in self.estimates and len(self.estimates) >= self.capacity:
+            lowest, lowest_item = self._min()
+            if estimate <= lowest:
+                return
+            heapq.heappop(self._heap)
+            del self.estimates[lowest_item]
+            del self.columns[lowest_item]
+        self.estimates[item_id] = estimate
+        self.columns[item_id] = columns
+        heapq.heappush(self._heap, (estimate, item_id))
+        if len(self._heap) > 4 * self.capacity:
+            self._rebuild()
+
+    def refresh(self, window: np.ndarray, rows: np.ndarray):
+        """Re-estimate every item after buckets left the window"""
+        if not self.estimates:
+            return
+        item_ids = list(self.estimates)
+        columns = np.stack([self.columns[item_id] for item_id in item_ids], axis=1)
+        estimates = window[rows[:, None], columns].min(axis=0)
+        for item_id, estimate in zip(item_ids, estimates):
+            if estimate > 0:
+                self.estimates[item_id] = float(estimate)
+            else:
+                del self.estimates[item_id]
+                del self.columns[item_id]
+        self._rebuild()
+
+    def top(self, n: Optional[int] = None) -> List[Tuple[str, float]]:
+        ranked = sorted(self.estimates.items(), key=lambda entry: (-entry[1], entry[0]))
+        return ranked if n is None else ranked[:n]
+
+    def _min(self) -> Tuple[float, str]:
+        while True:
+            estimate, item_id = self._heap[0]
+            if self.estimates.get(item_id) == estimate:
+                return estimate, item_id
+            heapq.heappop(self._heap)
+
+    def _rebuild(self):
+        self._heap = [(estimate, item_id) for item_id, estimate in self.estimates.items()]
+        heapq.heapify(self._heap)
+
+
+class TrendingSketch:
+    """Sliding-window Count-Min sketch with heavy hitters per scope"""
+
+    def __init__(
+        self,
+        width: int = SKETCH_WIDTH,
+        depth: int = SKETCH_DEPTH,
+        bucket_seconds: float = BUCKET_SECONDS,
+        window_buckets: int = WINDOW_BUCKETS,
+        heavy_hitters: int = HEAVY_HITTERS,
+        max_scopes: int = MAX_SCOPES
+    ):
+        self.width = width
+        self.depth = depth
+        self.bucket_seconds = bucket_seconds
+        self.window_buckets = window_buckets
+        self.heavy_hitters = heavy_hitters
+        self.max_scopes = max_scopes
+        # Weights are multiples of 0.5, which float32 adds and subtracts exactly
+        self.buckets = np.zeros((window_buckets, depth, width), dtype=np.float32)
+        self.window = np.zeros((depth, width), dtype=np.float32)
+        self.bucket_epochs = np.full(window_buckets, -1, dtype=np.int64)
+        self.epoch = -1  # newest bucket in the window
+        self.scopes: Dict[str, HeavyHitters] = {}
+        self._rows = np.arange(depth)
+        self._lock = threading.Lock()
+
+    @property
+    def window_seconds(self) -> float:
+        return self.bucket_seconds * self.window_buckets
+
+    def add(self, item_id: str, scopes: List[str], weight: float, at: float) -> bool:
+        """Count an event of item_id in every scope, False if it is older than the window"""
+        epoch = int(at // self.bucket_seconds)
+        with self._lock:
+            self._advance(epoch)
+            if epoch <= self.epoch - self.window_buckets:
+                return False
+            slot = epoch % self.window_buckets
+            for scope in scopes:
+                columns = sketch_columns(f"{scope}\x1f{item_id}", self.width, self.depth)
+                self.buckets[slot, self._rows, columns] += weight
+                self.window[self._rows, columns] += weight
+                hitters = self.scopes.get(scope)
+                if hitters is None:
+                    if len(self.scopes) >= self.max_scopes:
+                        continue
+                    hitters = self.scopes[scope] = HeavyHitters(self.heavy_hitters)
+                hitters.offer(item_id, float(self.window[self._rows, columns].min()), columns)
+            return True
+
+    def top(self, scope: str, n: Optional[int] = None, now: Optional[float] = None) -> List[Tuple[str, float]]:
+        """Best (item id, estimated count) pairs of a scope over the window ending now"""
+        with self._lock:
+            self._advance(int((now or time.time()) // self.bucket_seconds))
+            hitters = self.scopes.get(scope)
+            return hitters.top(n) if hitters is not None else []
+
+    def _advance(self, epoch: int):
+        """Move the window forward so that it ends with bucket epoch.
+
+        Must be called with self._lock held.
+        """
+        if epoch <= self.epoch:
+            return
+        if self.epoch < 0 or epoch - self.epoch >= self.window_buckets:
+            self.buckets[:] = 0
+            self.window[:] = 0
+            for past in range(epoch - self.window_buckets + 1, epoch + 1):
+                self.bucket_epochs[past % self.window_buckets] = past
+        else:
+            for past in range(self.epoch + 1, epoch + 1):
+                slot = past % self.window_buckets
+                self.window -= self.buckets[slot]
+                self.buckets[slot] = 0
+                self.bucket_epochs[slot] = past
+        self.epoch = epoch
+        for hitters in self.scopes.values():
+            hitters.refresh(self.window, self._rows)
+
+    def state(self) -> Dict[str, np.ndarray]:
+        """Arrays to snapshot, see restore"""
+        with self._lock:
+            return {
+                'buckets': self.buckets.copy(),
+                'bucket_epochs': self.bucket_epochs.copy(),
+                'epoch': np.array(self.epoch),
+                'bucket_seconds': np.array(self.bucket_seconds),
+                'scopes': np.array(json.dumps({scope: hitters.estimates for scope, hitters in self.scopes.items()}))
+            }
+
+    def restore(self, state: Dict[str, np.ndarray]) -> bool:
+        """Load a snapshot taken with the same sketch dimensions"""
+        if state['buckets'].shape != self.buckets.shape or float(state['bucket_seconds']) != self.bucket_seconds:
+            logger.error("Trending snapshot has different sketch dimensions, starting empty")
+            return False
+        with self._lock:
+            self.buckets[:] = state['buckets']
+            self.window[:] = self.buckets.sum(axis=0)
+            self.bucket_epochs[:] = state['bucket_epochs']
+            self.epoch = int(state['epoch'])
+            self.scopes = {}
+            for scope, estimates in json.loads(str(state['scopes'])).items():
+                hitters = self.scopes[scope] = HeavyHitters(self.heavy_hitters)
+                for item_id, estimate in estimates.items():
+                    hitters.offer(item_id, estimate, sketch_columns(f"{scope}\x1f{item_id}", self.width, self.depth))
+        return True
+
+
+class TrendingService:
+    """Feeds a TrendingSketch from Firestore listeners and snapshots it to a file"""
+
+    def __init__(
+        self,
+        db,
+        menu_catalog,
+        sketch: Optional[TrendingSketch] = None,
+        snapshot_path: str = SNAPSHOT_PATH,
+        snapshot_interval: float = SNAPSHOT_INTERVAL
+    ):
+        self.db = db
+        self.menu_catalog = menu_catalog
+        self.sketch = sketch or TrendingSketch()
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._watches = []
+        # Start of the range the listeners read, and the documents counted from it on
+        self._anchor = 0.0
+        self._seen: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._counts = {'events': 0, 'expired': 0, 'snapshots': 0, 'listens': 0}
+
+    def start(self):
+        """Restore the last snapshot and listen for newer orders and feedback"""
+        self.listen(self.restore() or time.time() - self.sketch.window_seconds)
+        threading.Thread(target=self._run, name='trending-snapshot', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self._lock:
+            watches, self._watches = self._watches, []
+        self._unsubscribe(watches)
+        self.snapshot()
+
+    def listen(self, since: float):
+        """Listen for orders and feedback from since on, replacing the current listeners.
+
+        A listener keeps every document it matched in memory, so _run moves
+        the listeners to the start of the newest bucket. Documents that both
+        the old and the new listeners deliver are counted once, by id.
+        """
+        # Range filters only match values of their own type, and TIME_FIELD
+        # holds Firestore timestamps or ISO 8601 strings
+        bounds = (datetime.fromtimestamp(since, tz=timezone.utc), datetime.fromtimestamp(since).isoformat())
+        watches = []
+        for collection, handler in ((ORDERS_COLLECTION, self.record_order), (FEEDBACK_COLLECTION, self.record_feedback)):
+            for bound in bounds:
+                try:
+                    query = self.db.collection(collection).where(TIME_FIELD, '>=', bound)
+                    watches.append(query.on_snapshot(partial(self._on_snapshot, collection, handler)))
+                except Exception as e:
+                    logger.error(f"Error starting trending listener on {collection}: {str(e)}")
+
+        with self._lock:
+            previous, self._watches = self._watches, watches
+            self._anchor = since
+            # The new listeners never deliver documents from before since
+            self._seen = {key: at for key, at in self._seen.items() if at >= since}
+            self._counts['listens'] += 1
+        self._unsubscribe(previous)
+
+    def _unsubscribe(self, watches: List):
+        for watch in watches:
+            try:
+                watch.unsubscribe()
+            except Exception as e:
+                logger.error(f"Error stopping trending listener: {str(e)}")
+
+    def record_order(self, order: Dict):
+        at = event_time(order)
+        for line in order.get('items', []):
+            self.record(
+                line.get('item_id'), at, ORDER_WEIGHT * (line.get('quantity') or 1),
+                order.get('restaurant_id'), order.get('region')
+            )
+
+    def record_feedback(self, feedback: Dict):
+        self.record(feedback.get('item_id'), event_time(feedback), FEEDBACK_WEIGHT, region=feedback.get('region'))
+
+    def record(
+        self,
+        item_id: Optional[str],
+        at: float,
+        weight: float,
+        restaurant_id: Optional[str] = None,
+        region: Optional[str] = None
+    ):
+        if not item_id:
+            return
+        snapshot = self.menu_catalog.snapshot
+        row = snapshot.row_of.get(item_id)
+        if row is not None:
+            restaurant_id = snapshot.columns['restaurant_id'][row] or restaurant_id
+            region = region or (snapshot.extras[row] or {}).get('region')
+
+        scopes = [GLOBAL_SCOPE]
+        if restaurant_id:
+            scopes.append(scope_key(restaurant_id=restaurant_id))
+        if region:
+            scopes.append(scope_key(region=region))
+        counted = self.sketch.add(item_id, scopes, weight, at)
+        self._counts['events' if counted else 'expired'] += 1
+
+    def top(
+        self,
+        restaurant_id: Optional[str] = None,
+        region: Optional[str] = None,
+        n: Optional[int] = None
+    ) -> List[Tuple[str, float]]:
+        """Trending (item id, estimated count) pairs, best first"""
+        return self.sketch.top(scope_key(restaurant_id, region), n)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            listening = dict(listening_since=datetime.fromtimestamp(self._anchor).isoformat(), listened_documents=len(self._seen))
+        return dict(self._counts, scopes=len(self.sketch.scopes), window_seconds=self.sketch.window_seconds, **listening)
+
+    def snapshot(self):
+        """Write the sketch to snapshot_path, replacing the previous snapshot atomically"""
+        state = self.sketch.state()
+        state['saved_at'] = np.array(time.time())
+        directory = os.path.dirname(os.path.abspath(self.snapshot_path))
+        os.makedirs(directory, exist_ok=True)
+        temporary = os.path.join(directory, f".{os.path.basename(self.snapshot_path)}-{os.getpid()}.npz")
+        np.savez_compressed(temporary, **state)
+        os.replace(temporary, self.snapshot_path)
+        self._counts['snapshots'] += 1
+
+    def restore(self) -> Optional[float]:
+        """Load the snapshot if there is one, returns when it was saved"""
+        try:
+            with np.load(self.snapshot_path, allow_pickle=False) as state:
+                if self.sketch.restore(dict(state)):
+                    saved_at = float(state['saved_at'])
+                    logger.info(f"Restored trending snapshot from {datetime.fromtimestamp(saved_at).isoformat()}")
+                    return saved_at
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Error restoring trending snapshot: {str(e)}")
+        return None
+
+    def _on_snapshot(self, collection: str, handler: Callable[[Dict], None], collection_snapshot, changes, read_time):
+        for change in changes:
+            # Updates of an order, e.g. its status, are not new events
+            if change.type.name != 'ADDED':
+                continue
+            # One malformed document must not drop the rest of the batch
+            try:
+                document = change.document.to_dict()
+                key = f"{collection}/{change.document.id}"
+                with self._lock:
+                    if key in self._seen:
+                        continue
+                    self._seen[key] = event_time(document)
+                handler(document)
+            except Exception as e:
+                logger.error(f"Error recording trending event {collection}/{change.document.id}: {str(e)}")
+
+    def _run(self):
+        while not self._stop.wait(self.snapshot_interval):
+            try:
+                self.snapshot()
+            except Exception as e:
+                logger.error(f"Error writing trending snapshot: {str(e)}")
+            try:
+                bucket_start = time.time() // self.sketch.bucket_seconds * self.sketch.bucket_seconds
+                if bucket_start > self._anchor:
+                    self.listen(bucket_start)
+            except Exception as e:
+                logger.error(f"Error moving trending listeners: {str(e)}")